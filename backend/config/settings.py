@@ -126,6 +126,11 @@ LOGGING = {
             "level": "INFO",
             "propagate": False,
         },
+        "meshcore.broker": {
+            "handlers": ["console"],
+            "level": "INFO",
+            "propagate": False,
+        },
         "django": {
             "handlers": ["console"],
             "level": "INFO",
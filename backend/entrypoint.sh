@@ -7,8 +7,10 @@ python manage.py migrate --noinput
 # Collect static files for admin and app
 python manage.py collectstatic --noinput
 
-# Start gunicorn
+# Start gunicorn (threaded workers so long-lived /v1/stream/ connections do not block requests)
 exec gunicorn config.wsgi:application \
   --bind 0.0.0.0:${BACKEND_PORT:-8000} \
   --workers 3 \
+  --worker-class gthread \
+  --threads ${GUNICORN_THREADS:-16} \
   --timeout 120
@@ -0,0 +1,339 @@
+"""Durable queue and worker pool for automation actions.
+
+Automations used to run inside the ``post_save`` of every incoming message, so
+an autoresponse (a CLI subprocess with up to 15s timeout) or an MQTT connect
+stalled the PTY reader or the collector that stored the message. Ingest now
+only matches the rules and inserts the rendered actions as
+``AutomationAction`` rows; :class:`ActionWorkerPool` runs them.
+
+- Workers claim due rows with a conditional ``UPDATE`` (``SKIP LOCKED`` where
+  the database has it), so several pools (collector, standalone command) can
+  share the queue.
+- Each attempt runs under a timeout of ``AUTOMATION_ACTION_TIMEOUT_S``. Failures
+  retry with exponential backoff from ``AUTOMATION_RETRY_BASE_S`` up to
+  ``AUTOMATION_MAX_ATTEMPTS`` attempts; an airtime deferral is retried when the
+  budget allows, without using up an attempt.
+- A timed-out autoresponse is not retried, since the abandoned call may still
+  transmit: the row fails at once and gets the real outcome (``done`` with its
+  result, or the error) when that call returns.
+- A row whose worker died is picked up again once its lock expires.
+- Finished rows are purged after ``AUTOMATION_ACTION_RETENTION_DAYS``.
+"""
+import itertools
+import os
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .airtime import AirtimeDeferred
+from .coordination import holder_id
+from .models import AutomationAction, AutomationRule
+
+
+# Extra lock time beyond the action timeout before another worker may take over
+_LOCK_GRACE_S = 30.0
+# Actions that must not run again after a timeout (the radio may already have sent)
+_NO_RETRY_AFTER_TIMEOUT = {AutomationRule.ACTION_AUTORESPONSE}
+_PURGE_EVERY_S = 3600.0
+
+# Set when this process enqueues, so a local pool starts without waiting out its poll
+_wake = threading.Event()
+_claim_seq = itertools.count()
+
+
+def _env_float(key: str, default: float) -> float:
+    try:
+        return float(os.getenv(key, str(default)))
+    except Exception:
+        return default
+
+
+def action_timeout_s() -> float:
+    return max(1.0, _env_float("AUTOMATION_ACTION_TIMEOUT_S", 30.0))
+
+
+def max_attempts() -> int:
+    return max(1, int(_env_float("AUTOMATION_MAX_ATTEMPTS", 5)))
+
+
+def retry_delay_s(attempts: int) -> float:
+    """Backoff after the `attempts`-th failed attempt."""
+    base = max(1.0, _env_float("AUTOMATION_RETRY_BASE_S", 10.0))
+    return min(base * (2 ** max(0, attempts - 1)), 3600.0)
+
+
+def new_action(rule: AutomationRule, params: Dict[str, Any]) -> AutomationAction:
+    """Build (not save) a queue row for a matched rule."""
+    return AutomationAction(
+        rule_id=rule.id,
+        rule_name=rule.name,
+        action_type=rule.action_type,
+        params=params,
+        max_attempts=max_attempts(),
+        timeout_s=action_timeout_s(),
+    )
+
+
+def enqueue_actions(actions: List[AutomationAction]) -> None:
+    """Insert actions in one statement and wake this process's workers."""
+    AutomationAction.objects.bulk_create(actions)
+    _wake.set()
+
+
+def claim_actions(limit: int = 1, worker: Optional[str] = None) -> List[AutomationAction]:
+    """Lock up to `limit` due actions for this worker and count the attempt."""
+    token = f"{worker or holder_id()}#{next(_claim_seq)}"[:128]
+    now = timezone.now()
+    due = (
+        Q(status=AutomationAction.STATUS_PENDING, run_after__lte=now)
+        | Q(status=AutomationAction.STATUS_RUNNING, locked_until__lt=now)
+    )
+    with transaction.atomic():
+        qs = AutomationAction.objects.filter(due).order_by("run_after", "id")
+        if connection.features.has_select_for_update_skip_locked:
+            qs = qs.select_for_update(skip_locked=True)
+        ids = list(qs.values_list("id", flat=True)[: max(1, limit)])
+        if not ids:
+            return []
+        # The status filter is repeated so a concurrent claimer without row locks cannot win twice
+        AutomationAction.objects.filter(id__in=ids).filter(due).update(
+            status=AutomationAction.STATUS_RUNNING,
+            locked_by=token,
+            attempts=F("attempts") + 1,
+            # Generous upper bound; the worker knows each row's own timeout
+            locked_until=now + timedelta(seconds=action_timeout_s() + _LOCK_GRACE_S),
+        )
+    return list(AutomationAction.objects.filter(id__in=ids, locked_by=token, status=AutomationAction.STATUS_RUNNING))
+
+
+def _call_with_timeout(
+    fn: Callable[[], Any], timeout_s: float,
+    on_late: Optional[Callable[[Any, Optional[BaseException]], None]] = None,
+) -> Any:
+    """Run `fn` on a helper thread; raise TimeoutError if it takes longer than `timeout_s`.
+
+    A timed-out call is abandoned, not killed: the underlying CLI and MQTT
+    calls have their own timeouts, so the helper thread ends on its own and
+    then passes its (result, error) to `on_late`.
+    """
+    box: Dict[str, Any] = {}
+    lock = threading.Lock()
+
+    def target() -> None:
+        try:
+            box["result"] = fn()
+        except BaseException as e:
+            box["error"] = e
+        with lock:
+            box["done"] = True
+            late = box.get("abandoned", False)
+        try:
+            if late and on_late is not None:
+                on_late(box.get("result"), box.get("error"))
+        finally:
+            close_old_connections()
+
+    t = threading.Thread(target=target, name="automation-action", daemon=True)
+    t.start()
+    t.join(timeout_s)
+    with lock:
+        if not box.get("done"):
+            box["abandoned"] = True
+            raise TimeoutError(f"action timed out after {timeout_s:.0f}s")
+    if "error" in box:
+        raise box["error"]
+    return box.get("result")
+
+
+def execute_action(action: AutomationAction) -> bool:
+    """Run one claimed action and record the outcome; True if it succeeded."""
+    from .services import run_automation_action
+
+    now = timezone.now()
+    mine = AutomationAction.objects.filter(id=action.id, locked_by=action.locked_by)
+    timeout = action.timeout_s
+    if action.locked_until is not None:
+        # Never outlive the lock, or another worker could run the action again
+        timeout = min(timeout, max(1.0, (action.locked_until - now).total_seconds() - _LOCK_GRACE_S))
+    no_retry = action.action_type in _NO_RETRY_AFTER_TIMEOUT
+
+    def record_late(result: Any, error: Optional[BaseException]) -> None:
+        # The row is still ours, or already failed for the timeout; either order works
+        late = AutomationAction.objects.filter(id=action.id).filter(
+            Q(locked_by=action.locked_by) | Q(status=AutomationAction.STATUS_FAILED, locked_by=""),
+        )
+        done = dict(locked_by="", locked_until=None, finished_at=timezone.now())
+        if error is None:
+            late.update(status=AutomationAction.STATUS_DONE, result=result, **done)
+        else:
+            late.update(status=AutomationAction.STATUS_FAILED, last_error=f"timed out, then failed: {error}", **done)
+
+    try:
+        result = _call_with_timeout(
+            lambda: run_automation_action(action.action_type, action.params or {}), timeout,
+            on_late=record_late if no_retry else None,
+        )
+    except AirtimeDeferred as e:
+        # Not the action's fault: wait for the budget and give the attempt back
+        mine.update(
+            status=AutomationAction.STATUS_PENDING,
+            attempts=F("attempts") - 1,
+            run_after=now + timedelta(seconds=max(1.0, e.retry_after_s)),
+            locked_by="",
+            locked_until=None,
+            last_error=str(e),
+        )
+        return False
+    except TimeoutError as e:
+        if not no_retry:
+            return _failed(mine, action, e, now)
+        # The call may still transmit; running it again could send the message twice
+        mine.update(
+            status=AutomationAction.STATUS_FAILED,
+            locked_by="",
+            locked_until=None,
+            last_error=f"{e}; not retried, the message may still be sent",
+            finished_at=now,
+        )
+        return False
+    except Exception as e:
+        return _failed(mine, action, e, now)
+    mine.update(
+        status=AutomationAction.STATUS_DONE,
+        locked_by="",
+        locked_until=None,
+        result=result,
+        finished_at=timezone.now(),
+    )
+    return True
+
+
+def _failed(mine, action: AutomationAction, e: BaseException, now) -> bool:
+    """Record a failed attempt: retry later, or fail for good after the last attempt."""
+    if action.attempts >= action.max_attempts:
+        mine.update(
+            status=AutomationAction.STATUS_FAILED,
+            locked_by="",
+            locked_until=None,
+            last_error=str(e),
+            finished_at=now,
+        )
+    else:
+        mine.update(
+            status=AutomationAction.STATUS_PENDING,
+            run_after=now + timedelta(seconds=retry_delay_s(action.attempts)),
+            locked_by="",
+            locked_until=None,
+            last_error=str(e),
+        )
+    return False
+
+
+def purge_finished_actions(retention_days: Optional[float] = None) -> int:
+    """Delete done/failed actions older than the retention; returns the row count."""
+    days = _env_float("AUTOMATION_ACTION_RETENTION_DAYS", 7.0) if retention_days is None else retention_days
+    if days <= 0:
+        return 0
+    cutoff = timezone.now() - timedelta(days=days)
+    deleted, _ = AutomationAction.objects.filter(
+        status__in=[AutomationAction.STATUS_DONE, AutomationAction.STATUS_FAILED], finished_at__lt=cutoff,
+    ).delete()
+    return deleted
+
+
+def queue_stats() -> Dict[str, Any]:
+    """Row counts per status and the age of the oldest due action."""
+    counts = {s: 0 for s, _label in AutomationAction.STATUS_CHOICES}
+    for row in AutomationAction.objects.values("status").order_by().annotate(n=Count("id")):
+        counts[row["status"]] = row["n"]
+    oldest = (
+        AutomationAction.objects.filter(status=AutomationAction.STATUS_PENDING, run_after__lte=timezone.now())
+        .order_by("run_after").values_list("run_after", flat=True).first()
+    )
+    return {
+        **counts,
+        "oldest_due_s": round((timezone.now() - oldest).total_seconds(), 1) if oldest else 0.0,
+    }
+
+
+class ActionWorkerPool:
+    """Threads that claim and run queued automation actions."""
+
+    def __init__(
+        self,
+        *,
+        workers: int = 2,
+        poll_s: float = 2.0,
+        log: Optional[Callable[[str], None]] = None,
+    ) -> None:
+        self.workers = max(1, int(workers))
+        self.poll_s = max(0.1, float(poll_s))
+        self._log = log or (lambda msg: None)
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        self.stats = {"ok": 0, "errors": 0, "purged": 0}
+
+    def start(self) -> None:
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"automation-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def run_forever(self) -> None:
+        self.start()
+        try:
+            while not self._stop.wait(1.0):
+                pass
+        finally:
+            self.stop()
+
+    def stop(self) -> None:
+        self._stop.set()
+        _wake.set()
+
+    def run_pending(self) -> int:
+        """Run due actions on the calling thread until none are left; returns how many ran."""
+        ran = 0
+        while not self._stop.is_set():
+            batch = claim_actions(limit=1)
+            if not batch:
+                break
+            for action in batch:
+                self._run(action)
+                ran += 1
+        return ran
+
+    def _run(self, action: AutomationAction) -> None:
+        ok = execute_action(action)
+        with self._lock:
+            self.stats["ok" if ok else "errors"] += 1
+        if not ok:
+            self._log(f"automation action #{action.id} ({action.rule_name}) attempt {action.attempts} failed")
+
+    def _maybe_purge(self) -> None:
+        with self._lock:
+            if time.monotonic() - self._last_purge < _PURGE_EVERY_S:
+                return
+            self._last_purge = time.monotonic()
+        purged = purge_finished_actions()
+        with self._lock:
+            self.stats["purged"] += purged
+
+    def _worker(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._maybe_purge()
+                self.run_pending()
+            except Exception as e:
+                self._log(f"automation worker error: {e}")
+            finally:
+                close_old_connections()
+            if _wake.wait(self.poll_s):
+                _wake.clear()
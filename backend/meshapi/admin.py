@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Contact, ContactTelemetry, Message, CollectorConfig, NodeInfo, AutomationRule
+from .models import AirtimeBudget, Contact, ContactLatest, ContactTelemetry, ContactTelemetryRollup, Message, CollectorConfig, CollectorTask, NodeInfo, NodeInfoHistory, NodeTelemetry, AutomationRule, AutomationAction
 
 
 @admin.register(Contact)
@@ -25,6 +25,21 @@ class ContactTelemetryAdmin(admin.ModelAdmin):
     ordering = ("-fetched_at",)
 
 
+@admin.register(ContactLatest)
+class ContactLatestAdmin(admin.ModelAdmin):
+    list_display = ("contact", "adv_name", "rssi", "snr", "battery_percent", "fetched_at")
+    search_fields = ("contact__name", "contact__public_key", "adv_name")
+    ordering = ("-fetched_at",)
+
+
+@admin.register(ContactTelemetryRollup)
+class ContactTelemetryRollupAdmin(admin.ModelAdmin):
+    list_display = ("contact", "bucket", "bucket_start", "samples", "rssi_min", "rssi_max", "battery_percent_min")
+    search_fields = ("contact__name", "contact__public_key")
+    list_filter = ("bucket",)
+    ordering = ("-bucket_start",)
+
+
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
     list_display = ("ts", "direction", "name", "public_key", "short_text")
@@ -43,9 +58,32 @@ class CollectorConfigAdmin(admin.ModelAdmin):
     list_display = ("interval_seconds", "updated_at")
 
 
+@admin.register(CollectorTask)
+class CollectorTaskAdmin(admin.ModelAdmin):
+    list_display = ("target", "command", "next_due", "last_run_at", "last_ok", "failures")
+    search_fields = ("target",)
+    list_filter = ("command", "last_ok")
+    ordering = ("next_due",)
+
+
 @admin.register(NodeInfo)
 class NodeInfoAdmin(admin.ModelAdmin):
-    list_display = ("name", "fetched_at")
+    list_display = ("name", "fetched_at", "changed_at")
+    search_fields = ("name",)
+    list_filter = ("fetched_at",)
+    ordering = ("-fetched_at",)
+
+
+@admin.register(NodeInfoHistory)
+class NodeInfoHistoryAdmin(admin.ModelAdmin):
+    list_display = ("name", "content_hash", "fetched_at")
+    search_fields = ("name", "content_hash")
+    ordering = ("-fetched_at",)
+
+
+@admin.register(NodeTelemetry)
+class NodeTelemetryAdmin(admin.ModelAdmin):
+    list_display = ("name", "fetched_at", "battery_mv", "battery_percent", "temperature_c", "uptime_s")
     search_fields = ("name",)
     list_filter = ("fetched_at",)
     ordering = ("-fetched_at",)
@@ -57,3 +95,16 @@ class AutomationRuleAdmin(admin.ModelAdmin):
     search_fields = ("name", "pattern", "description")
     list_filter = ("enabled", "match_type", "action_type")
     ordering = ("-enabled", "-priority", "name")
+
+
+@admin.register(AutomationAction)
+class AutomationActionAdmin(admin.ModelAdmin):
+    list_display = ("id", "rule_name", "action_type", "status", "attempts", "run_after", "created_at", "finished_at")
+    search_fields = ("rule_name", "last_error")
+    list_filter = ("status", "action_type")
+    ordering = ("-id",)
+
+
+@admin.register(AirtimeBudget)
+class AirtimeBudgetAdmin(admin.ModelAdmin):
+    list_display = ("key", "tokens_s", "updated_at", "spent_s", "sent", "deferred")
@@ -0,0 +1,244 @@
+"""Transmit airtime budget shared by every process that talks to the radio.
+
+Commands that make the node transmit (messages, status/telemetry requests,
+adverts) are estimated with the LoRa time-on-air formula, using the radio
+settings (``radio_sf``, ``radio_bw``, ``radio_cr``) of the newest ``NodeInfo``.
+Each one is charged against a token bucket kept in the ``AirtimeBudget`` table.
+The bucket refills at ``AIRTIME_DUTY_CYCLE`` seconds of airtime per second and
+holds at most one ``AIRTIME_WINDOW_S`` window's worth. It is off unless
+``AIRTIME_DUTY_CYCLE`` is set (``0.01`` matches the EU 868 MHz 1% limit).
+
+Lower priorities have to leave a reserve in the bucket. Collector polling is
+deferred first, then UI refreshes; interactive sends may use the bucket down to
+empty. A refused command raises :class:`AirtimeDeferred`, which tells the
+caller when to retry. Local commands (``contacts``, ``infos``, ...) are free.
+"""
+import math
+import os
+import shlex
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from .dispatch import PRIORITY_COLLECTOR, PRIORITY_INTERACTIVE, PRIORITY_NAMES, PRIORITY_UI, current_priority
+from .models import AirtimeBudget, NodeInfo
+
+
+BUCKET_KEY = "tx"
+
+# Share of the bucket that must remain after charging, per priority
+RESERVE = {
+    PRIORITY_INTERACTIVE: 0.0,
+    PRIORITY_UI: 0.1,
+    PRIORITY_COLLECTOR: 0.3,
+}
+
+# Rough on-air sizes in bytes: routing header, hashes, MAC and timestamp of a
+# MeshCore packet; encrypted payloads are padded to the AES block size
+_PACKET_OVERHEAD = 24
+_CIPHER_BLOCK = 16
+_ADVERT_BYTES = 110
+_REQUEST_COMMANDS = {"req_status", "req_bstatus", "req_telemetry", "req_acl", "req_neighbours", "req_mma", "login", "cmd"}
+_MESSAGE_COMMANDS = {"msg", "send", "sendto", "public", "chan"}
+_ADVERT_COMMANDS = {"advert", "floodadv"}
+
+# MeshCore EU defaults, used until a node info with radio settings is stored
+_DEFAULT_RADIO = {"sf": 8, "bw_khz": 62.5, "cr": 8}
+_PREAMBLE_SYMBOLS = 8
+_RADIO_CACHE_S = 60.0
+
+_radio_cache: Tuple[float, Dict[str, Any]] = (0.0, {})
+_radio_lock = threading.Lock()
+
+
+class AirtimeDeferred(RuntimeError):
+    """The airtime budget does not allow this command now."""
+
+    def __init__(self, cost_s: float, retry_after_s: float, priority: int) -> None:
+        name = PRIORITY_NAMES.get(priority, str(priority))
+        super().__init__(f"airtime budget low: {cost_s:.2f}s needed for {name} traffic, retry in {retry_after_s:.0f}s")
+        self.cost_s = cost_s
+        self.retry_after_s = retry_after_s
+        self.priority = priority
+
+
+def duty_cycle() -> float:
+    """Allowed share of time on air; 0 (the default) disables the governor."""
+    try:
+        return max(0.0, min(1.0, float(os.getenv("AIRTIME_DUTY_CYCLE", "0"))))
+    except Exception:
+        return 0.0
+
+
+def window_s() -> float:
+    try:
+        return max(60.0, float(os.getenv("AIRTIME_WINDOW_S", "3600")))
+    except Exception:
+        return 3600.0
+
+
+def capacity_s() -> float:
+    return duty_cycle() * window_s()
+
+
+def time_on_air_s(payload_bytes: int, sf: int, bw_khz: float, cr: int, preamble: int = _PREAMBLE_SYMBOLS) -> float:
+    """LoRa time on air (explicit header, CRC on), per the Semtech SX127x formula.
+
+    `cr` accepts the denominator (5..8 for 4/5..4/8) or the index (1..4).
+    """
+    sf = int(sf)
+    cr_idx = cr - 4 if cr > 4 else cr
+    t_sym = (2 ** sf) / (bw_khz * 1000.0)
+    low_dr = 1 if t_sym > 0.016 else 0
+    t_preamble = (preamble + 4.25) * t_sym
+    n = math.ceil((8 * payload_bytes - 4 * sf + 28 + 16) / (4.0 * (sf - 2 * low_dr)))
+    n_payload = 8 + max(n * (cr_idx + 4), 0)
+    return t_preamble + n_payload * t_sym
+
+
+def radio_params() -> Dict[str, Any]:
+    """Spreading factor, bandwidth and coding rate of the local node (cached)."""
+    global _radio_cache
+    now = time.monotonic()
+    if _radio_cache[1] and now - _radio_cache[0] < _RADIO_CACHE_S:
+        return _radio_cache[1]
+    with _radio_lock:
+        params = dict(_DEFAULT_RADIO, source="default")
+        try:
+            for data in NodeInfo.objects.order_by("-fetched_at").values_list("data", flat=True)[:5]:
+                if isinstance(data, dict) and data.get("radio_sf") and data.get("radio_bw"):
+                    params = {
+                        "sf": int(data["radio_sf"]),
+                        "bw_khz": float(data["radio_bw"]),
+                        "cr": int(data.get("radio_cr") or _DEFAULT_RADIO["cr"]),
+                        "source": "node_info",
+                    }
+                    break
+        except Exception:
+            pass
+        _radio_cache = (now, params)
+        return params
+
+
+def estimate_payload_bytes(command: str) -> int:
+    """On-air bytes a CLI command makes the node send (0 for local commands)."""
+    try:
+        args = shlex.split(command)
+    except ValueError:
+        args = command.split()
+    if not args:
+        return 0
+    op = args[0].lower()
+    if op in _MESSAGE_COMMANDS:
+        text = " ".join(args[2:]) if op not in ("public",) else " ".join(args[1:])
+        body = len(text.encode("utf-8")) + 5  # timestamp and flags
+        return _PACKET_OVERHEAD + _CIPHER_BLOCK * math.ceil(body / _CIPHER_BLOCK)
+    if op in _REQUEST_COMMANDS:
+        return _PACKET_OVERHEAD + _CIPHER_BLOCK
+    if op in _ADVERT_COMMANDS:
+        return _ADVERT_BYTES
+    return 0
+
+
+def estimate_command_s(command: str) -> float:
+    payload = estimate_payload_bytes(command)
+    if payload <= 0:
+        return 0.0
+    r = radio_params()
+    return time_on_air_s(payload, r["sf"], r["bw_khz"], r["cr"])
+
+
+def _refill(row: AirtimeBudget, now, cap: float, rate: float) -> None:
+    elapsed = max(0.0, (now - row.updated_at).total_seconds())
+    row.tokens_s = min(cap, row.tokens_s + elapsed * rate)
+    row.updated_at = now
+
+
+def _decide(tokens: float, cost: float, priority: int, cap: float, rate: float) -> float:
+    """Return 0 if allowed, else seconds until the bucket would allow it."""
+    reserve = RESERVE.get(priority, RESERVE[PRIORITY_COLLECTOR]) * cap
+    need = cost + reserve
+    if tokens >= need:
+        return 0.0
+    if need > cap:
+        # Can never fit under this priority's reserve; let it through once the bucket is full
+        need = cap
+        if tokens >= need:
+            return 0.0
+    return (need - tokens) / rate if rate > 0 else float("inf")
+
+
+def charge(command: str, priority: Optional[int] = None) -> float:
+    """Charge the estimated airtime of `command`; raises AirtimeDeferred when over budget."""
+    cost = estimate_command_s(command)
+    rate = duty_cycle()
+    if cost <= 0 or rate <= 0:
+        return cost
+    priority = current_priority() if priority is None else priority
+    cap = capacity_s()
+    now = timezone.now()
+    with transaction.atomic():
+        AirtimeBudget.objects.bulk_create([AirtimeBudget(key=BUCKET_KEY, tokens_s=cap, updated_at=now)], ignore_conflicts=True)
+        row = AirtimeBudget.objects.select_for_update().get(key=BUCKET_KEY)
+        _refill(row, now, cap, rate)
+        wait = _decide(row.tokens_s, cost, priority, cap, rate)
+        if wait > 0:
+            row.deferred += 1
+            row.save(update_fields=["tokens_s", "updated_at", "deferred"])
+        else:
+            row.tokens_s -= cost
+            row.spent_s += cost
+            row.sent += 1
+            row.save(update_fields=["tokens_s", "updated_at", "spent_s", "sent"])
+    # Raised after the commit so the deferral is counted
+    if wait > 0:
+        raise AirtimeDeferred(cost, wait, priority)
+    return cost
+
+
+def deferral_s(command: str, priority: int) -> float:
+    """Seconds `command` would have to wait at `priority` (0 = send now); does not charge."""
+    cost = estimate_command_s(command)
+    rate = duty_cycle()
+    if cost <= 0 or rate <= 0:
+        return 0.0
+    cap = capacity_s()
+    row = AirtimeBudget.objects.filter(key=BUCKET_KEY).first()
+    if row is None:
+        return 0.0
+    _refill(row, timezone.now(), cap, rate)
+    return _decide(row.tokens_s, cost, priority, cap, rate)
+
+
+def budget_status() -> Dict[str, Any]:
+    """Current bucket level, limits and lifetime counters."""
+    rate = duty_cycle()
+    cap = capacity_s()
+    now = timezone.now()
+    row = AirtimeBudget.objects.filter(key=BUCKET_KEY).first()
+    if row is None:
+        row = AirtimeBudget(key=BUCKET_KEY, tokens_s=cap, updated_at=now)
+    else:
+        _refill(row, now, cap, rate)
+    radio = radio_params()
+    return {
+        "enabled": rate > 0,
+        "duty_cycle": rate,
+        "window_s": window_s(),
+        "capacity_s": round(cap, 3),
+        "available_s": round(row.tokens_s, 3),
+        "available_pct": round(100.0 * row.tokens_s / cap, 1) if cap > 0 else None,
+        "reserve_pct": {PRIORITY_NAMES[p]: round(100.0 * f, 1) for p, f in RESERVE.items()},
+        "spent_s": round(row.spent_s, 3),
+        "sent": row.sent,
+        "deferred": row.deferred,
+        "radio": radio,
+        # Airtime of a typical ~50 character message with the current settings
+        "message_airtime_s": round(time_on_air_s(_PACKET_OVERHEAD + 4 * _CIPHER_BLOCK, radio["sf"], radio["bw_khz"], radio["cr"]), 3),
+        "full_in_s": round((cap - row.tokens_s) / rate, 1) if rate > 0 else None,
+        "as_of": now,
+    }
+
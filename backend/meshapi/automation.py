@@ -0,0 +1,242 @@
+"""Compiled automation rule set, cached per process.
+
+Enabled ``AutomationRule`` rows are compiled once into lookup structures. There
+is one set for case-sensitive rules and one for case-insensitive rules, which
+match against the lowercased text:
+
+- ``equals`` patterns go into a dict keyed by the full text,
+- ``prefix`` patterns go into a character trie walked along the text,
+- ``contains`` patterns go into an Aho-Corasick automaton that reports all of
+  them in one pass over the text,
+- ``regex`` patterns are compiled once; invalid ones never match.
+
+:meth:`RuleEngine.match` yields the matching rules in the order used to
+evaluate them one by one (priority desc, id asc), with the same source filters
+and template context as before. Cooldown, actions and ``stop_processing`` stay
+with the caller.
+
+The engine is rebuilt when the ``automations`` data version changes. Rule
+saves and deletes bump it, except saves that only touch ``last_triggered_at``.
+The version is checked at most every ``AUTOMATION_RULES_CHECK_S`` seconds
+(default 2).
+"""
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional, Pattern, Set, Tuple
+
+from .models import AutomationRule
+from .versioning import KEY_AUTOMATIONS, get_versions
+
+
+class _Trie:
+    """Prefix patterns; :meth:`prefixes_of` returns every pattern that starts `text`."""
+
+    def __init__(self) -> None:
+        self._root: Dict[Any, Any] = {}
+
+    def add(self, pattern: str, pos: int) -> None:
+        node = self._root
+        for ch in pattern:
+            node = node.setdefault(ch, {})
+        node.setdefault(None, []).append(pos)
+
+    def prefixes_of(self, text: str) -> List[int]:
+        node = self._root
+        hits = list(node.get(None, ()))
+        for ch in text:
+            node = node.get(ch)
+            if node is None:
+                break
+            hits.extend(node.get(None, ()))
+        return hits
+
+
+class _AhoCorasick:
+    """Multi-pattern substring matcher (goto/fail automaton over characters)."""
+
+    def __init__(self) -> None:
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[int]] = [[]]
+
+    def add(self, pattern: str, pos: int) -> None:
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append(pos)
+
+    def build(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                # Patterns ending at the fail state also end here
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def search(self, text: str) -> Set[int]:
+        hits: Set[int] = set(self._out[0])  # empty patterns
+        if len(self._goto) == 1:
+            return hits
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                hits.update(out[state])
+        return hits
+
+
+class _CaseSet:
+    """Lookup structures for the rules of one case mode."""
+
+    def __init__(self) -> None:
+        self.equals: Dict[str, List[int]] = {}
+        self.prefix = _Trie()
+        self.contains = _AhoCorasick()
+        self.regex: List[Tuple[int, Pattern[str]]] = []
+        self.size = 0
+
+
+class CompiledRule:
+    __slots__ = ("rule", "pattern", "from_name", "from_public_key")
+
+    def __init__(self, rule: AutomationRule) -> None:
+        self.rule = rule
+        self.pattern = rule.pattern if rule.case_sensitive else rule.pattern.lower()
+        self.from_name = rule.from_name.strip().lower()
+        self.from_public_key = rule.from_public_key.strip().lower()
+
+
+class RuleEngine:
+    def __init__(self, rules: List[AutomationRule]) -> None:
+        self.rules = [CompiledRule(r) for r in rules]
+        self._sets = {True: _CaseSet(), False: _CaseSet()}
+        for pos, cr in enumerate(self.rules):
+            rule = cr.rule
+            cs = self._sets[bool(rule.case_sensitive)]
+            cs.size += 1
+            if rule.match_type == AutomationRule.MATCH_EQUALS:
+                cs.equals.setdefault(cr.pattern, []).append(pos)
+            elif rule.match_type == AutomationRule.MATCH_PREFIX:
+                cs.prefix.add(cr.pattern, pos)
+            elif rule.match_type == AutomationRule.MATCH_CONTAINS:
+                cs.contains.add(cr.pattern, pos)
+            elif rule.match_type == AutomationRule.MATCH_REGEX:
+                flags = 0 if rule.case_sensitive else re.IGNORECASE
+                try:
+                    cs.regex.append((pos, re.compile(rule.pattern, flags)))
+                except re.error:
+                    pass
+        for cs in self._sets.values():
+            cs.contains.build()
+
+    def _candidates(self, text: str) -> Dict[int, Any]:
+        """Rule position -> regex match object (or None) for every pattern hit."""
+        found: Dict[int, Any] = {}
+        for case_sensitive, cs in self._sets.items():
+            if not cs.size:
+                continue
+            t = text if case_sensitive else text.lower()
+            for pos in cs.equals.get(t, ()):
+                found[pos] = None
+            for pos in cs.prefix.prefixes_of(t):
+                found[pos] = None
+            for pos in cs.contains.search(t):
+                found[pos] = None
+            for pos, rx in cs.regex:
+                # Like before, regexes run on the original text
+                m = rx.search(text)
+                if m:
+                    found[pos] = m
+        return found
+
+    def match(self, *, name: str, public_key: Optional[str], direction: str, text: str) -> Iterator[Tuple[AutomationRule, Dict[str, Any]]]:
+        """Yield (rule, template context) for each matching rule in evaluation order."""
+        found = self._candidates(text)
+        if not found:
+            return
+        name_l = (name or "").strip().lower()
+        key_l = (public_key or "").strip().lower()
+        for pos in sorted(found):
+            cr = self.rules[pos]
+            rule = cr.rule
+            if rule.only_incoming and direction != "in":
+                continue
+            if cr.from_name and name_l != cr.from_name:
+                continue
+            if cr.from_public_key and key_l != cr.from_public_key:
+                continue
+            groups: List[str] = []
+            if rule.match_type == AutomationRule.MATCH_PREFIX:
+                t = text if rule.case_sensitive else text.lower()
+                groups = [t[len(cr.pattern):].lstrip()]
+            elif found[pos] is not None:
+                groups = list(found[pos].groups(default=""))
+            ctx: Dict[str, Any] = {
+                "name": name,
+                "public_key": public_key or "",
+                "text": text,
+                "direction": direction,
+                0: text,
+            }
+            for i, g in enumerate(groups, start=1):
+                ctx[i] = g
+            yield rule, ctx
+
+
+def _check_interval_s() -> float:
+    try:
+        return max(0.0, float(os.getenv("AUTOMATION_RULES_CHECK_S", "2")))
+    except Exception:
+        return 2.0
+
+
+_engine: Optional[RuleEngine] = None
+_engine_version: Optional[int] = None
+_checked_at = 0.0
+_engine_lock = threading.Lock()
+
+
+def get_rule_engine() -> RuleEngine:
+    """Return this process's compiled rule set, rebuilding it after rule changes."""
+    global _engine, _engine_version, _checked_at
+    engine = _engine
+    if engine is not None and time.monotonic() - _checked_at < _check_interval_s():
+        return engine
+    with _engine_lock:
+        now = time.monotonic()
+        if _engine is not None and now - _checked_at < _check_interval_s():
+            return _engine
+        version = get_versions([KEY_AUTOMATIONS])[KEY_AUTOMATIONS][0]
+        if _engine is None or version != _engine_version:
+            rules = list(AutomationRule.objects.filter(enabled=True).order_by("-priority", "id"))
+            _engine = RuleEngine(rules)
+            _engine_version = version
+        _checked_at = now
+        return _engine
+
+
+def invalidate_rule_engine() -> None:
+    """Force a rebuild on the next evaluation in this process."""
+    global _engine_version, _checked_at
+    with _engine_lock:
+        _engine_version = None
+        _checked_at = 0.0
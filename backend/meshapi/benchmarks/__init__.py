@@ -0,0 +1,6 @@
+"""Benchmarks and load-test tools.
+
+Standalone microbenchmarks run with ``python -m meshapi.benchmarks.<name>``;
+the database suite (``dataset``, ``suite``) runs through the
+``generate_dataset`` and ``run_benchmarks`` management commands.
+"""
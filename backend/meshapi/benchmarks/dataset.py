@@ -0,0 +1,164 @@
+"""Synthetic mesh data for load tests and the benchmark suite.
+
+:func:`generate_dataset` fills the database with data shaped like real ingest:
+
+- contacts are the simulator fleet (see ``fake_meshcore_cli``), so the
+  simulator started with the same seed answers for them,
+- telemetry rows go round-robin over the contacts, spread evenly over the last
+  ``days``, and ``ContactLatest`` is set from each contact's newest row,
+- messages are mostly incoming direct messages (with the dedup keys ingest
+  computes), plus replies and public channel traffic.
+
+The counts are totals for each table: calling it again with larger numbers only
+adds the difference, which is how the suite grows one database through several
+sizes. Rows go in with ``bulk_create`` in batches of ``batch``, so memory stays
+flat at any size; no signals run and raw payloads are left empty.
+"""
+import itertools
+import random
+import time
+from datetime import timedelta
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from django.utils import timezone
+
+from ..chat import dedup_key
+from ..models import Contact, ContactLatest, ContactTelemetry, Message
+from ..versioning import KEY_CONTACT_NAMES, KEY_CONTACTS, KEY_MESSAGES, bump_version
+from .fake_meshcore_cli import CHAT_TEXTS, Fleet
+
+
+# Share of generated messages per kind; the rest is public channel traffic
+_SHARE_INCOMING = 0.8
+_SHARE_OUTGOING = 0.1
+
+
+def _chunks(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    it = iter(items)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _contact_ids(fleet: Fleet, batch: int) -> List[int]:
+    ids: List[int] = []
+    for chunk in _chunks(fleet.contacts, batch):
+        found = dict(
+            Contact.objects.filter(public_key__in=[c["public_key"] for c in chunk]).values_list("public_key", "id")
+        )
+        ids.extend(found[c["public_key"]] for c in chunk)
+    return ids
+
+
+def generate_dataset(
+    *,
+    contacts: int,
+    telemetry: int,
+    messages: int,
+    days: float = 30.0,
+    batch: int = 5000,
+    seed: int = 1,
+    progress: Optional[Callable[[str], None]] = None,
+) -> Dict[str, Any]:
+    """Top the tables up to the given row counts; returns what was added and how long it took."""
+    log = progress or (lambda msg: None)
+    batch = max(1, int(batch))
+    rnd = random.Random(seed)
+    started = time.perf_counter()
+    now = timezone.now()
+    start = now - timedelta(days=max(0.001, days))
+    span_s = (now - start).total_seconds()
+    stats: Dict[str, Any] = {"contacts": 0, "telemetry": 0, "messages": 0}
+
+    fleet = Fleet(max(1, contacts), seed)
+    before = Contact.objects.count()
+    for chunk in _chunks(fleet.contacts, batch):
+        Contact.objects.bulk_create(
+            [Contact(public_key=c["public_key"], name=c["adv_name"], first_seen=start, last_seen=now) for c in chunk],
+            ignore_conflicts=True,
+        )
+    stats["contacts"] = Contact.objects.count() - before
+    ids = _contact_ids(fleet, batch)
+    n_contacts = len(ids)
+
+    first = ContactTelemetry.objects.count()
+    add = max(0, telemetry - first)
+    newest: Dict[int, ContactTelemetry] = {}
+
+    def telemetry_rows() -> Iterator[ContactTelemetry]:
+        for j in range(add):
+            k = (first + j) % n_contacts
+            c = fleet.contacts[k]
+            at = start + timedelta(seconds=span_s * (j + 1) / add)
+            advert = int(at.timestamp()) - rnd.randrange(c["_advert_every"])
+            row = ContactTelemetry(
+                contact_id=ids[k],
+                fetched_at=at,
+                adv_name=c["adv_name"],
+                last_advert=advert,
+                adv_lat=c["adv_lat"],
+                adv_lon=c["adv_lon"],
+                rssi=c["_rssi"] + rnd.randint(-4, 4),
+                snr=round(c["_snr"] + rnd.uniform(-2.0, 2.0), 2),
+                battery_mv=c["_bat_mv"] - rnd.randrange(40),
+                type=c["type"],
+                flags=c["flags"],
+                out_path_len=c["out_path_len"],
+                out_path=c["out_path"],
+                lastmod=advert,
+                raw={},
+            )
+            newest[ids[k]] = row
+            yield row
+
+    for n, chunk in enumerate(_chunks(telemetry_rows(), batch), start=1):
+        ContactTelemetry.objects.bulk_create(chunk)
+        stats["telemetry"] += len(chunk)
+        if n % 100 == 0:
+            log(f"telemetry: {stats['telemetry']}/{add}")
+    for chunk in _chunks(newest.items(), batch):
+        ContactLatest.objects.bulk_create(
+            [ContactLatest(contact_id=cid, **{f: getattr(r, f) for f in ContactLatest.COPY_FIELDS}) for cid, r in chunk],
+            update_conflicts=True,
+            unique_fields=["contact"],
+            update_fields=list(ContactLatest.COPY_FIELDS),
+        )
+
+    first = Message.objects.count()
+    add = max(0, messages - first)
+
+    def message_rows() -> Iterator[Message]:
+        for j in range(add):
+            at = start + timedelta(seconds=span_s * (j + 1) / add)
+            text = f"{rnd.choice(CHAT_TEXTS)} #{first + j}"
+            roll = rnd.random()
+            if roll < _SHARE_INCOMING + _SHARE_OUTGOING:
+                k = rnd.randrange(n_contacts)
+                name = fleet.contacts[k]["adv_name"]
+                common = dict(contact_id=ids[k], name=name, public_key=fleet.contacts[k]["public_key"], text=text, ts=at)
+                if roll < _SHARE_INCOMING:
+                    yield Message(direction="in", dedup_key=dedup_key(name, text, int(at.timestamp())), **common)
+                else:
+                    yield Message(direction="out", status=rnd.choice(("sent", "delivered")), **common)
+            else:
+                sender = fleet.contacts[rnd.randrange(n_contacts)]["adv_name"]
+                text = f"{sender}: {text}"
+                yield Message(
+                    name="public", direction="in", text=text, ts=at,
+                    dedup_key=dedup_key("public", text, int(at.timestamp())),
+                )
+
+    for n, chunk in enumerate(_chunks(message_rows(), batch), start=1):
+        # A repeated dedup key (same sender, text and second) is skipped like a real echo
+        Message.objects.bulk_create(chunk, ignore_conflicts=True)
+        stats["messages"] += len(chunk)
+        if n % 100 == 0:
+            log(f"messages: {stats['messages']}/{add}")
+
+    if stats["contacts"]:
+        bump_version(KEY_CONTACT_NAMES)
+    bump_version(KEY_CONTACTS, KEY_MESSAGES)
+    stats["seconds"] = round(time.perf_counter() - started, 3)
+    return stats
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""Offline stand-in for ``meshcore-cli``, for load tests and benchmarks.
+
+Point ``MESHCORE_CLI`` at this file (it is executable and has no Django
+imports) and set any ``MESHCORE_TARGET``. It then serves both ways the backend
+calls the CLI:
+
+- one-shot ``-t TARGET -j COMMAND...``: prints one JSON reply and exits,
+- interactive ``-t TARGET`` on a PTY: prints the ``NAME🭨`` prompt, answers each
+  line with a JSON reply and, in between, prints incoming chat lines
+  (``Name (D): text``) like a live device.
+
+Emulated commands: ``contacts``, ``contact_info``, ``req_bstatus``,
+``req_status``, ``req_telemetry``, ``sync_msgs``, ``msg``, ``infos``, ``ver``
+and ``self_telemetry``. The reply shapes are the ones the parsers in
+``meshapi.services`` read.
+
+The fleet is derived from ``--seed``, so every process sees the same contacts
+(``Node 0000``, ``Node 0001``, ...). Each option falls back to an environment
+variable, since the backend only passes ``-t`` and ``-j``:
+
+==============  ==========================  =========================================
+option          environment                 meaning
+==============  ==========================  =========================================
+--contacts      FAKE_MESHCORE_CONTACTS      fleet size (50)
+--latency-ms    FAKE_MESHCORE_LATENCY_MS    delay of every command (20)
+--radio-ms      FAKE_MESHCORE_RADIO_MS      extra delay of over-the-air commands, ±50% (500)
+--loss          FAKE_MESHCORE_LOSS          share of ``req_*`` requests left unanswered (0)
+--unread        FAKE_MESHCORE_UNREAD        messages returned per ``sync_msgs`` (3)
+--chat          FAKE_MESHCORE_CHAT          chance of a chat line before a one-shot reply (0)
+--chat-per-s    FAKE_MESHCORE_CHAT_PER_S    chat lines per second in interactive mode (0.2)
+--name          FAKE_MESHCORE_NAME          name of the local node (SIM_NODE)
+--seed          FAKE_MESHCORE_SEED          fleet seed (1)
+==============  ==========================  =========================================
+
+For example, a one-off import of 2000 simulated contacts, then the collector
+against the same fleet (it runs until interrupted)::
+
+    export MESHCORE_CLI=$PWD/meshapi/benchmarks/fake_meshcore_cli.py MESHCORE_TARGET=sim FAKE_MESHCORE_CONTACTS=2000
+    python manage.py fetch_contacts_info --sleep 0
+    python manage.py run_contact_collector --max-inflight 8 --debug
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import shlex
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+PROMPT_SEP = "🭨"
+
+CHAT_TEXTS = (
+    "hallo zusammen",
+    "test 1 2 3",
+    "ping",
+    "anyone on 869.618?",
+    "repeater back online",
+    "battery low, signing off",
+    "good signal here",
+    "status?",
+)
+_OVER_THE_AIR = {"req_bstatus", "req_status", "req_telemetry", "msg"}
+
+
+class CommandError(Exception):
+    """A command the device rejects or does not answer (non-zero exit)."""
+
+
+def _env(key: str, default: Any) -> Any:
+    raw = os.getenv(key)
+    if raw is None or raw.strip() == "":
+        return default
+    try:
+        return type(default)(raw)
+    except Exception:
+        return default
+
+
+class Fleet:
+    """Deterministic contacts around a fixed centre, keyed by public key."""
+
+    def __init__(self, size: int, seed: int) -> None:
+        self.contacts: List[Dict[str, Any]] = []
+        for i in range(max(0, size)):
+            rnd = random.Random(f"{seed}:{i}")
+            path_len = rnd.choice((-1, 0, 1, 2, 3))
+            self.contacts.append({
+                "public_key": hashlib.sha256(f"meshcore-sim:{seed}:{i}".encode()).hexdigest(),
+                "type": 2 if i % 5 == 0 else 1,
+                "flags": 0,
+                "out_path_len": path_len,
+                "out_path": "".join(f"{rnd.randrange(256):02x}" for _ in range(max(0, path_len))),
+                "adv_name": f"Node {i:04d}",
+                "adv_lat": round(52.52 + rnd.uniform(-0.5, 0.5), 6),
+                "adv_lon": round(13.40 + rnd.uniform(-0.8, 0.8), 6),
+                # Per-contact radio and battery baselines for the status replies
+                "_rssi": rnd.randint(-118, -60),
+                "_snr": round(rnd.uniform(-8.0, 12.0), 2),
+                "_bat_mv": rnd.randint(3500, 4200),
+                "_advert_every": rnd.randint(300, 3600),
+            })
+        self._by_name = {c["adv_name"]: c for c in self.contacts}
+
+    @staticmethod
+    def public(contact: Dict[str, Any], now: int) -> Dict[str, Any]:
+        data = {k: v for k, v in contact.items() if not k.startswith("_")}
+        # Adverts arrive periodically, so repeated polls see fresh timestamps
+        data["last_advert"] = now - (now % contact["_advert_every"])
+        data["lastmod"] = data["last_advert"]
+        return data
+
+    def find(self, ref: str) -> Dict[str, Any]:
+        c = self._by_name.get(ref)
+        if c is not None:
+            return c
+        ref_l = ref.lower()
+        if len(ref_l) >= 6:
+            for c in self.contacts:
+                if c["public_key"].startswith(ref_l):
+                    return c
+        raise CommandError(f"Unknown contact {ref}")
+
+
+class Simulator:
+    def __init__(self, opts: argparse.Namespace) -> None:
+        self.opts = opts
+        self.fleet = Fleet(opts.contacts, opts.seed)
+        # Events vary per process so repeated runs are not deduplicated away
+        self.rnd = random.Random()
+        self.public_key = hashlib.sha256(f"meshcore-sim:{opts.seed}:self".encode()).hexdigest()
+        self._handlers: Dict[str, Callable[[List[str]], Any]] = {
+            "contacts": self.contacts,
+            "contact_info": self.contact_info,
+            "ci": self.contact_info,
+            "req_bstatus": self.req_status,
+            "req_status": self.req_status,
+            "rs": self.req_status,
+            "req_telemetry": self.req_telemetry,
+            "rt": self.req_telemetry,
+            "sync_msgs": self.sync_msgs,
+            "sm": self.sync_msgs,
+            "msg": self.msg,
+            "infos": self.infos,
+            "i": self.infos,
+            "ver": self.ver,
+            "self_telemetry": self.self_telemetry,
+        }
+
+    def run(self, args: List[str]) -> Any:
+        if not args:
+            raise CommandError("no command")
+        op = args[0].lower()
+        handler = self._handlers.get(op)
+        if handler is None:
+            raise CommandError(f"Unknown command {args[0]}")
+        delay_ms = self.opts.latency_ms
+        if op in _OVER_THE_AIR:
+            delay_ms += self.opts.radio_ms * self.rnd.uniform(0.5, 1.5)
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000.0)
+        return handler(args[1:])
+
+    def chat_line(self) -> str:
+        c = self.rnd.choice(self.fleet.contacts) if self.fleet.contacts else {"adv_name": "Node 0000"}
+        return f"{c['adv_name']} (D): {self.rnd.choice(CHAT_TEXTS)} #{self.rnd.randrange(100000)}"
+
+    # Commands
+
+    def contacts(self, args: List[str]) -> Any:
+        now = int(time.time())
+        return {c["public_key"]: Fleet.public(c, now) for c in self.fleet.contacts}
+
+    def contact_info(self, args: List[str]) -> Any:
+        if not args:
+            raise CommandError("contact_info: name required")
+        return Fleet.public(self.fleet.find(" ".join(args)), int(time.time()))
+
+    def _answered(self, ref: str) -> Dict[str, Any]:
+        contact = self.fleet.find(ref)
+        if self.rnd.random() < self.opts.loss:
+            raise CommandError("Timeout waiting for response")
+        return contact
+
+    def req_status(self, args: List[str]) -> Any:
+        c = self._answered(" ".join(args))
+        return {
+            "pubkey_pre": c["public_key"][:12],
+            "battery_mv": c["_bat_mv"] + self.rnd.randint(-20, 20),
+            "rssi": c["_rssi"] + self.rnd.randint(-3, 3),
+            "snr": round(c["_snr"] + self.rnd.uniform(-1.5, 1.5), 2),
+            "noise_floor": -112 + self.rnd.randint(-3, 3),
+            "tx_queue_len": 0,
+            "uptime": int(time.time()) % 864000,
+            "airtime": self.rnd.randint(100, 50000),
+            "nb_sent": self.rnd.randint(100, 10000),
+            "nb_recv": self.rnd.randint(100, 20000),
+        }
+
+    def req_telemetry(self, args: List[str]) -> Any:
+        c = self._answered(" ".join(args))
+        mv = c["_bat_mv"] + self.rnd.randint(-20, 20)
+        return {
+            "pubkey_pre": c["public_key"][:12],
+            "battery_mv": mv,
+            "rssi": c["_rssi"] + self.rnd.randint(-3, 3),
+            "snr": round(c["_snr"] + self.rnd.uniform(-1.5, 1.5), 2),
+            "lpp": [
+                {"channel": 1, "type": "voltage", "value": round(mv / 1000.0, 3)},
+                {"channel": 1, "type": "temperature", "value": round(self.rnd.uniform(5.0, 30.0), 1)},
+            ],
+        }
+
+    def sync_msgs(self, args: List[str]) -> Any:
+        now = int(time.time())
+        events = []
+        for _ in range(self.opts.unread):
+            if self.fleet.contacts and self.rnd.random() < 0.8:
+                c = self.rnd.choice(self.fleet.contacts)
+                events.append({
+                    "type": "PRIV",
+                    "SNR": c["_snr"],
+                    "pubkey_prefix": c["public_key"][:12],
+                    "path_len": max(0, c["out_path_len"]),
+                    "txt_type": 0,
+                    "sender_timestamp": now - self.rnd.randint(0, 600),
+                    "text": f"{self.rnd.choice(CHAT_TEXTS)} #{self.rnd.randrange(100000)}",
+                })
+            else:
+                events.append({
+                    "type": "CHAN",
+                    "SNR": round(self.rnd.uniform(-8.0, 12.0), 2),
+                    "channel_idx": 0,
+                    "path_len": self.rnd.randint(0, 3),
+                    "txt_type": 0,
+                    "sender_timestamp": now - self.rnd.randint(0, 600),
+                    "text": self.chat_line().replace(" (D): ", ": "),
+                })
+        return events
+
+    def msg(self, args: List[str]) -> Any:
+        if len(args) < 2:
+            raise CommandError("msg: name and text required")
+        self.fleet.find(args[0])
+        return {"type": 0, "expected_ack": f"{self.rnd.getrandbits(32):08x}", "suggested_timeout": 4000}
+
+    def infos(self, args: List[str]) -> Any:
+        return {
+            "adv_type": 1,
+            "tx_power": 22,
+            "max_tx_power": 22,
+            "public_key": self.public_key,
+            "adv_lat": 52.52,
+            "adv_lon": 13.405,
+            "adv_loc_policy": 0,
+            "telemetry_mode_env": 0,
+            "telemetry_mode_loc": 0,
+            "telemetry_mode_base": 0,
+            "manual_add_contacts": False,
+            "radio_freq": 869.618,
+            "radio_bw": 62.5,
+            "radio_sf": 8,
+            "radio_cr": 8,
+            "name": self.opts.name,
+        }
+
+    def ver(self, args: List[str]) -> Any:
+        return {"model": "meshcore-sim", "ver": 8, "fw ver": 8, "fw_build": "01-Jan-2025"}
+
+    def self_telemetry(self, args: List[str]) -> Any:
+        return {"lpp": [{"channel": 1, "type": "voltage", "value": round(self.rnd.uniform(3.9, 4.2), 3)}]}
+
+
+def _write(out, lock: threading.Lock, text: str) -> None:
+    with lock:
+        out.write(text)
+        out.flush()
+
+
+def run_once(sim: Simulator, command: List[str]) -> int:
+    try:
+        data = sim.run(command)
+    except CommandError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    lines = []
+    # Only ahead of objects: a stray line before an array also trips the real parsers
+    if isinstance(data, dict) and sim.opts.chat > 0 and sim.rnd.random() < sim.opts.chat:
+        lines.append(sim.chat_line())
+    lines.append(json.dumps(data, ensure_ascii=False))
+    sys.stdout.write("\n".join(lines) + "\n")
+    sys.stdout.flush()
+    return 0
+
+
+def run_interactive(sim: Simulator) -> int:
+    out = sys.stdout
+    lock = threading.Lock()
+    prompt = f"{sim.opts.name}{PROMPT_SEP} "
+    stop = threading.Event()
+
+    def inject() -> None:
+        rate = sim.opts.chat_per_s
+        while rate > 0 and not stop.wait(random.expovariate(rate)):
+            # Clear the prompt, print the message, then redraw the prompt
+            _write(out, lock, f"\r{sim.chat_line()}\n{prompt}")
+
+    _write(out, lock, f"INFO:meshcore:Connected to {sim.opts.target or 'simulator'}\n{prompt}")
+    threading.Thread(target=inject, name="chat", daemon=True).start()
+    try:
+        for line in sys.stdin:
+            line = line.strip()
+            if not line:
+                _write(out, lock, prompt)
+                continue
+            if line in ("quit", "q", "exit"):
+                break
+            try:
+                reply = json.dumps(sim.run(shlex.split(line)), ensure_ascii=False)
+            except (CommandError, ValueError) as e:
+                reply = f"Error: {e}"
+            _write(out, lock, f"{reply}\n{prompt}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-t", dest="target", default="", help="device address (ignored)")
+    ap.add_argument("-j", dest="json", action="store_true", help="JSON output (replies are always JSON)")
+    ap.add_argument("--contacts", type=int, default=_env("FAKE_MESHCORE_CONTACTS", 50))
+    ap.add_argument("--latency-ms", type=float, default=_env("FAKE_MESHCORE_LATENCY_MS", 20.0))
+    ap.add_argument("--radio-ms", type=float, default=_env("FAKE_MESHCORE_RADIO_MS", 500.0))
+    ap.add_argument("--loss", type=float, default=_env("FAKE_MESHCORE_LOSS", 0.0))
+    ap.add_argument("--unread", type=int, default=_env("FAKE_MESHCORE_UNREAD", 3))
+    ap.add_argument("--chat", type=float, default=_env("FAKE_MESHCORE_CHAT", 0.0))
+    ap.add_argument("--chat-per-s", type=float, default=_env("FAKE_MESHCORE_CHAT_PER_S", 0.2))
+    ap.add_argument("--name", default=_env("FAKE_MESHCORE_NAME", "SIM_NODE"))
+    ap.add_argument("--seed", type=int, default=_env("FAKE_MESHCORE_SEED", 1))
+    ap.add_argument("command", nargs=argparse.REMAINDER)
+    opts = ap.parse_args(argv)
+    try:
+        sys.stdout.reconfigure(encoding="utf-8")
+        sys.stdin.reconfigure(encoding="utf-8", errors="replace")
+    except Exception:
+        pass
+    sim = Simulator(opts)
+    if opts.command:
+        return run_once(sim, opts.command)
+    return run_interactive(sim)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""Throughput of the PTY reader's decode/split step, before and after.
+
+``legacy`` replays the former reader loop (re-decode the whole pending buffer
+per 4 KB read); ``tokenizer`` feeds :class:`PtyStreamTokenizer` with 4 KB and
+64 KB reads. The workload mixes JSON replies, chat lines with ANSI colours and
+long prompt echoes without a newline, which made the old loop quadratic.
+
+Before timing, :data:`FRAME_CASES` are fed to :class:`JsonFrameScanner` whole
+and in small pieces, and the run stops if a reply is framed wrongly.
+
+    python -m meshapi.benchmarks.pty_reader [--mb 4] [--echo-kb 256]
+"""
+import argparse
+import json
+import time
+from typing import Callable, List
+
+from meshapi.ptystream import ANSI_RE, JsonFrameScanner, PtyStreamTokenizer
+
+
+def make_workload(total_bytes: int, echo_bytes: int) -> bytes:
+    reply = json.dumps({f"{i:064x}": {"adv_name": f"Node {i}", "rssi": -80 + i % 20} for i in range(8)})
+    parts: List[str] = []
+    size = 0
+    i = 0
+    while size < total_bytes:
+        if i % 50 == 49:
+            # A prompt that keeps being redrawn without a newline
+            part = ("JOST_DEV🭨 " * (echo_bytes // 12)) + "\n"
+        elif i % 3 == 0:
+            part = f"\x1b[32mNode {i % 97} (D): hallo welt nummer {i} 🙂\x1b[0m\n"
+        else:
+            part = reply + "\n"
+        parts.append(part)
+        size += len(part.encode("utf-8"))
+        i += 1
+    return "".join(parts).encode("utf-8")
+
+
+# (console output, replies the scanner must find)
+FRAME_CASES = [
+    # Unbalanced brackets or quotes in chat text must not swallow the reply
+    ('Bob (D): :-{ \r\n{"a":1}\r\nJOST🭨 ', [{"a": 1}]),
+    ('Bob (D): he said "hi\r\n{"a":1}\r\nJOST🭨 ', [{"a": 1}]),
+    # JSON inside a chat body is not a reply
+    ("Bob (D): [1,2]\r\nJOST🭨 ", []),
+    # A chat line abandons an open frame
+    ('{"a":\r\nBob (D): x\r\n{"b": [true,\r\n false]}\r\n', [{"b": [True, False]}]),
+    ('JOST🭨 infos\r\n{\n  "name": "x",\n  "v": [1, 2]\n}\nJOST🭨 ', [{"name": "x", "v": [1, 2]}]),
+    ('JOST🭨 {"x": 1}\n', [{"x": 1}]),
+]
+
+
+def check_json_frames() -> None:
+    for text, expected in FRAME_CASES:
+        for step in (len(text), 3, 1):
+            scanner = JsonFrameScanner()
+            for off in range(0, len(text), step):
+                scanner.feed(text[off : off + step])
+            if list(scanner.frames) != expected:
+                raise SystemExit(f"frame mismatch for {text!r} in {step}-char pieces: {list(scanner.frames)}")
+
+
+def legacy(data: bytes, chunk: int) -> int:
+    """Returns the characters in completed lines (used as a cross-check)."""
+    lines = 0
+    partial = b""
+    for off in range(0, len(data), chunk):
+        partial += data[off : off + chunk]
+        text = partial.decode("utf-8", errors="ignore")
+        if not text:
+            continue
+        if text.endswith("\n"):
+            lines_text = text
+            partial = b""
+        else:
+            last_nl = text.rfind("\n")
+            if last_nl == -1:
+                continue
+            lines_text = text[: last_nl + 1]
+            partial = text[last_nl + 1 :].encode("utf-8", errors="ignore")
+        lines += sum(map(len, ANSI_RE.sub("", lines_text).splitlines()))
+    return lines
+
+
+def tokenizer(data: bytes, chunk: int) -> int:
+    tk = PtyStreamTokenizer()
+    lines = 0
+    for off in range(0, len(data), chunk):
+        _text, done = tk.feed(data[off : off + chunk])
+        lines += sum(map(len, done))
+    return lines + sum(map(len, tk.feed(b"", final=True)[1]))
+
+
+def _run(fn: Callable[[bytes, int], int], data: bytes, chunk: int, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(data, chunk)
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return len(data) / best
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--mb", type=float, default=4.0, help="workload size in MB")
+    ap.add_argument("--echo-kb", type=int, default=256, help="length of a newline-free prompt echo")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+    check_json_frames()
+    data = make_workload(int(args.mb * 1024 * 1024), args.echo_kb * 1024)
+    # The legacy loop also drops characters split across reads, so compare
+    # against a one-shot decode instead
+    expected = sum(map(len, ANSI_RE.sub("", data.decode("utf-8")).splitlines()))
+    got = tokenizer(data, 4096)
+    if got != expected:
+        raise SystemExit(f"output mismatch: expected={expected} tokenizer={got}")
+    for label, fn, chunk in (
+        ("legacy    4 KB reads", legacy, 4096),
+        ("tokenizer 4 KB reads", tokenizer, 4096),
+        ("tokenizer 64 KB reads", tokenizer, 65536),
+    ):
+        rate = _run(fn, data, chunk, args.repeat)
+        print(f"{label:24s} {rate / 1e6:10.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
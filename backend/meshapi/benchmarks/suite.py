@@ -0,0 +1,273 @@
+"""Benchmarks of the ingest, parsing and read paths on a populated database.
+
+:func:`run_suite` makes one warm-up call per case, then times ``repeat`` calls
+and counts the SQL queries of each:
+
+- ``extract_chats``: ``services._extract_and_persist_chats`` on CLI output with
+  a JSON reply and several inline chat lines,
+- ``session_chat_line``: ``MeshCoreSession._maybe_store_chat_line`` on one line,
+- ``persist_contact_info``: ``services._persist_contact_info`` for a batch of
+  contacts, including the ingest flush,
+- ``sync_unread_messages``: one ``sync_msgs`` call answered by
+  ``fake_meshcore_cli`` (process start included, simulated latency off),
+- ``contacts_latest`` and ``contacts_latest_cached``: ``ContactsLatestView``
+  with the payload cache cleared before each call, and served from it,
+- ``messages_newest``, ``messages_conversation``, ``messages_deep_page`` and
+  ``messages_delta``: ``MessagesListView`` for the newest page, one
+  conversation, a page from the middle of the history and an ``after_id``
+  poll, each with the payload cache cleared.
+
+Chat texts are unique per call, so the write cases store new rows instead of
+being dropped as echoes. Times are milliseconds of wall clock. The CLI is
+always the simulator, never the configured device or broker.
+
+:func:`compare` checks a result against a baseline: a case regresses when it
+needs more queries, or when its median is more than ``tolerance`` slower.
+"""
+import itertools
+import math
+import os
+import statistics
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlencode
+
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..ingest import get_ingest_buffer
+from ..models import Contact, ContactTelemetry, Message
+from ..session import MeshCoreSession
+from ..versioning import clear_payload_cache
+from ..views_contacts import ContactsLatestView
+from ..views_messages import MessagesListView, _format_cursor
+from .fake_meshcore_cli import CHAT_TEXTS, Fleet
+
+
+# name -> (contacts, telemetry rows, messages)
+SIZES: Dict[str, Tuple[int, int, int]] = {
+    "xs": (100, 10_000, 2_000),
+    "s": (1_000, 100_000, 20_000),
+    "m": (10_000, 1_000_000, 200_000),
+    "l": (10_000, 10_000_000, 1_000_000),
+    "full": (10_000, 50_000_000, 5_000_000),
+}
+
+CASES = (
+    "extract_chats",
+    "session_chat_line",
+    "persist_contact_info",
+    "sync_unread_messages",
+    "contacts_latest",
+    "contacts_latest_cached",
+    "messages_newest",
+    "messages_conversation",
+    "messages_deep_page",
+    "messages_delta",
+)
+
+_CHAT_LINES = 5
+_CONTACT_BATCH = 50
+_UNREAD = 10
+# The simulator builds its fleet on every start; a slice of it is enough for sync_msgs
+_SIM_CONTACTS = 1000
+_FAKE_CLI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_meshcore_cli.py")
+
+# Shared by all runs in the process, so no chat text repeats across sizes
+_seq = itertools.count()
+
+
+def parse_size(spec: str) -> Tuple[str, Tuple[int, int, int]]:
+    """A preset name from :data:`SIZES` or ``contacts:telemetry:messages``."""
+    spec = spec.strip()
+    if spec in SIZES:
+        return spec, SIZES[spec]
+    try:
+        contacts, telemetry, messages = (int(p) for p in spec.split(":"))
+    except ValueError:
+        raise ValueError(f"unknown size {spec!r}: use one of {', '.join(SIZES)} or contacts:telemetry:messages")
+    return spec, (contacts, telemetry, messages)
+
+
+def table_counts() -> Dict[str, int]:
+    return {
+        "contacts": Contact.objects.count(),
+        "telemetry": ContactTelemetry.objects.count(),
+        "messages": Message.objects.count(),
+    }
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> Dict[str, Any]:
+    """Time `repeat` calls of `fn` after one warm-up call and count their queries."""
+    fn()
+    times: List[float] = []
+    queries: List[int] = []
+    for _ in range(max(1, repeat)):
+        with CaptureQueriesContext(connection) as ctx:
+            t0 = time.perf_counter()
+            fn()
+            times.append((time.perf_counter() - t0) * 1000.0)
+        queries.append(len(ctx.captured_queries))
+    times.sort()
+    return {
+        "calls": len(times),
+        "min_ms": round(times[0], 3),
+        "median_ms": round(statistics.median(times), 3),
+        "p95_ms": round(times[min(len(times) - 1, math.ceil(0.95 * len(times)) - 1)], 3),
+        "mean_ms": round(statistics.fmean(times), 3),
+        "queries": round(statistics.fmean(queries), 2),
+        "queries_max": max(queries),
+    }
+
+
+@contextmanager
+def _environ(**values: Optional[str]) -> Iterator[None]:
+    saved = {k: os.environ.get(k) for k in values}
+    for k, v in values.items():
+        if v is None:
+            os.environ.pop(k, None)
+        else:
+            os.environ[k] = v
+    try:
+        yield
+    finally:
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+def _cases(fleet: Fleet) -> Dict[str, Callable[[], Any]]:
+    from .. import services
+
+    contacts = fleet.contacts
+    factory = RequestFactory()
+    session = MeshCoreSession()
+
+    def chat_line() -> str:
+        n = next(_seq)
+        c = contacts[n % len(contacts)]
+        return f"{c['adv_name']} (D): {CHAT_TEXTS[n % len(CHAT_TEXTS)]} bench-{os.getpid()}-{n}"
+
+    def extract_chats() -> None:
+        lines = [chat_line() for _ in range(_CHAT_LINES)]
+        # Chat arriving around a reply, one line right behind a prompt echo
+        raw = '{"ok": true}\n' + "SIM_NODE🭨 " + "\n".join(lines) + "\n"
+        services._extract_and_persist_chats(raw)
+
+    def session_chat_line() -> None:
+        session._maybe_store_chat_line(chat_line())
+
+    def persist_contact_info() -> None:
+        now = int(time.time())
+        for _ in range(_CONTACT_BATCH):
+            c = contacts[next(_seq) % len(contacts)]
+            info = Fleet.public(c, now)
+            info.update(rssi=c["_rssi"], snr=c["_snr"], battery_mv=c["_bat_mv"])
+            services._persist_contact_info(info)
+        get_ingest_buffer().flush()
+
+    def view(view_fn: Callable, path: str, cached: bool = False) -> Callable[[], None]:
+        def call() -> None:
+            if not cached:
+                clear_payload_cache()
+            resp = view_fn(factory.get(path))
+            if resp.status_code != 200:
+                raise RuntimeError(f"GET {path} returned {resp.status_code}")
+        return call
+
+    contacts_path = reverse("contacts-latest")
+    messages_path = reverse("messages-list")
+    contacts_view = ContactsLatestView.as_view()
+    messages_view = MessagesListView.as_view()
+    first = contacts[0]
+    bounds = Message.objects.aggregate(lo=Min("ts"), hi=Max("ts"), last=Max("id"))
+    middle = None
+    if bounds["lo"] is not None:
+        middle = Message.objects.filter(ts__gte=bounds["lo"] + (bounds["hi"] - bounds["lo"]) / 2).order_by("ts", "id").first()
+    deep = f"{messages_path}?limit=50" + (f"&before={_format_cursor(middle)}" if middle else "")
+    return {
+        "extract_chats": extract_chats,
+        "session_chat_line": session_chat_line,
+        "persist_contact_info": persist_contact_info,
+        "sync_unread_messages": services.sync_unread_messages,
+        "contacts_latest": view(contacts_view, contacts_path),
+        "contacts_latest_cached": view(contacts_view, contacts_path, cached=True),
+        "messages_newest": view(messages_view, f"{messages_path}?limit=50"),
+        "messages_conversation": view(
+            messages_view,
+            f"{messages_path}?" + urlencode({"public_key": first["public_key"], "name": first["adv_name"], "limit": 50}),
+        ),
+        "messages_deep_page": view(messages_view, deep),
+        "messages_delta": view(messages_view, f"{messages_path}?after_id={max(0, (bounds['last'] or 0) - 20)}"),
+    }
+
+
+class _Rollback(Exception):
+    pass
+
+
+def run_suite(
+    *, repeat: int = 20, seed: int = 1, cases: Optional[List[str]] = None, rollback: bool = False,
+    log: Optional[Callable[[str], None]] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """Run the selected cases (default: all) against the current database.
+
+    With `rollback` every case runs in one transaction that is rolled back,
+    so the rows written by the ingest cases do not stay (their times then
+    exclude the commits).
+    """
+    if rollback:
+        results: Dict[str, Dict[str, Any]] = {}
+        try:
+            with transaction.atomic():
+                results = run_suite(repeat=repeat, seed=seed, cases=cases, log=log)
+                raise _Rollback()
+        except _Rollback:
+            pass
+        return results
+    log = log or (lambda msg: None)
+    fleet = Fleet(max(1, Contact.objects.count()), seed)
+    sim_contacts = min(len(fleet.contacts), _SIM_CONTACTS)
+    results: Dict[str, Dict[str, Any]] = {}
+    # The device is always the simulator, and the ingest buffer only flushes when told to
+    with _environ(
+        MESHCORE_CLI=_FAKE_CLI,
+        MESHCORE_TARGET="benchmark",
+        MESHCORE_BROKER=None,
+        FAKE_MESHCORE_LATENCY_MS="0",
+        FAKE_MESHCORE_CONTACTS=str(sim_contacts),
+        FAKE_MESHCORE_UNREAD=str(_UNREAD),
+        FAKE_MESHCORE_SEED=str(seed),
+        INGEST_FLUSH_MS=str(24 * 3600 * 1000),
+        INGEST_FLUSH_ROWS=str(10 ** 9),
+    ):
+        available = _cases(fleet)
+        for name in cases or CASES:
+            results[name] = measure(available[name], repeat)
+            log(f"{name}: median {results[name]['median_ms']} ms, {results[name]['queries']} queries")
+    return results
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], tolerance: float = 0.5) -> List[str]:
+    """Regressions of `current` against `baseline` (both as written by ``run_benchmarks``)."""
+    before = {r["size"]: r["cases"] for r in baseline.get("results", [])}
+    found: List[str] = []
+    for r in current.get("results", []):
+        old_cases = before.get(r["size"])
+        if not old_cases:
+            continue
+        for name, new in r["cases"].items():
+            old = old_cases.get(name)
+            if not old:
+                continue
+            if new["queries_max"] > old["queries_max"]:
+                found.append(f"{r['size']}/{name}: queries {old['queries_max']} -> {new['queries_max']}")
+            if new["median_ms"] > old["median_ms"] * (1.0 + tolerance):
+                found.append(f"{r['size']}/{name}: median {old['median_ms']} ms -> {new['median_ms']} ms")
+    return found
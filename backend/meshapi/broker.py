@@ -0,0 +1,292 @@
+"""Local command broker that owns the single meshcore-cli device connection.
+
+The broker runs as its own long-lived process (``manage.py run_meshcore_broker``)
+and keeps one interactive :class:`~meshapi.session.MeshCoreSession` open. Web
+workers and the collector talk to it over a local socket using newline-delimited
+JSON frames:
+
+    request:  {"id": "...", "op": "json", "cmd": "contacts", "timeout": 30, "priority": 10}
+    response: {"id": "...", "ok": true, "data": [...]}
+
+``priority`` orders queued commands (see :mod:`meshapi.dispatch`); clients send
+the priority of the calling thread.
+
+Supported ops are ``json``, ``text``, ``status`` and ``reconnect``. Requests are
+multiplexed over one connection per client process and matched by ``id``.
+
+The address is configured via ``MESHCORE_BROKER`` as ``host:port`` or
+``unix:/path/to.sock``. When unset, callers fall back to one-shot subprocesses.
+There is no authentication: the socket file is created with mode 0660, and a
+TCP listener on a non-loopback address logs a warning.
+"""
+import ipaddress
+import itertools
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from .dispatch import current_priority, parse_priority
+from .session import get_session
+
+
+logger = logging.getLogger("meshcore.broker")
+
+# Extra time a client waits beyond the per-command timeout for the broker to answer
+_CLIENT_GRACE_S = 5.0
+
+
+class BrokerError(RuntimeError):
+    """Raised when the broker cannot be reached or reports a failure."""
+
+
+def broker_address() -> str:
+    return (os.getenv("MESHCORE_BROKER") or "").strip()
+
+
+def _parse_address(address: str) -> Tuple[int, Any]:
+    """Return (socket family, sockaddr) for 'unix:/path' or 'host:port'."""
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+    if address.startswith("/"):
+        return socket.AF_UNIX, address
+    host, sep, port = address.rpartition(":")
+    if not sep or not port.isdigit():
+        raise ValueError(f"Invalid broker address '{address}' (expected host:port or unix:/path)")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def _is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+# --- Server -----------------------------------------------------------------
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+    """Serve one client connection; each request runs in its own thread."""
+
+    def setup(self) -> None:
+        super().setup()
+        self._write_lock = threading.Lock()
+
+    def handle(self) -> None:
+        for raw in self.rfile:
+            line = raw.decode("utf-8", errors="ignore").strip()
+            if not line:
+                continue
+            try:
+                req = json.loads(line)
+            except ValueError:
+                self._send({"id": None, "ok": False, "error": "invalid JSON request"})
+                continue
+            threading.Thread(target=self._dispatch, args=(req,), name="meshcore-broker-req", daemon=True).start()
+
+    def _send(self, payload: Dict[str, Any]) -> None:
+        data = (json.dumps(payload, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+        with self._write_lock:
+            try:
+                self.wfile.write(data)
+                self.wfile.flush()
+            except OSError:
+                pass
+
+    def _dispatch(self, req: Dict[str, Any]) -> None:
+        rid = req.get("id")
+        try:
+            result = self.server.broker.execute(req)
+            self._send({"id": rid, "ok": True, **result})
+        except Exception as e:
+            self._send({"id": rid, "ok": False, "error": f"{e.__class__.__name__}: {e}"})
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _ThreadingUnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class MeshCoreBroker:
+    """Owns the device session and executes requests received over the socket."""
+
+    def __init__(self, address: str) -> None:
+        self.address = address
+        self.session = get_session()
+        self._server: Optional[socketserver.BaseServer] = None
+
+    def execute(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        op = req.get("op")
+        if op == "status":
+            return {"alive": self.session.is_alive(), "queue": self.session.queue_stats()}
+        if op == "reconnect":
+            self.session.ensure_started()
+            return {"alive": self.session.is_alive()}
+        cmd = str(req.get("cmd") or "").strip()
+        if not cmd:
+            raise ValueError("cmd is required")
+        timeout = float(req.get("timeout") or 30.0)
+        priority = parse_priority(req.get("priority"))
+        if op == "json":
+            return {"data": self.session.run_json_command(cmd, timeout_s=timeout, priority=priority)}
+        if op == "text":
+            return {"output": self.session.run_text_command(cmd, max_wait_s=timeout, priority=priority)}
+        raise ValueError(f"unsupported op '{op}'")
+
+    def serve_forever(self) -> None:
+        family, sockaddr = _parse_address(self.address)
+        if family == socket.AF_UNIX:
+            try:
+                os.unlink(sockaddr)
+            except FileNotFoundError:
+                pass
+            server: socketserver.BaseServer = _ThreadingUnixServer(sockaddr, _BrokerHandler)
+            os.chmod(sockaddr, 0o660)
+        else:
+            server = _ThreadingTCPServer(sockaddr, _BrokerHandler)
+            if not _is_loopback(sockaddr[0]):
+                logger.warning("meshcore broker on %s accepts unauthenticated commands from the network", self.address)
+        server.broker = self  # type: ignore[attr-defined]
+        self._server = server
+        try:
+            self.session.ensure_started()
+        except Exception as e:
+            # Keep serving; clients can trigger a reconnect once the device is reachable
+            logger.warning("initial session start failed: %s", e)
+        logger.info("meshcore broker listening on %s", self.address)
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            self.session.stop()
+
+    def shutdown(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+
+
+# --- Client -----------------------------------------------------------------
+
+class BrokerClient:
+    """Thread-safe client multiplexing requests over one broker connection."""
+
+    def __init__(self, address: str) -> None:
+        self.address = address
+        self._sock: Optional[socket.socket] = None
+        self._lock = threading.Lock()
+        self._pending: Dict[str, list] = {}
+        self._ids = itertools.count(1)
+        self._pid = os.getpid()
+
+    def _connect(self) -> socket.socket:
+        family, sockaddr = _parse_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(5.0)
+        try:
+            sock.connect(sockaddr)
+        except OSError as e:
+            sock.close()
+            raise BrokerError(f"meshcore broker unreachable at {self.address}: {e}")
+        sock.settimeout(None)
+        threading.Thread(target=self._reader_loop, args=(sock,), name="meshcore-broker-client", daemon=True).start()
+        return sock
+
+    def _reader_loop(self, sock: socket.socket) -> None:
+        try:
+            for raw in sock.makefile("rb"):
+                try:
+                    resp = json.loads(raw.decode("utf-8", errors="ignore"))
+                except ValueError:
+                    continue
+                with self._lock:
+                    slot = self._pending.get(str(resp.get("id")))
+                if slot is not None:
+                    slot[1] = resp
+                    slot[0].set()
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                if self._sock is sock:
+                    self._sock = None
+                # Fail everything still waiting on this connection
+                for slot in self._pending.values():
+                    if slot[1] is None:
+                        slot[1] = {"ok": False, "error": "broker connection closed"}
+                        slot[0].set()
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def request(self, op: str, timeout: float = 30.0, **params: Any) -> Dict[str, Any]:
+        rid = f"{self._pid}-{next(self._ids)}"
+        slot: list = [threading.Event(), None]
+        payload = json.dumps({"id": rid, "op": op, "timeout": timeout, **params}, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._sock is None:
+                self._sock = self._connect()
+            self._pending[rid] = slot
+            try:
+                self._sock.sendall(payload.encode("utf-8"))
+            except OSError as e:
+                self._pending.pop(rid, None)
+                try:
+                    self._sock.close()
+                except OSError:
+                    pass
+                self._sock = None
+                raise BrokerError(f"meshcore broker send failed: {e}")
+        try:
+            if not slot[0].wait(timeout + _CLIENT_GRACE_S):
+                raise TimeoutError(f"meshcore broker did not answer '{op}' within {timeout}s")
+        finally:
+            with self._lock:
+                self._pending.pop(rid, None)
+        resp = slot[1] or {}
+        if not resp.get("ok"):
+            raise BrokerError(resp.get("error") or "broker request failed")
+        return resp
+
+    def run_json(self, command: str, timeout: float = 30.0) -> Any:
+        return self.request("json", timeout=timeout, cmd=command, priority=current_priority()).get("data")
+
+    def run_text(self, command: str, timeout: float = 15.0) -> str:
+        return self.request("text", timeout=timeout, cmd=command, priority=current_priority()).get("output") or ""
+
+    def status(self) -> Dict[str, Any]:
+        return self.request("status", timeout=5.0)
+
+    def is_alive(self) -> bool:
+        try:
+            return bool(self.status().get("alive"))
+        except Exception:
+            return False
+
+    def reconnect(self) -> bool:
+        return bool(self.request("reconnect", timeout=30.0).get("alive"))
+
+
+_CLIENT: Optional[BrokerClient] = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def get_broker_client() -> BrokerClient:
+    """Return the per-process broker client (recreated after fork or address change)."""
+    global _CLIENT
+    address = broker_address()
+    if not address:
+        raise BrokerError("MESHCORE_BROKER not configured")
+    with _CLIENT_LOCK:
+        if _CLIENT is None or _CLIENT.address != address or _CLIENT._pid != os.getpid():
+            _CLIENT = BrokerClient(address)
+        return _CLIENT
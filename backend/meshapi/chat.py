@@ -0,0 +1,314 @@
+"""Shared parsing of inline chat lines (``Name (D): text``) in CLI output.
+
+The one-shot CLI paths in ``services`` and the interactive session reader both
+feed raw text through :func:`parse_chat_segments`. Sender names are resolved
+with a :class:`ContactNameIndex`, a trie of contact names stored reversed: the
+longest known name ending right before ``(D):`` is found by walking the text
+backwards, so a lookup costs the length of the name rather than one
+``endswith`` per contact. The index is kept in process memory and rebuilt only
+when the ``contact_names`` data version moves (bumped by the ingest path when
+a contact is added or renamed), which is checked at most every
+``CHAT_NAME_INDEX_CHECK_S`` seconds (default 5).
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.db import router
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from .models import Contact, Message
+from .versioning import KEY_CONTACT_NAMES, get_versions
+
+
+DELIM_RE = re.compile(r"\(D\):\s*")
+PROMPT_NAME_RE = re.compile(r"(?<!\w)([A-Za-z0-9][A-Za-z0-9_-]{0,63})🭨")
+_TAIL_NAME_RE = re.compile(r"([A-Za-z0-9 _\-]{1,64})\s*$")
+PROMPT_SEP = "🭨"
+
+# Identical incoming texts from the same sender within this window are echoes
+_DEDUPE_S = 3
+# How long after an inline copy (no device timestamp) the same message may
+# still arrive with its device timestamp from sync_msgs
+_CROSS_PATH_S = 120
+# Dedup keys of recently stored messages kept per process
+_RECENT_KEYS_MAX = 2048
+
+
+class ContactNameIndex:
+    """Reversed trie over contact names for longest-suffix lookups."""
+
+    # Trie nodes are dicts keyed by character; this key holds the match payload
+    _HIT = None
+
+    def __init__(self, entries: Iterable[Tuple[str, Optional[int], Optional[str]]] = ()) -> None:
+        self._root: Dict[Any, Any] = {}
+        self.size = 0
+        for name, contact_id, public_key in entries:
+            self.add(name, contact_id, public_key)
+
+    def add(self, name: str, contact_id: Optional[int] = None, public_key: Optional[str] = None) -> None:
+        if not name:
+            return
+        node = self._root
+        for ch in reversed(name):
+            node = node.setdefault(ch, {})
+        if self._HIT not in node:
+            self.size += 1
+            # First entry per name wins (callers add the most recently seen first)
+            node[self._HIT] = (name, contact_id, public_key)
+
+    def longest_suffix(self, text: str, start: int = 0, end: Optional[int] = None) -> Optional[Tuple[str, Optional[int], Optional[str]]]:
+        """Return (name, contact_id, public_key) of the longest name ending at `end`.
+
+        The match must lie within ``text[start:end]``.
+        """
+        node = self._root
+        best = None
+        i = len(text) if end is None else end
+        while i > start:
+            node = node.get(text[i - 1])
+            if node is None:
+                break
+            i -= 1
+            hit = node.get(self._HIT)
+            if hit is not None:
+                best = hit
+        return best
+
+    def lookup(self, name: str) -> Optional[Tuple[str, Optional[int], Optional[str]]]:
+        hit = self.longest_suffix(name)
+        return hit if hit is not None and hit[0] == name else None
+
+
+def _check_interval_s() -> float:
+    try:
+        return max(0.0, float(os.getenv("CHAT_NAME_INDEX_CHECK_S", "5")))
+    except Exception:
+        return 5.0
+
+
+def build_name_index() -> ContactNameIndex:
+    rows = (
+        Contact.objects.exclude(name="")
+        .order_by("name", "-last_seen")
+        .values_list("name", "id", "public_key")
+    )
+    return ContactNameIndex(rows.iterator(chunk_size=2000))
+
+
+_index: Optional[ContactNameIndex] = None
+_index_version: Optional[int] = None
+_checked_at = 0.0
+_index_lock = threading.Lock()
+
+
+def get_name_index() -> ContactNameIndex:
+    """Return the process-wide index, rebuilding it after contact changes."""
+    global _index, _index_version, _checked_at
+    idx = _index
+    if idx is not None and time.monotonic() - _checked_at < _check_interval_s():
+        return idx
+    with _index_lock:
+        now = time.monotonic()
+        if _index is not None and now - _checked_at < _check_interval_s():
+            return _index
+        try:
+            version = get_versions([KEY_CONTACT_NAMES])[KEY_CONTACT_NAMES][0]
+            if _index is None or version != _index_version:
+                _index = build_name_index()
+                _index_version = version
+        except Exception:
+            # Keep serving the previous index if the database is unavailable
+            if _index is None:
+                _index = ContactNameIndex()
+        _checked_at = now
+        return _index
+
+
+def invalidate_name_index() -> None:
+    """Force a rebuild on the next lookup in this process."""
+    global _index_version, _checked_at
+    with _index_lock:
+        _index_version = None
+        _checked_at = 0.0
+
+
+class ChatSegment:
+    """One chat message found in raw CLI output."""
+
+    __slots__ = ("name", "text", "contact_id", "public_key")
+
+    def __init__(self, name: str, text: str, contact_id: Optional[int] = None, public_key: Optional[str] = None) -> None:
+        self.name = name
+        self.text = text
+        self.contact_id = contact_id
+        self.public_key = public_key
+
+
+def parse_chat_segments(raw: str, index: Optional[ContactNameIndex] = None) -> List[ChatSegment]:
+    """Split `raw` into chat segments.
+
+    Handles several messages on one line and prompt echoes (``NAME🭨``). The
+    sender is the longest known contact name before ``(D):``; unknown senders
+    fall back to the trailing word characters.
+    """
+    if not raw or "(D):" not in raw:
+        return []
+    delims = list(DELIM_RE.finditer(raw))
+    if not delims:
+        return []
+    if index is None:
+        index = get_name_index()
+    prompt_names = PROMPT_NAME_RE.findall(raw)
+    prompt_positions = [m.start() for m in re.finditer(PROMPT_SEP, raw)]
+
+    # First pass: sender name and where it starts, for each delimiter
+    parts = []
+    for i, d in enumerate(delims):
+        name_end = d.start()
+        while name_end > 0 and raw[name_end - 1].isspace():
+            name_end -= 1
+        left_bound = delims[i - 1].end() if i > 0 else 0
+        if prompt_positions:
+            left_bound = max(left_bound, max([p + 1 for p in prompt_positions if p < name_end], default=0))
+        hit = index.longest_suffix(raw, left_bound, name_end)
+        if hit is not None:
+            name, contact_id, public_key = hit
+            name_start = name_end - len(name)
+        else:
+            contact_id = public_key = None
+            window = raw[left_bound:name_end]
+            m_tail = _TAIL_NAME_RE.search(window[-64:])
+            name = m_tail.group(1).strip() if m_tail else ""
+            if not name:
+                # As a last resort, use up to 16 chars right before '(D):'
+                name = window[-16:].strip()
+            name_start = name_end - len(name)
+        parts.append((name, name_start, d.end(), contact_id, public_key))
+
+    # Second pass: each text runs to the next sender or prompt
+    out: List[ChatSegment] = []
+    for i, (name, _name_start, text_start, contact_id, public_key) in enumerate(parts):
+        name = name.strip()
+        if not name:
+            continue
+        text_end = len(raw)
+        if i + 1 < len(parts):
+            text_end = min(text_end, parts[i + 1][1])
+        sep_pos = raw.find(PROMPT_SEP, text_start)
+        if sep_pos != -1:
+            text_end = min(text_end, sep_pos)
+        text = raw[text_start:text_end].strip()
+        for pn in prompt_names:
+            if pn and text.endswith(pn):
+                text = text[: -len(pn)].rstrip()
+                break
+        if text:
+            out.append(ChatSegment(name, text, contact_id, public_key))
+    return out
+
+
+def dedup_key(name: str, text: str, sender_ts: Optional[int] = None, at=None) -> str:
+    """Identity of an incoming message: sender, text and the device timestamp,
+    or the arrival time in `_DEDUPE_S` buckets when the device sent none."""
+    if sender_ts is not None:
+        stamp = f"t{int(sender_ts)}"
+    else:
+        stamp = f"b{int((at or timezone.now()).timestamp()) // _DEDUPE_S}"
+    return hashlib.sha1(f"in\x1f{name}\x1f{text}\x1f{stamp}".encode("utf-8")).hexdigest()
+
+
+_recent_keys: "OrderedDict[str, None]" = OrderedDict()
+_recent_lock = threading.Lock()
+
+
+def _seen(keys: List[str]) -> bool:
+    with _recent_lock:
+        return any(k in _recent_keys for k in keys)
+
+
+def _remember(key: str) -> None:
+    with _recent_lock:
+        _recent_keys[key] = None
+        _recent_keys.move_to_end(key)
+        while len(_recent_keys) > _RECENT_KEYS_MAX:
+            _recent_keys.popitem(last=False)
+
+
+def _bucket_copy_exists(name: str, text: str, since) -> bool:
+    """Whether an inline copy of this message (keyed by arrival bucket) was stored since `since`."""
+    rows = Message.objects.filter(direction="in", name=name, text=text, ts__gte=since).values_list("dedup_key", "ts")
+    return any(key == dedup_key(name, text, None, ts) for key, ts in rows[:20])
+
+
+def store_incoming_message(
+    *, name: str, text: str, raw: str = "", contact_id: Optional[int] = None,
+    public_key: Optional[str] = None, sender_ts: Optional[int] = None,
+) -> Optional[Message]:
+    """Insert an incoming message unless it is a duplicate; returns the new row.
+
+    Recently stored keys are remembered per process, so echoes are usually
+    dropped without a query. Otherwise the unique `dedup_key` decides: the
+    insert skips conflicts and a missing row means another writer was first.
+    A copy with a device timestamp (from ``sync_msgs``) is also a duplicate of
+    an inline copy of the same sender and text stored in the last
+    `_CROSS_PATH_S` seconds, since that one was keyed by its arrival time.
+    `post_save` is sent only for a row this call inserted.
+    """
+    now = timezone.now()
+    key = dedup_key(name, text, sender_ts, now)
+    keys = [key]
+    if sender_ts is None:
+        # An echo just across a bucket boundary
+        keys.append(dedup_key(name, text, None, now - timedelta(seconds=_DEDUPE_S)))
+    if _seen(keys):
+        return None
+    msg = Message(
+        contact_id=contact_id, name=name, public_key=public_key, direction="in",
+        text=text, ts=now, raw=raw, dedup_key=key,
+    )
+    try:
+        if sender_ts is not None and _bucket_copy_exists(name, text, now - timedelta(seconds=_CROSS_PATH_S)):
+            _remember(key)
+            return None
+        Message.objects.bulk_create([msg], ignore_conflicts=True)
+        # Conflicts are skipped without a pk, so look the row up: ours carries this call's arrival time
+        stored = Message.objects.filter(dedup_key=key).first()
+    except Exception:
+        return None
+    _remember(key)
+    if stored is None or stored.ts != now:
+        return None
+    post_save.send(sender=Message, instance=stored, created=True, update_fields=None, raw=False, using=router.db_for_write(Message))
+    return stored
+
+
+def store_chat_segments(raw: str, segments: List[ChatSegment]) -> int:
+    """Persist segments as incoming messages, skipping duplicates; returns rows created."""
+    created = 0
+    for seg in segments:
+        if seg.contact_id is None:
+            # Not in the index (unknown sender or contact added since the last rebuild)
+            try:
+                contact = Contact.objects.filter(name=seg.name).order_by("-last_seen").values_list("id", "public_key").first()
+            except Exception:
+                contact = None
+            if contact:
+                seg.contact_id, seg.public_key = contact
+        if store_incoming_message(
+            name=seg.name, text=seg.text, raw=raw, contact_id=seg.contact_id, public_key=seg.public_key,
+        ) is not None:
+            created += 1
+    return created
+
+
+def extract_and_store_chats(raw: str) -> int:
+    """Parse inline chat snippets from `raw` and store them as incoming messages."""
+    return store_chat_segments(raw, parse_chat_segments(raw))
@@ -0,0 +1,394 @@
+"""Deadline-driven scheduler for the background contact collector.
+
+Every (contact, command) pair is a task with its own next-due time kept in a
+min-heap. A bounded pool of workers executes due tasks, so at most
+``max_inflight`` radio requests are outstanding at any time; without a
+``MESHCORE_BROKER`` every request is its own meshcore-cli process on the same
+device, so ``max_inflight`` is forced to 1. Unread messages
+are polled from a dedicated lane that never waits behind the contact sweep;
+another lane folds new telemetry into rollups and applies raw-row and node
+telemetry retention, a small worker pool runs queued automation actions (see
+meshapi.actions), and an optional lane exports new rows to MQTT (see
+meshapi.mqtt_export).
+Due times are mirrored to ``CollectorTask`` rows so a restart resumes the
+schedule instead of polling every contact at once.
+"""
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .actions import ActionWorkerPool
+from .airtime import AirtimeDeferred, deferral_s as airtime_deferral_s
+from .broker import broker_address
+from .dispatch import PRIORITY_COLLECTOR, command_priority
+from .ingest import get_ingest_buffer
+from .models import CollectorTask
+from .mqtt_export import export_pending
+from .mqtt_publisher import get_mqtt_publisher
+from .nodeinfo import purge_node_telemetry
+from .rollup import purge_raw_telemetry, rollup_telemetry
+from .services import (
+    _run_contacts_command,
+    _run_contact_info_command,
+    _run_req_status_command,
+    _run_req_telemetry_command,
+    get_collector_interval_default,
+    get_collector_enable_req_telemetry_default,
+    get_collector_enable_req_status_default,
+    ingest_contacts_snapshot,
+    sync_unread_messages,
+)
+
+
+CMD_CONTACT_INFO = "contact_info"
+CMD_REQ_STATUS = "req_status"
+CMD_REQ_TELEMETRY = "req_telemetry"
+
+COMMANDS: Dict[str, Callable[[str], Any]] = {
+    CMD_CONTACT_INFO: _run_contact_info_command,
+    CMD_REQ_STATUS: _run_req_status_command,
+    CMD_REQ_TELEMETRY: _run_req_telemetry_command,
+}
+
+# Retry delay after a failed task: doubles per consecutive failure, capped by the interval
+_RETRY_BASE_S = 30.0
+
+
+def contact_names(items: List[Any]) -> List[str]:
+    """Return CLI-addressable names from a `contacts` payload."""
+    names: List[str] = []
+    for it in items:
+        n = None
+        if isinstance(it, dict):
+            # Prefer human-readable name, but fall back to public_key (CLI can often resolve by key/prefix)
+            n = it.get("name") or it.get("adv_name") or it.get("display_name") or it.get("label") or it.get("public_key")
+        elif isinstance(it, str):
+            n = it
+        if n:
+            names.append(str(n))
+    return names
+
+
+class _Task:
+    __slots__ = ("target", "command", "due", "failures", "running")
+
+    def __init__(self, target: str, command: str, due: float, failures: int = 0) -> None:
+        self.target = target
+        self.command = command
+        self.due = due
+        self.failures = failures
+        self.running = False
+
+
+class CollectorScheduler:
+    """Run collector tasks by deadline with a bounded number of in-flight requests."""
+
+    def __init__(
+        self,
+        *,
+        min_interval: int = 30,
+        max_inflight: int = 2,
+        msg_poll_s: float = 5.0,
+        rollup_s: float = 300.0,
+        action_workers: int = 2,
+        mqtt_export_s: float = 0.0,
+        log: Optional[Callable[[str], None]] = None,
+        debug: bool = False,
+    ) -> None:
+        self.min_interval = max(5, int(min_interval))
+        self.max_inflight = max(1, int(max_inflight))
+        self._log = log or (lambda msg: None)
+        if self.max_inflight > 1 and not broker_address():
+            # One-shot CLI processes would contend for the one device connection
+            self._log(f"max_inflight {self.max_inflight} needs MESHCORE_BROKER; running 1 request at a time")
+            self.max_inflight = 1
+        self.msg_poll_s = max(2.0, float(msg_poll_s))
+        self.rollup_s = float(rollup_s)
+        self.action_workers = max(0, int(action_workers))
+        self.mqtt_export_s = max(0.0, float(mqtt_export_s))
+        self.debug = debug
+        self._tasks: Dict[Tuple[str, str], _Task] = {}
+        self._heap: List[Tuple[float, int, str, str]] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._inflight = 0
+        self._stop = threading.Event()
+        self._pool = ThreadPoolExecutor(max_workers=self.max_inflight, thread_name_prefix="collector")
+        self.interval = self.min_interval
+        self.stats = {"ok": 0, "failed": 0, "deferred": 0, "messages": 0, "rolled_up": 0, "purged": 0, "exported": 0}
+        self._actions: Optional[ActionWorkerPool] = None
+
+    # --- schedule bookkeeping ---------------------------------------------
+
+    def _push(self, task: _Task) -> None:
+        heapq.heappush(self._heap, (task.due, next(self._seq), task.target, task.command))
+        self._wake.notify_all()
+
+    def _enabled_commands(self) -> List[str]:
+        cmds = []
+        if get_collector_enable_req_status_default():
+            cmds.append(CMD_REQ_STATUS)
+        if get_collector_enable_req_telemetry_default():
+            cmds.append(CMD_REQ_TELEMETRY)
+        return cmds
+
+    def load_persisted(self) -> int:
+        """Seed the heap from stored `CollectorTask` rows."""
+        rows = list(CollectorTask.objects.all().values_list("target", "command", "next_due", "failures"))
+        with self._lock:
+            for target, command, next_due, failures in rows:
+                if command not in COMMANDS:
+                    continue
+                task = _Task(target, command, next_due.timestamp(), failures or 0)
+                self._tasks[(target, command)] = task
+                self._push(task)
+        return len(rows)
+
+    def sync_targets(self, names: List[str], info_names: Optional[List[str]] = None) -> int:
+        """Align the task set with the current contact list and enabled commands.
+
+        `contact_info` is only scheduled for `info_names` (all names if None),
+        i.e. contacts whose data the bulk `contacts` ingest could not provide.
+        New pairs are due immediately; known pairs keep their deadlines. Returns
+        the number of tasks added.
+        """
+        wanted = {(n, c) for n in names for c in self._enabled_commands()}
+        wanted |= {(n, CMD_CONTACT_INFO) for n in (names if info_names is None else info_names)}
+        now = time.time()
+        added: List[_Task] = []
+        removed: Dict[str, List[str]] = {}
+        with self._lock:
+            for key in list(self._tasks):
+                if key not in wanted and not self._tasks[key].running:
+                    # Stale heap entries are skipped lazily when popped
+                    del self._tasks[key]
+                    removed.setdefault(key[1], []).append(key[0])
+            for target, command in sorted(wanted):
+                if (target, command) in self._tasks:
+                    continue
+                task = _Task(target, command, now)
+                self._tasks[(target, command)] = task
+                self._push(task)
+                added.append(task)
+        if added:
+            CollectorTask.objects.bulk_create(
+                [CollectorTask(target=t.target, command=t.command, next_due=timezone.now()) for t in added],
+                ignore_conflicts=True,
+            )
+        for command, targets in removed.items():
+            CollectorTask.objects.filter(command=command, target__in=targets).delete()
+        if names:
+            # Forget contacts that disappeared from the device list
+            CollectorTask.objects.exclude(target__in=set(names)).delete()
+        return len(added)
+
+    def _pop_due(self) -> Optional[_Task]:
+        """Return the next due task or None; caller holds the lock."""
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            due, _, target, command = heapq.heappop(self._heap)
+            task = self._tasks.get((target, command))
+            if task is None or task.running or task.due != due:
+                continue
+            return task
+        return None
+
+    def _seconds_until_next(self) -> float:
+        if not self._heap:
+            return 1.0
+        return max(0.0, min(1.0, self._heap[0][0] - time.time()))
+
+    # --- execution ----------------------------------------------------------
+
+    def _run_task(self, task: _Task) -> None:
+        try:
+            wait = airtime_deferral_s(f'{task.command} "{task.target}"', PRIORITY_COLLECTOR)
+        except Exception:
+            wait = 0.0
+        if wait > 0:
+            self._defer(task, wait)
+            close_old_connections()
+            return
+        ok = False
+        deferred = 0.0
+        try:
+            with command_priority(PRIORITY_COLLECTOR):
+                res = COMMANDS[task.command](task.target)
+            ok = res is not None
+            if self.debug:
+                self._log(f"{task.command} '{task.target}': {'ok' if ok else 'no data'}")
+        except AirtimeDeferred as e:
+            # Another process spent the budget after the check above
+            deferred = max(1.0, e.retry_after_s)
+        except Exception as e:
+            self._log(f"{task.command} failed for '{task.target}': {e}")
+        finally:
+            if deferred:
+                self._defer(task, deferred)
+            else:
+                self._finish(task, ok)
+            close_old_connections()
+
+    def _defer(self, task: _Task, delay: float) -> None:
+        """Reschedule without counting a failure (airtime budget too low)."""
+        delay = min(float(self.interval), max(_RETRY_BASE_S, delay))
+        with self._lock:
+            task.running = False
+            self._inflight -= 1
+            task.due = time.time() + delay
+            self.stats["deferred"] += 1
+            if self._tasks.get((task.target, task.command)) is task:
+                self._push(task)
+            self._wake.notify_all()
+        if self.debug:
+            self._log(f"{task.command} '{task.target}': deferred {delay:.0f}s (airtime budget)")
+
+    def _finish(self, task: _Task, ok: bool) -> None:
+        with self._lock:
+            task.running = False
+            self._inflight -= 1
+            task.failures = 0 if ok else task.failures + 1
+            delay = float(self.interval) if ok else min(float(self.interval), _RETRY_BASE_S * (2 ** (task.failures - 1)))
+            task.due = time.time() + delay
+            self.stats["ok" if ok else "failed"] += 1
+            if self._tasks.get((task.target, task.command)) is task:
+                self._push(task)
+            self._wake.notify_all()
+        try:
+            now = timezone.now()
+            CollectorTask.objects.filter(target=task.target, command=task.command).update(
+                next_due=now + timedelta(seconds=delay),
+                last_run_at=now,
+                last_ok=ok,
+                failures=task.failures,
+            )
+        except Exception:
+            pass
+
+    def _message_lane(self) -> None:
+        while not self._stop.is_set():
+            try:
+                with command_priority(PRIORITY_COLLECTOR):
+                    added = sync_unread_messages()
+                self.stats["messages"] += added
+                if self.debug:
+                    self._log(f"messages: +{added}")
+            except Exception as e:
+                if self.debug:
+                    self._log(f"messages poll failed: {e}")
+            finally:
+                close_old_connections()
+            self._stop.wait(self.msg_poll_s)
+
+    def _rollup_lane(self) -> None:
+        while not self._stop.wait(self.rollup_s):
+            try:
+                rolled = rollup_telemetry()
+                purged = purge_raw_telemetry()
+                node_purged = purge_node_telemetry()
+                self.stats["rolled_up"] += rolled["rows"]
+                self.stats["purged"] += purged["raw"] + node_purged
+                if rolled["rows"] or purged["raw"] or node_purged or self.debug:
+                    self._log(
+                        f"rollup: {rolled['rows']} rows into {rolled['buckets']} buckets, "
+                        f"purged {purged['raw']} raw rows / {purged['rollups']} buckets / {node_purged} node telemetry rows"
+                    )
+            except Exception as e:
+                self._log(f"rollup failed: {e}")
+            finally:
+                close_old_connections()
+
+    def _export_lane(self) -> None:
+        while not self._stop.wait(self.mqtt_export_s):
+            try:
+                result = export_pending()
+                sent = sum(r["published"] for r in result.values())
+                self.stats["exported"] += sent
+                if sent and self.debug:
+                    self._log("mqtt export: " + ", ".join(
+                        f"{name} {r['rows']} rows/{r['published']} sent" for name, r in result.items()
+                    ))
+            except Exception as e:
+                self._log(f"mqtt export failed: {e}")
+            finally:
+                close_old_connections()
+
+    def refresh_contacts(self) -> None:
+        try:
+            self.interval = max(self.min_interval, int(get_collector_interval_default()))
+        except Exception:
+            self.interval = max(self.min_interval, 300)
+        try:
+            with command_priority(PRIORITY_COLLECTOR):
+                items = _run_contacts_command()
+        except Exception as e:
+            self._log(f"contacts failed: {e}")
+            return
+        names = contact_names(items)
+        try:
+            info_names = ingest_contacts_snapshot(items)
+        except Exception as e:
+            self._log(f"contacts ingest failed: {e}")
+            info_names = None
+        added = self.sync_targets(names, info_names)
+        self._log(
+            f"contacts: {len(names)} entries ({len(names) if info_names is None else len(info_names)} need contact_info), "
+            f"{added} new tasks, {len(self._tasks)} scheduled "
+            f"(ok={self.stats['ok']} failed={self.stats['failed']} deferred={self.stats['deferred']} "
+            f"messages=+{self.stats['messages']})"
+        )
+        ing = get_ingest_buffer().stats()
+        self._log(
+            f"ingest: {ing['rows']} rows in {ing['flushes']} flushes, {ing['queries']} queries "
+            f"({ing['queries_saved']} saved, {ing['pending']} pending, {ing['errors']} failed flushes, {ing['dropped']} dropped)"
+        )
+        mq = get_mqtt_publisher().status()
+        if mq["enqueued"]:
+            self._log(
+                f"mqtt: {'connected' if mq['connected'] else 'disconnected'}, {mq['acked']} acked, "
+                f"{mq['failed']} failed, {mq['queued']} queued, {mq['inflight']} in flight, "
+                f"avg ack {mq['avg_ack_ms']} ms"
+            )
+
+    def run_forever(self) -> None:
+        self.load_persisted()
+        threading.Thread(target=self._message_lane, name="collector-messages", daemon=True).start()
+        if self.rollup_s > 0:
+            threading.Thread(target=self._rollup_lane, name="collector-rollup", daemon=True).start()
+        if self.mqtt_export_s > 0:
+            threading.Thread(target=self._export_lane, name="collector-mqtt-export", daemon=True).start()
+        if self.action_workers > 0:
+            self._actions = ActionWorkerPool(workers=self.action_workers, log=self._log)
+            self._actions.start()
+        next_refresh = 0.0
+        try:
+            while not self._stop.is_set():
+                if time.monotonic() >= next_refresh:
+                    self.refresh_contacts()
+                    close_old_connections()
+                    next_refresh = time.monotonic() + self.interval
+                with self._lock:
+                    task = self._pop_due() if self._inflight < self.max_inflight else None
+                    if task is None:
+                        self._wake.wait(self._seconds_until_next())
+                        continue
+                    task.running = True
+                    self._inflight += 1
+                self._pool.submit(self._run_task, task)
+        finally:
+            self._pool.shutdown(wait=False)
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._actions is not None:
+            self._actions.stop()
+        with self._lock:
+            self._wake.notify_all()
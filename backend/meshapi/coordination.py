@@ -0,0 +1,57 @@
+"""Cross-process single-flight built on `RefreshLease` rows.
+
+Web workers, the collector and management commands are separate processes, so
+module-level flags cannot keep them from running the same radio job at once.
+A lease is taken with one conditional ``UPDATE`` (free or expired, and not
+started within ``min_interval_s``); the database serializes competing updates,
+so exactly one caller wins. Others either skip the job or wait for the lease
+to be released and reuse what the holder stored.
+"""
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+from typing import Optional
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import RefreshLease
+
+
+def holder_id() -> str:
+    """Identify the calling thread across hosts/processes."""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"[:128]
+
+
+def try_acquire(key: str, ttl_s: float, min_interval_s: float = 0.0, holder: Optional[str] = None) -> Optional[str]:
+    """Take the lease for `key`; returns the holder token or None if busy/throttled."""
+    holder = holder or holder_id()
+    now = timezone.now()
+    RefreshLease.objects.bulk_create([RefreshLease(key=key)], ignore_conflicts=True)
+    qs = RefreshLease.objects.filter(key=key).filter(Q(holder="") | Q(expires_at__lt=now))
+    if min_interval_s > 0:
+        qs = qs.filter(Q(last_started_at__isnull=True) | Q(last_started_at__lt=now - timedelta(seconds=min_interval_s)))
+    updated = qs.update(holder=holder, expires_at=now + timedelta(seconds=ttl_s), last_started_at=now)
+    return holder if updated else None
+
+
+def release(key: str, holder: str) -> None:
+    now = timezone.now()
+    RefreshLease.objects.filter(key=key, holder=holder).update(holder="", expires_at=now, last_finished_at=now)
+
+
+def is_held(key: str) -> bool:
+    now = timezone.now()
+    return RefreshLease.objects.filter(key=key).exclude(holder="").filter(expires_at__gte=now).exists()
+
+
+def wait_released(key: str, timeout_s: float, poll_s: float = 0.25) -> bool:
+    """Block until nobody holds `key` (True) or `timeout_s` passes (False)."""
+    deadline = time.monotonic() + timeout_s
+    while is_held(key):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(poll_s)
+    return True
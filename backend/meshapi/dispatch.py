@@ -0,0 +1,201 @@
+"""Priority command queue in front of the single device session.
+
+Every device command used to wait on one lock in arrival order, so a message
+send could sit behind a collector ``req_status`` that was waiting out its
+timeout. :class:`CommandDispatcher` queues commands as futures ordered by
+priority (interactive sends, then UI refreshes, then collector polling) and
+runs them one at a time on a worker thread.
+
+- Each command has a deadline; if it is still queued when the deadline passes,
+  it fails with ``TimeoutError`` without being sent. A running command gets
+  only the time left before its deadline.
+- Queued commands can be cancelled through their future.
+- :meth:`CommandDispatcher.run` blocks the calling thread and
+  :meth:`CommandDispatcher.run_async` awaits in asyncio; both sit on the same
+  queue.
+
+Callers choose the priority with :func:`command_priority`, a thread-local
+context that the service layer passes on to the broker. :meth:`stats` reports
+queue depth and wait times per priority.
+"""
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_UI = 10
+PRIORITY_COLLECTOR = 20
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_UI: "ui",
+    PRIORITY_COLLECTOR: "collector",
+}
+
+# Weight of the newest sample in the moving wait-time average
+_EWMA_ALPHA = 0.2
+
+_context = threading.local()
+
+
+def current_priority() -> int:
+    """Priority of commands issued by this thread (UI unless set)."""
+    return getattr(_context, "priority", PRIORITY_UI)
+
+
+@contextmanager
+def command_priority(priority: int) -> Iterator[None]:
+    """Run device commands issued inside the block at `priority`."""
+    previous = getattr(_context, "priority", None)
+    _context.priority = priority
+    try:
+        yield
+    finally:
+        if previous is None:
+            del _context.priority
+        else:
+            _context.priority = previous
+
+
+def parse_priority(value: Any) -> int:
+    """Accept a priority number or name; unknown values mean UI."""
+    if isinstance(value, str):
+        for num, name in PRIORITY_NAMES.items():
+            if value == name:
+                return num
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return PRIORITY_UI
+
+
+class _Job:
+    __slots__ = ("call", "priority", "deadline", "future", "enqueued")
+
+    def __init__(self, call: Callable[[float], Any], priority: int, deadline: float) -> None:
+        self.call = call
+        self.priority = priority
+        self.deadline = deadline
+        self.future: Future = Future()
+        self.enqueued = time.monotonic()
+
+
+class CommandDispatcher:
+    """Runs submitted callables one at a time, highest priority first."""
+
+    def __init__(self, name: str = "meshcore-dispatch") -> None:
+        self._name = name
+        self._heap: List[Tuple[int, int, _Job]] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._thread: Optional[threading.Thread] = None
+        self._running: Optional[_Job] = None
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "expired": 0}
+        self._waits: Dict[int, Dict[str, float]] = {}
+
+    def _ensure_worker(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._worker, name=self._name, daemon=True)
+            self._thread.start()
+
+    def submit(self, call: Callable[[float], Any], timeout: float, priority: Optional[int] = None) -> Future:
+        """Queue `call(remaining_s)`; it must finish within `timeout` seconds from now."""
+        job = _Job(call, current_priority() if priority is None else priority, time.monotonic() + timeout)
+        with self._lock:
+            heapq.heappush(self._heap, (job.priority, next(self._seq), job))
+            self._counters["submitted"] += 1
+            self._ensure_worker()
+            self._cond.notify()
+        return job.future
+
+    def run(self, call: Callable[[float], Any], timeout: float, priority: Optional[int] = None) -> Any:
+        """Submit and block for the result; a queued job is cancelled if the wait times out."""
+        future = self.submit(call, timeout, priority)
+        try:
+            # The worker enforces the deadline; the extra second covers handing back the result
+            return future.result(timeout=timeout + 1.0)
+        except BaseException:
+            future.cancel()
+            raise
+
+    async def run_async(self, call: Callable[[float], Any], timeout: float, priority: Optional[int] = None) -> Any:
+        """Asyncio variant of :meth:`run`; cancelling the awaiting task cancels a queued job."""
+        future = self.submit(call, timeout, priority)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout + 1.0)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def _worker(self) -> None:
+        while True:
+            with self._lock:
+                while not self._heap:
+                    self._cond.wait()
+                _prio, _seq, job = heapq.heappop(self._heap)
+                if not job.future.set_running_or_notify_cancel():
+                    self._counters["cancelled"] += 1
+                    continue
+                now = time.monotonic()
+                self._record_wait(job.priority, now - job.enqueued)
+                remaining = job.deadline - now
+                if remaining <= 0:
+                    self._counters["expired"] += 1
+                    job.future.set_exception(TimeoutError("command deadline passed while queued"))
+                    continue
+                self._running = job
+            try:
+                result = job.call(remaining)
+            except BaseException as e:
+                with self._lock:
+                    self._running = None
+                    self._counters["failed"] += 1
+                job.future.set_exception(e)
+            else:
+                with self._lock:
+                    self._running = None
+                    self._counters["completed"] += 1
+                job.future.set_result(result)
+
+    def _record_wait(self, priority: int, wait_s: float) -> None:
+        w = self._waits.setdefault(priority, {"count": 0, "avg_wait_s": 0.0, "max_wait_s": 0.0})
+        w["count"] += 1
+        w["avg_wait_s"] = wait_s if w["count"] == 1 else (1 - _EWMA_ALPHA) * w["avg_wait_s"] + _EWMA_ALPHA * wait_s
+        w["max_wait_s"] = max(w["max_wait_s"], wait_s)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, oldest queued wait and per-priority wait times."""
+        now = time.monotonic()
+        with self._lock:
+            depth: Dict[str, int] = {}
+            oldest = 0.0
+            for prio, _seq, job in self._heap:
+                if job.future.cancelled():
+                    continue
+                key = PRIORITY_NAMES.get(prio, str(prio))
+                depth[key] = depth.get(key, 0) + 1
+                oldest = max(oldest, now - job.enqueued)
+            running = self._running
+            return {
+                "queued": sum(depth.values()),
+                "queued_by_priority": depth,
+                "oldest_wait_s": round(oldest, 3),
+                "running": PRIORITY_NAMES.get(running.priority, str(running.priority)) if running else None,
+                **self._counters,
+                "wait_by_priority": {
+                    PRIORITY_NAMES.get(p, str(p)): {
+                        "count": int(w["count"]),
+                        "avg_wait_s": round(w["avg_wait_s"], 3),
+                        "max_wait_s": round(w["max_wait_s"], 3),
+                    }
+                    for p, w in sorted(self._waits.items())
+                },
+            }
+
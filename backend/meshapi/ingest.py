@@ -0,0 +1,379 @@
+"""Write-behind ingest of contact touches and telemetry snapshots.
+
+`_persist_contact_info` used to cost four to five queries per CLI response
+(get_or_create, save/update, telemetry insert, orphan-message update). The
+:class:`IngestBuffer` collects those snapshots in memory and writes them in
+batches every ``INGEST_FLUSH_MS`` milliseconds or ``INGEST_FLUSH_ROWS`` rows,
+whichever comes first. A batch is persisted with a constant number of
+statements: contact upserts via ``bulk_create(update_conflicts=True)``, one id
+lookup, one telemetry insert, a ``ContactLatest`` insert and conditional
+update (never replacing a newer stored row), one stream event and one
+orphan-message probe. The writes of a batch commit together; a batch that
+fails goes back to the front of the queue and is retried with backoff, and
+after ``_FLUSH_ATTEMPTS`` failures its rows are written one by one so only the
+rows that keep failing are dropped.
+"""
+import atexit
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.db import close_old_connections, transaction
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+from .models import Contact, ContactLatest, ContactTelemetry, Message, StreamEvent
+from .stream import publish_event
+from .versioning import KEY_CONTACT_NAMES, KEY_CONTACTS, KEY_MESSAGES, bump_version
+
+
+logger = logging.getLogger("meshapi.ingest")
+
+# Statements a per-row write of one snapshot needs (used for the savings
+# report): the former path measured 4 for a known contact (get_or_create
+# lookup, last_seen update, telemetry insert, orphan-message update) and 8 for
+# a new one, plus the ContactLatest upsert and stream event it would need now
+_QUERIES_PER_ROW_UNBATCHED = 6
+
+# Failed flushes of a snapshot before it is written on its own
+_FLUSH_ATTEMPTS = 5
+# Upper bound of the delay between retries of a failed flush
+_RETRY_MAX_S = 30.0
+
+# Telemetry fields pushed to stream clients with each flush
+_STREAM_FIELDS = ("rssi", "snr", "battery_mv", "battery_percent", "adv_lat", "adv_lon", "last_advert")
+
+
+def _parse_battery(payload: Dict[str, Any]) -> Tuple[Optional[int], Optional[float]]:
+    """Battery parsing heuristics (from various CLI payloads): return (mV, percent)."""
+    mv: Optional[int] = None
+    pct: Optional[float] = None
+    # candidates
+    candidates_mv = [
+        payload.get("battery_mv"), payload.get("bat_mv"), payload.get("vbat_mv"), payload.get("vbat"), payload.get("vbatt"),
+    ]
+    candidates_pct = [
+        payload.get("battery_percent"), payload.get("battery"), payload.get("bat_percent"), payload.get("soc"), payload.get("charge"),
+    ]
+    # Some responses use 'level' for battery; interpret by range
+    lvl = payload.get("level")
+    if lvl is not None:
+        try:
+            val = float(lvl)
+            if val > 1000:
+                mv = int(val)
+            elif 0 <= val <= 100:
+                pct = float(val)
+            elif 0.0 < val < 1.0:
+                pct = float(val) * 100.0
+        except Exception:
+            pass
+    # Direct candidates
+    for v in candidates_mv:
+        try:
+            if v is None:
+                continue
+            vi = int(v)
+            if vi > 1000:
+                mv = vi
+                break
+        except Exception:
+            continue
+    for v in candidates_pct:
+        try:
+            if v is None:
+                continue
+            vf = float(v)
+            if 0.0 <= vf <= 1.0:
+                pct = vf * 100.0
+                break
+            if 0.0 <= vf <= 100.0:
+                pct = vf
+                break
+        except Exception:
+            continue
+    return mv, pct
+
+
+def _telemetry_row(contact_id: int, info: Dict[str, Any], adv_name: str, fetched_at) -> ContactTelemetry:
+    bat_mv, bat_pct = _parse_battery(info)
+    return ContactTelemetry(
+        contact_id=contact_id,
+        fetched_at=fetched_at,
+        adv_name=adv_name or "",
+        last_advert=info.get("last_advert"),
+        adv_lat=info.get("adv_lat"),
+        adv_lon=info.get("adv_lon"),
+        rssi=info.get("rssi"),
+        snr=info.get("snr"),
+        battery_mv=bat_mv,
+        battery_percent=bat_pct,
+        type=info.get("type"),
+        flags=info.get("flags"),
+        out_path_len=info.get("out_path_len"),
+        out_path=info.get("out_path") or "",
+        lastmod=info.get("lastmod"),
+        raw=info,
+    )
+
+
+class ContactSnapshot:
+    """One pending contact touch + telemetry row."""
+
+    __slots__ = ("info", "public_key", "adv_name", "fetched_at", "attempts")
+
+    def __init__(self, info: Dict[str, Any], fetched_at=None) -> None:
+        public_key = info.get("public_key")
+        self.info = info
+        self.public_key: Optional[str] = public_key if isinstance(public_key, str) and public_key else None
+        self.adv_name: str = info.get("adv_name") or info.get("name") or ""
+        self.fetched_at = fetched_at or timezone.now()
+        self.attempts = 0
+
+
+def _upsert_latest(newest: Dict[int, ContactTelemetry]) -> int:
+    """Copy each contact's newest row to ContactLatest unless a newer one is stored; returns statements issued."""
+    latest = [
+        ContactLatest(contact_id=cid, **{f: getattr(r, f) for f in ContactLatest.COPY_FIELDS})
+        for cid, r in newest.items()
+    ]
+    queries = 0
+    for start in range(0, len(latest), 500):
+        chunk = latest[start:start + 500]
+        queries += 2
+        ContactLatest.objects.bulk_create(chunk, ignore_conflicts=True)
+        # A flush that ran late (or another process) may already have stored a newer snapshot
+        incoming = Case(
+            *[When(contact_id=row.contact_id, then=Value(row.fetched_at)) for row in chunk],
+            output_field=DateTimeField(),
+        )
+        ContactLatest.objects.filter(fetched_at__lte=incoming).bulk_update(
+            chunk, list(ContactLatest.COPY_FIELDS), batch_size=len(chunk),
+        )
+    return queries
+
+
+def _write_batch(snapshots: List[ContactSnapshot]) -> Tuple[int, Dict[str, str], Dict[str, int], Dict[int, ContactTelemetry], bool]:
+    """Contact, telemetry and latest-row writes of a batch (run in one transaction)."""
+    queries = 0
+    now = timezone.now()
+    newest: Dict[int, ContactTelemetry] = {}
+
+    # Collapse per key: the latest non-empty name wins
+    names_by_key: Dict[str, str] = {}
+    for s in snapshots:
+        if s.public_key:
+            if s.adv_name or s.public_key not in names_by_key:
+                names_by_key[s.public_key] = s.adv_name
+
+    # Upsert contacts; entries without a name must not clear a known one
+    named = [Contact(public_key=k, name=n, first_seen=now, last_seen=now) for k, n in names_by_key.items() if n]
+    unnamed = [Contact(public_key=k, name="", first_seen=now, last_seen=now) for k, n in names_by_key.items() if not n]
+    names_changed = False
+    if named:
+        queries += 1
+        known = dict(Contact.objects.filter(public_key__in=[c.public_key for c in named]).values_list("public_key", "name"))
+        names_changed = any(known.get(c.public_key) != c.name for c in named)
+        queries += 1
+        Contact.objects.bulk_create(
+            named, update_conflicts=True, unique_fields=["public_key"], update_fields=["name", "last_seen"], batch_size=500,
+        )
+    if unnamed:
+        queries += 1
+        Contact.objects.bulk_create(
+            unnamed, update_conflicts=True, unique_fields=["public_key"], update_fields=["last_seen"], batch_size=500,
+        )
+    ids: Dict[str, int] = {}
+    if names_by_key:
+        queries += 1
+        ids = dict(Contact.objects.filter(public_key__in=list(names_by_key)).values_list("public_key", "id"))
+
+    # Resolve name-only snapshots in one query (after the upsert, so contacts
+    # created in this very batch are found too)
+    by_name: Dict[str, int] = {}
+    name_only = {s.adv_name for s in snapshots if not s.public_key and s.adv_name}
+    if name_only:
+        queries += 1
+        for cid, name in Contact.objects.filter(name__in=name_only).order_by("-last_seen").values_list("id", "name"):
+            by_name.setdefault(name, cid)
+    if by_name:
+        queries += 1
+        Contact.objects.filter(id__in=set(by_name.values())).update(last_seen=now)
+
+    rows: List[ContactTelemetry] = []
+    for s in snapshots:
+        cid = ids.get(s.public_key) if s.public_key else by_name.get(s.adv_name)
+        if cid is not None:
+            rows.append(_telemetry_row(cid, s.info, s.adv_name, s.fetched_at))
+    if rows:
+        queries += 1
+        ContactTelemetry.objects.bulk_create(rows, batch_size=1000)
+        # Keep the denormalized latest row per contact in step with the inserts
+        for r in rows:
+            cur = newest.get(r.contact_id)
+            if cur is None or r.fetched_at >= cur.fetched_at:
+                newest[r.contact_id] = r
+        queries += _upsert_latest(newest)
+    return queries, names_by_key, ids, newest, names_changed
+
+
+def persist_contact_batch(snapshots: List[ContactSnapshot]) -> int:
+    """Write a batch of snapshots; return the number of statements issued.
+
+    Snapshots with a public key upsert their contact; snapshots with only a
+    name attach to the most recently seen contact of that name and are dropped
+    when none exists (same rules as the former per-row path). Contacts,
+    telemetry and latest rows commit together; the stream event, message
+    reconciliation and version bumps follow the commit.
+    """
+    if not snapshots:
+        return 0
+    with transaction.atomic():
+        queries, names_by_key, ids, newest, names_changed = _write_batch(snapshots)
+    if newest:
+        queries += 1
+        key_by_id = {cid: k for k, cid in ids.items()}
+        publish_event(StreamEvent.KIND_TELEMETRY, {
+            "items": [
+                {
+                    "public_key": key_by_id.get(cid),
+                    "name": r.adv_name,
+                    "fetched_at": r.fetched_at,
+                    **{f: getattr(r, f) for f in _STREAM_FIELDS},
+                }
+                for cid, r in newest.items()
+            ],
+        })
+
+    # Reconcile past messages that arrived before their contact was known
+    name_to_key = {n: k for k, n in names_by_key.items() if n}
+    if name_to_key:
+        try:
+            queries += 1
+            orphan_names = set(
+                Message.objects.filter(public_key__isnull=True, name__in=list(name_to_key)).values_list("name", flat=True)
+            )
+            for n in orphan_names:
+                k = name_to_key[n]
+                queries += 1
+                Message.objects.filter(name=n, public_key__isnull=True).update(public_key=k, contact_id=ids.get(k))
+            if orphan_names:
+                queries += 1
+                bump_version(KEY_MESSAGES)
+        except Exception:
+            pass
+    queries += 1
+    bump_version(KEY_CONTACTS)
+    if names_changed:
+        queries += 1
+        bump_version(KEY_CONTACT_NAMES)
+    return queries
+
+
+class IngestBuffer:
+    """Collect contact snapshots and flush them in batches from a background thread."""
+
+    def __init__(self, flush_ms: int = 500, flush_rows: int = 200) -> None:
+        self.flush_s = max(0.01, flush_ms / 1000.0)
+        self.flush_rows = max(1, flush_rows)
+        self._pending: List[ContactSnapshot] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Consecutive failed flushes; the flusher backs off while this is non-zero
+        self._failures = 0
+        self._stats = {"rows": 0, "flushes": 0, "queries": 0, "errors": 0, "dropped": 0}
+
+    def add(self, info: Dict[str, Any]) -> None:
+        snap = ContactSnapshot(info)
+        if not snap.public_key and not snap.adv_name:
+            return
+        with self._lock:
+            self._pending.append(snap)
+            full = len(self._pending) >= self.flush_rows
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="ingest-flusher", daemon=True)
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def flush(self) -> int:
+        """Write everything pending now; returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                queries = persist_contact_batch(batch)
+            except Exception as e:
+                self._stats["errors"] += 1
+                self._failures += 1
+                logger.warning("ingest flush of %d rows failed (attempt %d): %s", len(batch), self._failures, e)
+                for snap in batch:
+                    snap.attempts += 1
+                retry = [snap for snap in batch if snap.attempts < _FLUSH_ATTEMPTS]
+                with self._lock:
+                    # Ahead of anything that arrived meanwhile, so rows keep their order
+                    self._pending[:0] = retry
+                return self._write_each([snap for snap in batch if snap.attempts >= _FLUSH_ATTEMPTS])
+            self._failures = 0
+            self._stats["rows"] += len(batch)
+            self._stats["flushes"] += 1
+            self._stats["queries"] += queries
+            return len(batch)
+
+    def _write_each(self, snapshots: List[ContactSnapshot]) -> int:
+        """Write snapshots that keep failing as a batch one at a time, dropping the bad ones."""
+        written = 0
+        for snap in snapshots:
+            try:
+                self._stats["queries"] += persist_contact_batch([snap])
+            except Exception as e:
+                self._stats["dropped"] += 1
+                logger.error("ingest dropped snapshot of %s: %s", snap.public_key or snap.adv_name, e)
+                continue
+            self._stats["rows"] += 1
+            written += 1
+        return written
+
+    def _run(self) -> None:
+        while True:
+            delay = self.flush_s
+            if self._failures:
+                delay = min(_RETRY_MAX_S, self.flush_s * 2 ** self._failures)
+            self._wake.wait(delay)
+            self._wake.clear()
+            close_old_connections()
+            self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        s = dict(self._stats)
+        with self._lock:
+            s["pending"] = len(self._pending)
+        s["queries_saved"] = max(0, s["rows"] * _QUERIES_PER_ROW_UNBATCHED - s["queries"])
+        return s
+
+
+_BUFFER: Optional[IngestBuffer] = None
+_BUFFER_LOCK = threading.Lock()
+
+
+def get_ingest_buffer() -> IngestBuffer:
+    global _BUFFER
+    with _BUFFER_LOCK:
+        if _BUFFER is None:
+            try:
+                flush_ms = int(os.getenv("INGEST_FLUSH_MS", "500"))
+            except Exception:
+                flush_ms = 500
+            try:
+                flush_rows = int(os.getenv("INGEST_FLUSH_ROWS", "200"))
+            except Exception:
+                flush_rows = 200
+            _BUFFER = IngestBuffer(flush_ms=flush_ms, flush_rows=flush_rows)
+            # Do not lose buffered rows when a management command exits
+            atexit.register(_BUFFER.flush)
+        return _BUFFER
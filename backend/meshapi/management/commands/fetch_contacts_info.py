@@ -1,14 +1,14 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 
-from ...services import _run_contacts_command, _run_contact_info_command
+from ...services import _run_contacts_command, _run_contact_info_command, ingest_contacts_snapshot
 
 
 class Command(BaseCommand):
-    help = "Fetch contact list and persist per-contact telemetry snapshots via contact_info."
+    help = "Fetch the contact list, persist it in bulk and run contact_info only for contacts with missing data."
 
     def add_arguments(self, parser):
-        parser.add_argument("--limit", type=int, default=0, help="Max contacts to process (0 = all)")
+        parser.add_argument("--limit", type=int, default=0, help="Max contact_info calls (0 = all)")
         parser.add_argument("--sleep", type=float, default=0.2, help="Seconds to sleep between contact_info calls")
 
     def handle(self, *args, **options):
@@ -16,20 +16,15 @@ class Command(BaseCommand):
         sleep_s = options.get("sleep") or 0.0
 
         items = _run_contacts_command()
-        names = []
-        for it in items:
-            n = None
-            if isinstance(it, dict):
-                n = it.get("name") or it.get("adv_name")
-            elif isinstance(it, str):
-                n = it
-            if n:
-                names.append(n)
+        names = ingest_contacts_snapshot(items)
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Ingested {len(items) - len(names)} contacts in bulk @ {timezone.now().isoformat()}"
+        ))
 
         if limit > 0:
             names = names[:limit]
 
-        self.stdout.write(self.style.MIGRATE_HEADING(f"Processing {len(names)} contacts @ {timezone.now().isoformat()}"))
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Processing {len(names)} contacts via contact_info"))
 
         import time as _time
 
@@ -44,4 +39,3 @@ class Command(BaseCommand):
                 _time.sleep(sleep_s)
 
         self.stdout.write(self.style.SUCCESS(f"Done. {ok}/{len(names)} contacts persisted."))
-
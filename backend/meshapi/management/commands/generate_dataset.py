@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from ...benchmarks.dataset import generate_dataset
+
+
+class Command(BaseCommand):
+    help = "Fill the database with synthetic contacts, telemetry and messages (for load tests and benchmarks)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--contacts", type=int, default=10_000, help="Total contacts")
+        parser.add_argument("--telemetry", type=int, default=50_000_000, help="Total ContactTelemetry rows")
+        parser.add_argument("--messages", type=int, default=5_000_000, help="Total messages")
+        parser.add_argument("--days", type=float, default=30.0, help="Spread rows over this many days back from now")
+        parser.add_argument("--batch", type=int, default=5000, help="Rows per bulk insert")
+        parser.add_argument("--seed", type=int, default=1, help="Fleet seed (use the same for fake_meshcore_cli)")
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"Generating up to {options['contacts']} contacts, {options['telemetry']} telemetry rows "
+            f"and {options['messages']} messages"
+        ))
+
+        def log(msg: str) -> None:
+            self.stdout.write(self.style.HTTP_INFO(msg))
+
+        stats = generate_dataset(
+            contacts=max(1, options["contacts"]),
+            telemetry=max(0, options["telemetry"]),
+            messages=max(0, options["messages"]),
+            days=options["days"],
+            batch=options["batch"],
+            seed=options["seed"],
+            progress=log,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Added {stats['contacts']} contacts, {stats['telemetry']} telemetry rows and "
+            f"{stats['messages']} messages in {stats['seconds']}s"
+        ))
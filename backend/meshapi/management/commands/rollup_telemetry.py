@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from ...nodeinfo import node_telemetry_retention_days, purge_node_telemetry
+from ...rollup import purge_raw_telemetry, raw_retention_days, rollup_telemetry
+
+
+class Command(BaseCommand):
+    help = "Fold new ContactTelemetry rows into 5m/1h/1d rollups and purge raw and node telemetry rows past retention."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk", type=int, default=5000, help="Raw rows per transaction")
+        parser.add_argument("--no-purge", action="store_true", help="Only roll up, keep raw rows")
+        parser.add_argument(
+            "--retention-days",
+            type=float,
+            default=None,
+            help="Raw row retention (default: TELEMETRY_RAW_RETENTION_DAYS or 30; 0 keeps everything)",
+        )
+
+    def handle(self, *args, **options):
+        stats = rollup_telemetry(chunk=max(100, int(options.get("chunk") or 5000)))
+        self.stdout.write(self.style.SUCCESS(
+            f"Rolled up {stats['rows']} rows into {stats['buckets']} bucket updates ({stats['chunks']} chunks)"
+        ))
+        if options.get("no_purge"):
+            return
+        days = options.get("retention_days")
+        purged = purge_raw_telemetry(retention_days=days)
+        keep = raw_retention_days() if days is None else days
+        self.stdout.write(self.style.SUCCESS(
+            f"Purged {purged['raw']} raw rows (retention {keep or 'off'} days) and {purged['rollups']} expired buckets"
+        ))
+        node_purged = purge_node_telemetry()
+        self.stdout.write(self.style.SUCCESS(
+            f"Purged {node_purged} node telemetry rows (retention {node_telemetry_retention_days() or 'off'} days)"
+        ))
@@ -0,0 +1,44 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from ...actions import ActionWorkerPool, queue_stats
+
+
+class Command(BaseCommand):
+    help = "Run queued automation actions (autoresponses, MQTT publishes) without the collector."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Worker threads (default: AUTOMATION_WORKERS or 2)",
+        )
+        parser.add_argument("--poll", type=float, default=2.0, help="Seconds between queue polls when idle")
+        parser.add_argument("--once", action="store_true", help="Run the actions that are due now, then exit")
+
+    def handle(self, *args, **options):
+        workers = options.get("workers")
+        if workers is None:
+            try:
+                workers = int(os.getenv("AUTOMATION_WORKERS", "2"))
+            except Exception:
+                workers = 2
+
+        def log(msg: str) -> None:
+            self.stdout.write(self.style.HTTP_INFO(msg))
+
+        pool = ActionWorkerPool(workers=max(1, workers), poll_s=options.get("poll") or 2.0, log=log)
+        if options.get("once"):
+            ran = pool.run_pending()
+            stats = queue_stats()
+            self.stdout.write(self.style.SUCCESS(
+                f"Ran {ran} actions ({pool.stats['ok']} ok); queue: {stats['pending']} pending, {stats['failed']} failed"
+            ))
+            return
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Starting automation worker ({pool.workers} threads)"))
+        try:
+            pool.run_forever()
+        except KeyboardInterrupt:
+            pool.stop()
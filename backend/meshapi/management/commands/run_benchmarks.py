@@ -0,0 +1,97 @@
+import json
+import platform
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from ...benchmarks.dataset import generate_dataset
+from ...benchmarks.suite import CASES, SIZES, compare, parse_size, run_suite, table_counts
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark chat parsing, contact ingest, message sync and the contacts/messages endpoints "
+        "at several data sizes; writes JSON with timings and query counts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            default="xs,s",
+            help=f"Comma-separated sizes, smallest first: {', '.join(SIZES)} or contacts:telemetry:messages",
+        )
+        parser.add_argument("--repeat", type=int, default=20, help="Timed calls per case")
+        parser.add_argument("--case", action="append", choices=CASES, help="Limit to a case (repeatable)")
+        parser.add_argument("--output", default="", help="Write the JSON here instead of stdout")
+        parser.add_argument("--baseline", default="", help="Earlier JSON output; fail on query or time regressions")
+        parser.add_argument(
+            "--tolerance", type=float, default=0.5, help="Allowed median slowdown against the baseline (0.5 = 50%%)",
+        )
+        parser.add_argument(
+            "--current-db",
+            action="store_true",
+            help="Measure the configured database as it is (no generated data; ingest writes are rolled back)",
+        )
+        parser.add_argument("--keepdb", action="store_true", help="Keep the benchmark database between runs")
+        parser.add_argument("--batch", type=int, default=5000, help="Rows per bulk insert while generating")
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [parse_size(s) for s in options["sizes"].split(",") if s.strip()]
+        except ValueError as e:
+            raise CommandError(str(e))
+        repeat = max(1, options["repeat"])
+
+        # Progress goes to stderr so stdout carries only the JSON
+        def log(msg: str) -> None:
+            self.stderr.write(self.style.HTTP_INFO(msg))
+
+        results = []
+        if options["current_db"]:
+            results.append(self._measure("current", None, None, repeat, options, log, rollback=True))
+        else:
+            old_name = connection.settings_dict["NAME"]
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=options["keepdb"])
+            try:
+                for label, (contacts, telemetry, messages) in sizes:
+                    log(f"size {label}: generating {contacts} contacts, {telemetry} telemetry rows, {messages} messages")
+                    generated = generate_dataset(
+                        contacts=contacts, telemetry=telemetry, messages=messages,
+                        batch=options["batch"], seed=options["seed"], progress=log,
+                    )
+                    target = {"contacts": contacts, "telemetry": telemetry, "messages": messages}
+                    results.append(self._measure(label, target, generated, repeat, options, log))
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options["keepdb"])
+
+        report = {
+            "created_at": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "repeat": repeat,
+            "results": results,
+        }
+        regressions = []
+        if options["baseline"]:
+            with open(options["baseline"], encoding="utf-8") as f:
+                regressions = compare(json.load(f), report, options["tolerance"])
+            report["regressions"] = regressions
+        body = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                f.write(body + "\n")
+            log(f"wrote {options['output']}")
+        else:
+            self.stdout.write(body)
+        if regressions:
+            raise CommandError("regressions against baseline:\n" + "\n".join(regressions))
+
+    def _measure(self, label, target, generated, repeat, options, log, rollback=False):
+        rows = table_counts()
+        log(f"size {label}: {rows['contacts']} contacts, {rows['telemetry']} telemetry rows, {rows['messages']} messages")
+        cases = run_suite(repeat=repeat, seed=options["seed"], cases=options["case"], rollback=rollback, log=log)
+        return {"size": label, "target": target, "rows": rows, "generated": generated, "cases": cases}
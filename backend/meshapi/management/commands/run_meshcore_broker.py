@@ -0,0 +1,39 @@
+import os
+import signal
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...broker import MeshCoreBroker, broker_address
+
+
+class Command(BaseCommand):
+    help = "Run the meshcore broker that owns the single device session and serves commands over a local socket."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--listen",
+            default="",
+            help="Listen address (host:port or unix:/path). Defaults to MESHCORE_BROKER_LISTEN, then MESHCORE_BROKER.",
+        )
+
+    def handle(self, *args, **options):
+        address = (options.get("listen") or os.getenv("MESHCORE_BROKER_LISTEN") or broker_address()).strip()
+        if not address:
+            raise CommandError("No listen address: pass --listen or set MESHCORE_BROKER_LISTEN/MESHCORE_BROKER")
+
+        broker = MeshCoreBroker(address)
+
+        def _stop(signum, frame):
+            # shutdown() blocks until serve_forever returns, so call it off the main thread
+            threading.Thread(target=broker.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, _stop)
+        signal.signal(signal.SIGINT, _stop)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Starting meshcore broker on {address}"))
+        try:
+            broker.serve_forever()
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS("Broker stopped"))
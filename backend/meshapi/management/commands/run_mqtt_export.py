@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from ...mqtt_export import STREAMS, export_pending, export_status
+
+
+class Command(BaseCommand):
+    help = "Publish new telemetry, messages and node info changes to MQTT (resumes from stored high-water marks)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=5.0, help="Seconds between passes")
+        parser.add_argument("--once", action="store_true", help="Export what is pending, then exit")
+        parser.add_argument(
+            "--from-start",
+            action="store_true",
+            help="Streams without a stored mark start at their first row instead of the current end",
+        )
+        parser.add_argument("--stream", action="append", choices=sorted(STREAMS), help="Limit to a stream (repeatable)")
+
+    def handle(self, *args, **options):
+        streams = options.get("stream") or None
+        interval = max(0.5, float(options.get("interval") or 5.0))
+        from_start = bool(options.get("from_start"))
+        if not options.get("once"):
+            self.stdout.write(self.style.MIGRATE_HEADING(f"Starting MQTT export (every {interval:g}s)"))
+        while True:
+            try:
+                result = export_pending(streams, from_start=from_start)
+            except Exception as e:
+                if options.get("once"):
+                    raise
+                self.stderr.write(f"export failed: {e}")
+                result = {}
+            if not result and options.get("once"):
+                self.stdout.write(self.style.WARNING("MQTT server not configured; nothing exported"))
+                return
+            sent = {name: r for name, r in result.items() if r["rows"]}
+            if sent or options.get("once"):
+                status = export_status()["streams"]
+                self.stdout.write(self.style.SUCCESS("; ".join(
+                    f"{name}: {r['rows']} rows, {r['published']} published ({r['coalesced']} coalesced), "
+                    f"lag {status.get(name, {}).get('lag_s', 0)}s"
+                    for name, r in result.items()
+                )))
+            if options.get("once"):
+                return
+            close_old_connections()
+            time.sleep(interval)
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meshapi", "0012_collector_req_status"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CollectorTask",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("target", models.CharField(max_length=128)),
+                ("command", models.CharField(max_length=32)),
+                ("next_due", models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ("last_run_at", models.DateTimeField(blank=True, null=True)),
+                ("last_ok", models.BooleanField(blank=True, null=True)),
+                ("failures", models.IntegerField(default=0)),
+            ],
+            options={
+                "ordering": ["next_due"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="collectortask",
+            constraint=models.UniqueConstraint(fields=("target", "command"), name="meshapi_colltask_target_cmd_uniq"),
+        ),
+    ]
@@ -0,0 +1,63 @@
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+_COPY_FIELDS = (
+    "fetched_at", "adv_name", "last_advert", "adv_lat", "adv_lon", "rssi", "snr",
+    "battery_mv", "battery_percent", "type", "flags", "out_path_len", "out_path", "lastmod",
+)
+
+
+def backfill_latest(apps, schema_editor):
+    ContactTelemetry = apps.get_model("meshapi", "ContactTelemetry")
+    ContactLatest = apps.get_model("meshapi", "ContactLatest")
+    conn = schema_editor.connection
+    if conn.vendor == "postgresql":
+        cols = ", ".join(_COPY_FIELDS)
+        with conn.cursor() as cur:
+            cur.execute(
+                f"INSERT INTO {ContactLatest._meta.db_table} (contact_id, {cols}) "
+                f"SELECT DISTINCT ON (contact_id) contact_id, {cols} FROM {ContactTelemetry._meta.db_table} "
+                f"ORDER BY contact_id, fetched_at DESC"
+            )
+        return
+    rows = []
+    seen = set()
+    for t in ContactTelemetry.objects.order_by("contact_id", "-fetched_at").iterator():
+        if t.contact_id in seen:
+            continue
+        seen.add(t.contact_id)
+        rows.append(ContactLatest(contact_id=t.contact_id, **{f: getattr(t, f) for f in _COPY_FIELDS}))
+    ContactLatest.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meshapi", "0013_collector_task"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ContactLatest",
+            fields=[
+                ("contact", models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name="latest", serialize=False, to="meshapi.contact")),
+                ("fetched_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("adv_name", models.CharField(blank=True, default="", max_length=128)),
+                ("last_advert", models.BigIntegerField(blank=True, null=True)),
+                ("adv_lat", models.FloatField(blank=True, null=True)),
+                ("adv_lon", models.FloatField(blank=True, null=True)),
+                ("rssi", models.IntegerField(blank=True, null=True)),
+                ("snr", models.FloatField(blank=True, null=True)),
+                ("battery_mv", models.IntegerField(blank=True, null=True)),
+                ("battery_percent", models.FloatField(blank=True, null=True)),
+                ("type", models.IntegerField(blank=True, null=True)),
+                ("flags", models.IntegerField(blank=True, null=True)),
+                ("out_path_len", models.IntegerField(blank=True, null=True)),
+                ("out_path", models.TextField(blank=True, default="")),
+                ("lastmod", models.BigIntegerField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(backfill_latest, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meshapi", "0016_stream_event"),
+    ]
+
+    operations = [
+        # The composite indexes below cover both single-column lookups
+        migrations.RemoveIndex(model_name="message", name="meshapi_mess_ts_idx"),
+        migrations.RemoveIndex(model_name="message", name="meshapi_mess_pubkey_idx"),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(fields=["ts", "id"], name="meshapi_mess_ts_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(fields=["public_key", "ts", "id"], name="meshapi_mess_pk_ts_id_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(fields=["name", "ts", "id"], name="meshapi_mess_name_ts_id_idx"),
+        ),
+    ]
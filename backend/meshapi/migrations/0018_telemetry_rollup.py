@@ -0,0 +1,63 @@
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def _metric_fields(metric):
+    return [
+        (f"{metric}_count", models.IntegerField(default=0)),
+        (f"{metric}_sum", models.FloatField(default=0.0)),
+        (f"{metric}_min", models.FloatField(blank=True, null=True)),
+        (f"{metric}_max", models.FloatField(blank=True, null=True)),
+    ]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meshapi", "0017_message_keyset_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ContactTelemetryRollup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("bucket", models.CharField(choices=[("5m", "5 minutes"), ("1h", "1 hour"), ("1d", "1 day")], max_length=4)),
+                ("bucket_start", models.DateTimeField()),
+                ("samples", models.IntegerField(default=0)),
+                *_metric_fields("rssi"),
+                *_metric_fields("snr"),
+                *_metric_fields("battery_mv"),
+                *_metric_fields("battery_percent"),
+                ("updated_at", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "contact",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="telemetry_rollups",
+                        to="meshapi.contact",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["bucket_start"],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="contacttelemetryrollup",
+            constraint=models.UniqueConstraint(fields=("contact", "bucket", "bucket_start"), name="meshapi_telrollup_uniq"),
+        ),
+        migrations.AddIndex(
+            model_name="contacttelemetryrollup",
+            index=models.Index(fields=["bucket", "bucket_start"], name="meshapi_telrollup_start_idx"),
+        ),
+        migrations.CreateModel(
+            name="Checkpoint",
+            fields=[
+                ("key", models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ("position", models.BigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
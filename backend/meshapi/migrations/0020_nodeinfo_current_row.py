@@ -0,0 +1,206 @@
+import hashlib
+import json
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+# Frozen copies of the meshapi.nodeinfo / meshapi.ingest helpers as of this
+# migration, so later changes to those modules cannot change what it does
+
+_VOLATILE_KEYS = ("self_telemetry",)
+
+_LPP_FIELDS = {
+    "battery": "battery_percent",
+    "temperature": "temperature_c",
+    "humidity": "humidity",
+    "pressure": "pressure_hpa",
+    "barometer": "pressure_hpa",
+}
+
+
+def stable_data(data):
+    return {k: v for k, v in (data or {}).items() if k not in _VOLATILE_KEYS}
+
+
+def content_hash(data):
+    raw = json.dumps(stable_data(data), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _num(v):
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return None
+    return f if f == f else None
+
+
+def _parse_battery(payload):
+    mv = None
+    pct = None
+    candidates_mv = [
+        payload.get("battery_mv"), payload.get("bat_mv"), payload.get("vbat_mv"), payload.get("vbat"), payload.get("vbatt"),
+    ]
+    candidates_pct = [
+        payload.get("battery_percent"), payload.get("battery"), payload.get("bat_percent"), payload.get("soc"), payload.get("charge"),
+    ]
+    lvl = payload.get("level")
+    if lvl is not None:
+        try:
+            val = float(lvl)
+            if val > 1000:
+                mv = int(val)
+            elif 0 <= val <= 100:
+                pct = float(val)
+            elif 0.0 < val < 1.0:
+                pct = float(val) * 100.0
+        except Exception:
+            pass
+    for v in candidates_mv:
+        try:
+            if v is None:
+                continue
+            vi = int(v)
+            if vi > 1000:
+                mv = vi
+                break
+        except Exception:
+            continue
+    for v in candidates_pct:
+        try:
+            if v is None:
+                continue
+            vf = float(v)
+            if 0.0 <= vf <= 1.0:
+                pct = vf * 100.0
+                break
+            if 0.0 <= vf <= 100.0:
+                pct = vf
+                break
+        except Exception:
+            continue
+    return mv, pct
+
+
+def parse_self_telemetry(st):
+    if not isinstance(st, dict):
+        return None
+    row = {"extra": {}}
+    for entry in st.get("lpp") or []:
+        if not isinstance(entry, dict):
+            continue
+        kind = str(entry.get("type") or "").lower()
+        val = _num(entry.get("value"))
+        if not kind or val is None:
+            continue
+        if kind == "voltage":
+            row.setdefault("battery_mv", int(round(val * 1000)) if val < 100 else int(val))
+        elif kind in _LPP_FIELDS:
+            row.setdefault(_LPP_FIELDS[kind], val)
+        else:
+            key = kind if kind not in row["extra"] else f"{kind}_{entry.get('channel')}"
+            row["extra"][key] = val
+    mv, pct = _parse_battery(st)
+    if mv is not None:
+        row.setdefault("battery_mv", mv)
+    if pct is not None:
+        row.setdefault("battery_percent", pct)
+    for key in ("uptime_s", "uptime_secs", "uptime"):
+        up = _num(st.get(key))
+        if up is not None:
+            row["uptime_s"] = int(up)
+            break
+    if not row["extra"]:
+        row.pop("extra")
+    if not row:
+        return None
+    return row
+
+
+def compact_node_info(apps, schema_editor):
+    """Keep the newest row per name; turn distinct versions into history and telemetry into samples."""
+    NodeInfo = apps.get_model("meshapi", "NodeInfo")
+    NodeInfoHistory = apps.get_model("meshapi", "NodeInfoHistory")
+    NodeTelemetry = apps.get_model("meshapi", "NodeTelemetry")
+
+    for name in list(NodeInfo.objects.order_by("name").values_list("name", flat=True).distinct()):
+        prev_hash = None
+        changed_at = None
+        keep_id = None
+        history, samples = [], []
+        for row in NodeInfo.objects.filter(name=name).order_by("fetched_at", "id").iterator(chunk_size=2000):
+            data = row.data or {}
+            digest = content_hash(data)
+            if digest != prev_hash:
+                history.append(NodeInfoHistory(name=name, data=stable_data(data), content_hash=digest, fetched_at=row.fetched_at))
+                prev_hash = digest
+                changed_at = row.fetched_at
+            sample = parse_self_telemetry(data.get("self_telemetry") if isinstance(data, dict) else None)
+            if sample:
+                samples.append(NodeTelemetry(name=name, fetched_at=row.fetched_at, **sample))
+            keep_id = row.id
+            if len(history) >= 2000:
+                NodeInfoHistory.objects.bulk_create(history)
+                history = []
+            if len(samples) >= 2000:
+                NodeTelemetry.objects.bulk_create(samples)
+                samples = []
+        NodeInfoHistory.objects.bulk_create(history)
+        NodeTelemetry.objects.bulk_create(samples)
+        NodeInfo.objects.filter(id=keep_id).update(content_hash=prev_hash or "", changed_at=changed_at)
+        NodeInfo.objects.filter(name=name).exclude(id=keep_id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meshapi", "0019_refresh_lease"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="nodeinfo",
+            name="content_hash",
+            field=models.CharField(blank=True, default="", max_length=40),
+        ),
+        migrations.AddField(
+            model_name="nodeinfo",
+            name="changed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name="NodeInfoHistory",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("name", models.CharField(max_length=128)),
+                ("data", models.JSONField()),
+                ("content_hash", models.CharField(max_length=40)),
+                ("fetched_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                "ordering": ["-fetched_at"],
+                "indexes": [models.Index(fields=["name", "fetched_at"], name="meshapi_nodehist_name_idx")],
+            },
+        ),
+        migrations.CreateModel(
+            name="NodeTelemetry",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("name", models.CharField(max_length=128)),
+                ("fetched_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("battery_mv", models.IntegerField(blank=True, null=True)),
+                ("battery_percent", models.FloatField(blank=True, null=True)),
+                ("temperature_c", models.FloatField(blank=True, null=True)),
+                ("humidity", models.FloatField(blank=True, null=True)),
+                ("pressure_hpa", models.FloatField(blank=True, null=True)),
+                ("uptime_s", models.BigIntegerField(blank=True, null=True)),
+                ("extra", models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                "ordering": ["-fetched_at"],
+                "indexes": [models.Index(fields=["name", "fetched_at"], name="meshapi_nodetel_name_idx")],
+            },
+        ),
+        migrations.RunPython(compact_node_info, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meshapi", "0020_nodeinfo_current_row"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="nodeinfo",
+            name="name",
+            field=models.CharField(max_length=128, unique=True),
+        ),
+    ]
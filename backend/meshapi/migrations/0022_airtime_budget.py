@@ -0,0 +1,23 @@
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meshapi", "0021_nodeinfo_unique_name"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AirtimeBudget",
+            fields=[
+                ("key", models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ("tokens_s", models.FloatField(default=0.0)),
+                ("updated_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("spent_s", models.FloatField(default=0.0)),
+                ("sent", models.BigIntegerField(default=0)),
+                ("deferred", models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meshapi", "0022_airtime_budget"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="message",
+            name="dedup_key",
+            field=models.CharField(blank=True, max_length=40, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name="message",
+            constraint=models.UniqueConstraint(fields=("dedup_key",), name="meshapi_mess_dedup_uniq"),
+        ),
+    ]
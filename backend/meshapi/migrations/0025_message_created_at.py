@@ -0,0 +1,18 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("meshapi", "0024_automation_action"),
+    ]
+
+    operations = [
+        # Existing rows get the migration time, which only delays their export by the settle window
+        migrations.AddField(
+            model_name="message",
+            name="created_at",
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
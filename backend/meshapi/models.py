@@ -3,9 +3,16 @@ from django.utils import timezone
 
 
 class NodeInfo(models.Model):
-    name = models.CharField(max_length=128, db_index=True)
+    """Current info of a node: one row per name, updated in place on every refresh.
+
+    `content_hash` covers everything except the volatile `self_telemetry`; a
+    `NodeInfoHistory` row is written only when it changes (see `meshapi.nodeinfo`).
+    """
+    name = models.CharField(max_length=128, unique=True)
     data = models.JSONField()
     fetched_at = models.DateTimeField(default=timezone.now, db_index=True)
+    content_hash = models.CharField(max_length=40, blank=True, default="")
+    changed_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         indexes = [
@@ -17,6 +24,48 @@ class NodeInfo(models.Model):
         return f"{self.name} @ {self.fetched_at.isoformat()}"
 
 
+class NodeInfoHistory(models.Model):
+    """A distinct version of a node's info (without self telemetry), from `fetched_at` on."""
+    name = models.CharField(max_length=128)
+    data = models.JSONField()
+    content_hash = models.CharField(max_length=40)
+    fetched_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["name", "fetched_at"], name="meshapi_nodehist_name_idx"),
+        ]
+        ordering = ["-fetched_at"]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.name} {self.content_hash[:8]} @ {self.fetched_at.isoformat()}"
+
+
+class NodeTelemetry(models.Model):
+    """Typed samples of the local node's `self_telemetry` (one row per refresh)."""
+    name = models.CharField(max_length=128)
+    fetched_at = models.DateTimeField(default=timezone.now)
+    battery_mv = models.IntegerField(null=True, blank=True)
+    battery_percent = models.FloatField(null=True, blank=True)
+    temperature_c = models.FloatField(null=True, blank=True)
+    humidity = models.FloatField(null=True, blank=True)
+    pressure_hpa = models.FloatField(null=True, blank=True)
+    uptime_s = models.BigIntegerField(null=True, blank=True)
+    # Remaining numeric readings keyed by LPP type (rarely used)
+    extra = models.JSONField(default=dict, blank=True)
+
+    SERIES_FIELDS = ("battery_mv", "battery_percent", "temperature_c", "humidity", "pressure_hpa", "uptime_s")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["name", "fetched_at"], name="meshapi_nodetel_name_idx"),
+        ]
+        ordering = ["-fetched_at"]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.name} telemetry @ {self.fetched_at.isoformat()}"
+
+
 class Contact(models.Model):
     """A unique contact in the mesh, identified by public_key."""
     public_key = models.CharField(max_length=64, unique=True)
@@ -65,6 +114,107 @@ class ContactTelemetry(models.Model):
         ordering = ["-fetched_at"]
 
 
+class ContactLatest(models.Model):
+    """Latest telemetry snapshot per contact, denormalized for cheap list reads.
+
+    Maintained by the ingest path (see `meshapi.ingest.persist_contact_batch`)
+    alongside every `ContactTelemetry` insert.
+    """
+    contact = models.OneToOneField(Contact, on_delete=models.CASCADE, primary_key=True, related_name="latest")
+    fetched_at = models.DateTimeField(default=timezone.now)
+
+    adv_name = models.CharField(max_length=128, blank=True, default="")
+    last_advert = models.BigIntegerField(null=True, blank=True)
+    adv_lat = models.FloatField(null=True, blank=True)
+    adv_lon = models.FloatField(null=True, blank=True)
+    rssi = models.IntegerField(null=True, blank=True)
+    snr = models.FloatField(null=True, blank=True)
+    battery_mv = models.IntegerField(null=True, blank=True)
+    battery_percent = models.FloatField(null=True, blank=True)
+    type = models.IntegerField(null=True, blank=True)
+    flags = models.IntegerField(null=True, blank=True)
+    out_path_len = models.IntegerField(null=True, blank=True)
+    out_path = models.TextField(blank=True, default="")
+    lastmod = models.BigIntegerField(null=True, blank=True)
+
+    # Columns copied from the telemetry row (everything except id/contact/raw)
+    COPY_FIELDS = (
+        "fetched_at", "adv_name", "last_advert", "adv_lat", "adv_lon", "rssi", "snr",
+        "battery_mv", "battery_percent", "type", "flags", "out_path_len", "out_path", "lastmod",
+    )
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"latest {self.contact_id} @ {self.fetched_at.isoformat()}"
+
+
+class ContactTelemetryRollup(models.Model):
+    """Per-contact telemetry aggregated into 5 minute, 1 hour and 1 day buckets.
+
+    Each metric keeps count/sum/min/max so buckets can be merged incrementally
+    (see `meshapi.rollup`); the average is sum / count.
+    """
+    BUCKET_5M = "5m"
+    BUCKET_1H = "1h"
+    BUCKET_1D = "1d"
+    BUCKET_CHOICES = (
+        (BUCKET_5M, "5 minutes"),
+        (BUCKET_1H, "1 hour"),
+        (BUCKET_1D, "1 day"),
+    )
+    BUCKET_SECONDS = {BUCKET_5M: 300, BUCKET_1H: 3600, BUCKET_1D: 86400}
+    METRICS = ("rssi", "snr", "battery_mv", "battery_percent")
+
+    contact = models.ForeignKey(Contact, on_delete=models.CASCADE, related_name="telemetry_rollups")
+    bucket = models.CharField(max_length=4, choices=BUCKET_CHOICES)
+    bucket_start = models.DateTimeField()
+    samples = models.IntegerField(default=0)
+
+    rssi_count = models.IntegerField(default=0)
+    rssi_sum = models.FloatField(default=0.0)
+    rssi_min = models.FloatField(null=True, blank=True)
+    rssi_max = models.FloatField(null=True, blank=True)
+    snr_count = models.IntegerField(default=0)
+    snr_sum = models.FloatField(default=0.0)
+    snr_min = models.FloatField(null=True, blank=True)
+    snr_max = models.FloatField(null=True, blank=True)
+    battery_mv_count = models.IntegerField(default=0)
+    battery_mv_sum = models.FloatField(default=0.0)
+    battery_mv_min = models.FloatField(null=True, blank=True)
+    battery_mv_max = models.FloatField(null=True, blank=True)
+    battery_percent_count = models.IntegerField(default=0)
+    battery_percent_sum = models.FloatField(default=0.0)
+    battery_percent_min = models.FloatField(null=True, blank=True)
+    battery_percent_max = models.FloatField(null=True, blank=True)
+
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["contact", "bucket", "bucket_start"], name="meshapi_telrollup_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["bucket", "bucket_start"], name="meshapi_telrollup_start_idx"),
+        ]
+        ordering = ["bucket_start"]
+
+    def avg(self, metric: str):
+        count = getattr(self, f"{metric}_count")
+        return getattr(self, f"{metric}_sum") / count if count else None
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.contact_id} {self.bucket} @ {self.bucket_start.isoformat()} ({self.samples})"
+
+
+class Checkpoint(models.Model):
+    """High-water mark of an incremental job (e.g. the last rolled-up telemetry id)."""
+    key = models.CharField(max_length=64, primary_key=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.key} @ {self.position}"
+
+
 class CollectorConfig(models.Model):
     """Configuration for background contact telemetry collector."""
     updated_at = models.DateTimeField(auto_now=True)
@@ -79,6 +229,25 @@ class CollectorConfig(models.Model):
         return f"Collector every {self.interval_seconds}s ({mode_tel}, {mode_stat})"
 
 
+class CollectorTask(models.Model):
+    """Persisted collector schedule: one row per (contact, command) with its next due time."""
+    target = models.CharField(max_length=128)
+    command = models.CharField(max_length=32)
+    next_due = models.DateTimeField(default=timezone.now, db_index=True)
+    last_run_at = models.DateTimeField(null=True, blank=True)
+    last_ok = models.BooleanField(null=True, blank=True)
+    failures = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["target", "command"], name="meshapi_colltask_target_cmd_uniq"),
+        ]
+        ordering = ["next_due"]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.command} '{self.target}' due {self.next_due.isoformat()}"
+
+
 class MQTTConfig(models.Model):
     """Configuration for MQTT broker connection."""
     updated_at = models.DateTimeField(auto_now=True)
@@ -113,16 +282,93 @@ class Message(models.Model):
         blank=True,
         choices=(("sending", "sending"), ("sent", "sent"), ("delivered", "delivered"), ("failed", "failed")),
     )
+    # Hash of sender, text and device timestamp (or arrival time bucket) of an
+    # incoming message; unique so concurrent writers cannot store it twice
+    dedup_key = models.CharField(max_length=40, null=True, blank=True)
+    # When the row was written (`ts` may come from the sender's clock); bounds
+    # the settle window of readers that follow the table by id
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
 
     class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["dedup_key"], name="meshapi_mess_dedup_uniq"),
+        ]
         indexes = [
-            models.Index(fields=["ts"]),
-            models.Index(fields=["public_key"]),
+            # Keyset pagination: (ts, id) order globally and per conversation
+            models.Index(fields=["ts", "id"], name="meshapi_mess_ts_id_idx"),
+            models.Index(fields=["public_key", "ts", "id"], name="meshapi_mess_pk_ts_id_idx"),
+            models.Index(fields=["name", "ts", "id"], name="meshapi_mess_name_ts_id_idx"),
             models.Index(fields=["client_id"]),
         ]
         ordering = ["-ts"]
 
 
+class DataVersion(models.Model):
+    """Monotonic change counter per data set, shared by all processes.
+
+    Ingest paths bump it; read endpoints derive ETags from it (see `meshapi.versioning`).
+    """
+    key = models.CharField(max_length=32, primary_key=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.key} v{self.version}"
+
+
+class RefreshLease(models.Model):
+    """Cross-process lease for a single-flight job (see `meshapi.coordination`).
+
+    An empty `holder` or a past `expires_at` means the lease is free;
+    `last_started_at` throttles how often the job may start at all.
+    """
+    key = models.CharField(max_length=64, primary_key=True)
+    holder = models.CharField(max_length=128, blank=True, default="")
+    expires_at = models.DateTimeField(null=True, blank=True)
+    last_started_at = models.DateTimeField(null=True, blank=True)
+    last_finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.key} held by {self.holder or '-'}"
+
+
+class AirtimeBudget(models.Model):
+    """Shared token bucket of transmit airtime in seconds (see `meshapi.airtime`)."""
+    key = models.CharField(max_length=64, primary_key=True)
+    tokens_s = models.FloatField(default=0.0)
+    updated_at = models.DateTimeField(default=timezone.now)
+    # Lifetime counters
+    spent_s = models.FloatField(default=0.0)
+    sent = models.BigIntegerField(default=0)
+    deferred = models.BigIntegerField(default=0)
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.key}: {self.tokens_s:.1f}s left"
+
+
+class StreamEvent(models.Model):
+    """Append-only change feed served by the SSE endpoint (see `meshapi.stream`).
+
+    The auto-increment id doubles as the SSE event id, so clients resume with
+    ``Last-Event-ID``. Rows are purged after ``STREAM_EVENT_RETENTION_S``.
+    """
+    KIND_MESSAGE = "message"
+    KIND_TELEMETRY = "telemetry"
+    KIND_NODE = "node"
+    KIND_CONNECTION = "connection"
+
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=16)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        ordering = ["id"]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"#{self.id} {self.kind}"
+
+
 class AutomationRule(models.Model):
     """User-defined automations that react to message text and trigger actions.
 
@@ -185,3 +431,50 @@ class AutomationRule(models.Model):
 
     def __str__(self) -> str:  # pragma: no cover
         return f"[{('on' if self.enabled else 'off')}] {self.name} -> {self.action_type}"
+
+
+class AutomationAction(models.Model):
+    """Queued execution of a matched automation rule (see `meshapi.actions`).
+
+    Rows are inserted on message ingest and run by the action workers with
+    retries; `params` holds the rendered action (recipient/text or topic/payload).
+    """
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = (
+        (STATUS_PENDING, "pending"),
+        (STATUS_RUNNING, "running"),
+        (STATUS_DONE, "done"),
+        (STATUS_FAILED, "failed"),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    rule = models.ForeignKey(AutomationRule, null=True, blank=True, on_delete=models.SET_NULL, related_name="actions")
+    rule_name = models.CharField(max_length=128, blank=True, default="")
+    action_type = models.CharField(max_length=32)
+    params = models.JSONField(default=dict)
+
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=5)
+    timeout_s = models.FloatField(default=30.0)
+    run_after = models.DateTimeField(default=timezone.now)
+    # Set while a worker runs the action; an expired lock means the worker died
+    locked_by = models.CharField(max_length=128, blank=True, default="")
+    locked_until = models.DateTimeField(null=True, blank=True)
+
+    last_error = models.TextField(blank=True, default="")
+    result = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="meshapi_autoact_due_idx"),
+        ]
+        ordering = ["-id"]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"#{self.id} {self.action_type} ({self.status}, {self.attempts}/{self.max_attempts})"
@@ -0,0 +1,211 @@
+"""Continuous export of mesh data to MQTT.
+
+:func:`export_pending` publishes rows added since the last run. It reads each
+stream's table above a ``Checkpoint`` high-water mark, in id order:
+
+- ``telemetry``: ``ContactTelemetry`` rows to ``<community>/telemetry/<public_key>`` (retained)
+- ``messages``: ``Message`` rows to ``<community>/messages/<in|out>/<public_key or name>``
+- ``node``: ``NodeInfoHistory`` rows (node info changes) to ``<community>/node/<name>`` (retained)
+
+``<community>`` is ``MQTTConfig.default_community`` (``meshcore`` if empty).
+
+- Up to ``MQTT_EXPORT_BATCH`` rows per stream go out per pass. Retained
+  (latest state) topics are coalesced, so only the newest row per topic in a
+  batch is published. Messages are events and all of them are sent.
+- Publishing uses the shared persistent publisher at QoS 1. The mark moves only
+  after every message of the batch is acknowledged, so a crash or broker outage
+  repeats a batch rather than losing it.
+- A stream without a mark starts at the current end of its table; use
+  ``from_start`` to export existing rows.
+- Rows written less than ``MQTT_EXPORT_SETTLE_S`` ago (by ``fetched_at`` for
+  telemetry and node rows, ``created_at`` for messages) wait for the next
+  pass, so rows committed slightly out of id order are not skipped.
+
+:func:`export_status` reports each stream's mark, backlog and lag.
+"""
+import json
+import os
+import re
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import Checkpoint, ContactTelemetry, Message, MQTTConfig, NodeInfoHistory
+from .mqtt_publisher import get_mqtt_publisher, load_config
+
+
+STREAM_TELEMETRY = "telemetry"
+STREAM_MESSAGES = "messages"
+STREAM_NODE = "node"
+
+_TOPIC_UNSAFE_RE = re.compile(r"[+#/\s]+")
+
+
+def _env_float(key: str, default: float) -> float:
+    try:
+        return float(os.getenv(key, str(default)))
+    except Exception:
+        return default
+
+
+def batch_size() -> int:
+    return max(1, int(_env_float("MQTT_EXPORT_BATCH", 500)))
+
+
+def settle_s() -> float:
+    return max(0.0, _env_float("MQTT_EXPORT_SETTLE_S", 2.0))
+
+
+def topic_root() -> str:
+    community = (MQTTConfig.objects.order_by("-id").values_list("default_community", flat=True).first() or "").strip()
+    return community.strip("/") or "meshcore"
+
+
+def _segment(value: Any) -> str:
+    """One topic level: no wildcards, separators or whitespace."""
+    return _TOPIC_UNSAFE_RE.sub("_", str(value or "").strip()) or "_"
+
+
+def _telemetry_rows(qs) -> List[Tuple[int, str, Dict[str, Any]]]:
+    qs = qs.values(
+        "id", "contact__public_key", "adv_name", "fetched_at", "rssi", "snr", "battery_mv", "battery_percent",
+        "adv_lat", "adv_lon", "last_advert",
+    )
+    out = []
+    for r in qs:
+        key = r.pop("contact__public_key")
+        r["public_key"] = key
+        out.append((r["id"], f"{STREAM_TELEMETRY}/{_segment(key)}", r))
+    return out
+
+
+def _message_rows(qs) -> List[Tuple[int, str, Dict[str, Any]]]:
+    qs = qs.values("id", "name", "public_key", "direction", "text", "ts", "status")
+    return [
+        (r["id"], f"{STREAM_MESSAGES}/{_segment(r['direction'])}/{_segment(r['public_key'] or r['name'])}", r)
+        for r in qs
+    ]
+
+
+def _node_rows(qs) -> List[Tuple[int, str, Dict[str, Any]]]:
+    qs = qs.values("id", "name", "fetched_at", "content_hash", "data")
+    return [(r["id"], f"{STREAM_NODE}/{_segment(r['name'])}", r) for r in qs]
+
+
+# name -> (row serializer, model, insert time column, retained/coalesced)
+STREAMS: Dict[str, Tuple[Callable[[Any], List[Tuple[int, str, Dict[str, Any]]]], Any, str, bool]] = {
+    STREAM_TELEMETRY: (_telemetry_rows, ContactTelemetry, "fetched_at", True),
+    # `ts` may be the sender's clock, so the settle window uses the insert time
+    STREAM_MESSAGES: (_message_rows, Message, "created_at", False),
+    STREAM_NODE: (_node_rows, NodeInfoHistory, "fetched_at", True),
+}
+
+
+def checkpoint_key(stream: str) -> str:
+    return f"mqtt_export_{stream}"
+
+
+def _position(stream: str, from_start: bool = False) -> int:
+    """Current mark of `stream`; a new stream starts at the table's end (or 0 with `from_start`)."""
+    key = checkpoint_key(stream)
+    pos = Checkpoint.objects.filter(key=key).values_list("position", flat=True).first()
+    if pos is not None:
+        return pos
+    model = STREAMS[stream][1]
+    start = 0 if from_start else (model.objects.aggregate(m=Max("id"))["m"] or 0)
+    cp, _created = Checkpoint.objects.get_or_create(key=key, defaults={"position": start})
+    return cp.position
+
+
+def export_stream(stream: str, *, root: str, limit: int, timeout: float = 30.0, from_start: bool = False) -> Dict[str, int]:
+    """Publish one batch of `stream`; returns counts of rows read, messages sent and rows coalesced."""
+    reader, model, col, retained = STREAMS[stream]
+    stats = {"rows": 0, "published": 0, "coalesced": 0}
+    after = _position(stream, from_start)
+    qs = model.objects.filter(id__gt=after)
+    # Stop before the first row that is still settling
+    cutoff = timezone.now() - timedelta(seconds=settle_s())
+    upper = model.objects.filter(id__gt=after, **{f"{col}__gte": cutoff}).aggregate(m=Min("id"))["m"]
+    if upper is not None:
+        qs = qs.filter(id__lt=upper)
+    rows = reader(qs.order_by("id")[:limit])
+    if not rows:
+        return stats
+    stats["rows"] = len(rows)
+    if retained:
+        # Latest state per topic: keep only the newest row of each
+        newest: Dict[str, Tuple[int, str, Dict[str, Any]]] = {}
+        for row in rows:
+            newest[row[1]] = row
+        outgoing = sorted(newest.values(), key=lambda r: r[0])
+        stats["coalesced"] = len(rows) - len(outgoing)
+    else:
+        outgoing = rows
+    publisher = get_mqtt_publisher()
+    futures = [
+        publisher.publish(
+            f"{root}/{topic}", json.dumps(payload, cls=DjangoJSONEncoder), qos=1, retain=retained, timeout=timeout,
+        )
+        for _id, topic, payload in outgoing
+    ]
+    for f in futures:
+        # Raises on the first failure; the mark stays and the batch is sent again next pass
+        f.result(timeout=timeout + 1.0)
+    stats["published"] = len(futures)
+    Checkpoint.objects.filter(key=checkpoint_key(stream), position=after).update(
+        position=rows[-1][0], updated_at=timezone.now(),
+    )
+    return stats
+
+
+def export_pending(
+    streams: Optional[List[str]] = None, *, max_batches: int = 10, from_start: bool = False,
+) -> Dict[str, Dict[str, int]]:
+    """Export up to `max_batches` batches per stream; no-op while MQTT is not configured."""
+    result: Dict[str, Dict[str, int]] = {}
+    if load_config() is None:
+        return result
+    root = topic_root()
+    limit = batch_size()
+    for stream in streams or list(STREAMS):
+        total = {"rows": 0, "published": 0, "coalesced": 0}
+        for _ in range(max(1, max_batches)):
+            stats = export_stream(stream, root=root, limit=limit, from_start=from_start)
+            for k, v in stats.items():
+                total[k] += v
+            if stats["rows"] < limit:
+                break
+        result[stream] = total
+    return result
+
+
+def export_status() -> Dict[str, Any]:
+    """Mark, backlog (rows) and lag (age of the oldest unexported row) per stream."""
+    now = timezone.now()
+    streams: Dict[str, Any] = {}
+    marks = dict(Checkpoint.objects.filter(key__startswith="mqtt_export_").values_list("key", "position"))
+    updated = dict(Checkpoint.objects.filter(key__startswith="mqtt_export_").values_list("key", "updated_at"))
+    for stream, (_reader, model, col, _retained) in STREAMS.items():
+        key = checkpoint_key(stream)
+        pos = marks.get(key)
+        if pos is None:
+            streams[stream] = {"started": False}
+            continue
+        pending = model.objects.filter(id__gt=pos)
+        oldest = pending.order_by("id").values_list(col, flat=True).first()
+        streams[stream] = {
+            "started": True,
+            "position": pos,
+            "backlog": pending.count(),
+            "lag_s": round(max(0.0, (now - oldest).total_seconds()), 1) if oldest else 0.0,
+            "updated_at": updated.get(key),
+        }
+    return {
+        "configured": load_config() is not None,
+        "topic_root": topic_root(),
+        "streams": streams,
+        "as_of": now,
+    }
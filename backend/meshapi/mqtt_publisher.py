@@ -0,0 +1,463 @@
+"""Long-lived MQTT publisher shared by everything in the process.
+
+Each publish used to load ``MQTTConfig``, build a client, do the TLS setup,
+connect, wait and disconnect, so a burst of automation actions became a burst
+of TCP/TLS handshakes. :class:`MQTTPublisher` keeps one connection for the
+current config instead:
+
+- A sender thread drains a bounded outbound queue. When the queue is full,
+  :meth:`~MQTTPublisher.publish` blocks the caller, up to its timeout, and
+  then raises :class:`PublishBackpressure`.
+- QoS 1 messages stay in flight until the broker's PUBACK; at most
+  ``MQTT_MAX_INFLIGHT`` are outstanding. Each publish returns a future that
+  resolves on the acknowledgement.
+- The paho network loop reconnects on its own with backoff. The config row is
+  re-read every ``MQTT_CONFIG_CHECK_S`` seconds (and at once when it is saved
+  in this process); a change rebuilds the client and re-sends what was still
+  unacknowledged.
+- :meth:`~MQTTPublisher.status` reports connection state, queue depth, in-flight
+  count, counters, ack latency and throughput.
+
+The client is built by an injectable factory that returns a paho-compatible
+object, so the publisher can run against a local mosquitto or an in-process
+stand-in.
+"""
+import os
+import socket
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, Optional
+
+from django.db import close_old_connections
+
+from .models import MQTTConfig
+
+try:  # optional import for MQTT publish support
+    import paho.mqtt.client as mqtt  # type: ignore
+except Exception:  # pragma: no cover
+    mqtt = None
+
+
+# Weight of the newest sample in the moving ack-latency average
+_EWMA_ALPHA = 0.2
+_RATE_WINDOW_S = 60.0
+
+
+class PublishBackpressure(RuntimeError):
+    """The outbound queue stayed full for the whole publish timeout."""
+
+
+def _env_float(key: str, default: float) -> float:
+    try:
+        return float(os.getenv(key, str(default)))
+    except Exception:
+        return default
+
+
+def load_config() -> Optional[Dict[str, Any]]:
+    """Connection settings of the current MQTTConfig row, or None if no server is set."""
+    cfg = MQTTConfig.objects.order_by("-id").first()
+    if not cfg or not cfg.server:
+        return None
+    return {
+        "server": cfg.server,
+        "port": int(cfg.port or 1883),
+        "username": cfg.username or "",
+        "password": cfg.password or "",
+        "use_tls": bool(cfg.use_tls),
+    }
+
+
+def paho_client_factory(cfg: Dict[str, Any]) -> Any:
+    """Build a paho client for `cfg` (not connected yet)."""
+    if mqtt is None:
+        raise RuntimeError("MQTT support not installed (paho-mqtt)")
+    client_id = f"meshviewer-{socket.gethostname()}-{os.getpid()}"[:64]
+    client = mqtt.Client(client_id=client_id, protocol=mqtt.MQTTv311, clean_session=True)
+    if cfg["username"]:
+        client.username_pw_set(cfg["username"], cfg["password"] or None)
+    if cfg["use_tls"]:
+        import ssl
+        client.tls_set(tls_version=ssl.PROTOCOL_TLS)
+        client.tls_insecure_set(False)
+    client.reconnect_delay_set(min_delay=1, max_delay=60)
+    return client
+
+
+class _Outgoing:
+    __slots__ = ("topic", "payload", "qos", "retain", "future", "deadline", "sent_at", "mid")
+
+    def __init__(self, topic: str, payload: Any, qos: int, retain: bool, deadline: float) -> None:
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.future: Future = Future()
+        self.deadline = deadline
+        self.sent_at = 0.0
+        self.mid: Optional[int] = None
+
+
+class MQTTPublisher:
+    """One persistent connection per config with a bounded, acknowledged send queue."""
+
+    def __init__(
+        self,
+        client_factory: Callable[[Dict[str, Any]], Any] = paho_client_factory,
+        config_loader: Callable[[], Optional[Dict[str, Any]]] = load_config,
+        *,
+        max_queue: Optional[int] = None,
+        max_inflight: Optional[int] = None,
+        ack_timeout_s: Optional[float] = None,
+        config_check_s: Optional[float] = None,
+        keepalive: int = 60,
+    ) -> None:
+        self._factory = client_factory
+        self._load_config = config_loader
+        self.max_queue = max(1, int(max_queue or _env_float("MQTT_MAX_QUEUE", 1000)))
+        self.max_inflight = max(1, int(max_inflight or _env_float("MQTT_MAX_INFLIGHT", 20)))
+        self.ack_timeout_s = float(ack_timeout_s or _env_float("MQTT_ACK_TIMEOUT_S", 30.0))
+        self.config_check_s = float(_env_float("MQTT_CONFIG_CHECK_S", 5.0) if config_check_s is None else config_check_s)
+        self.keepalive = keepalive
+
+        self._lock = threading.RLock()
+        self._cond = threading.Condition(self._lock)
+        self._queue: Deque[_Outgoing] = deque()
+        self._inflight: Dict[int, _Outgoing] = {}
+        self._early_acks: Dict[int, float] = {}
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+        self._client: Any = None
+        self._config: Optional[Dict[str, Any]] = None
+        self._config_checked = 0.0
+        self._reload_requested = True
+        self._connected = False
+        self._generation = 0
+        self.last_error = ""
+
+        self._counters = {
+            "enqueued": 0, "sent": 0, "acked": 0, "failed": 0, "rejected": 0,
+            "ack_timeouts": 0, "connects": 0, "disconnects": 0, "reloads": 0,
+        }
+        self._ack_ms = 0.0
+        self._acked_at: Deque[float] = deque()
+
+    # --- public API ---------------------------------------------------------
+
+    def publish(self, topic: str, payload: Any, qos: int = 1, retain: bool = False, timeout: float = 10.0) -> Future:
+        """Queue a message; the future resolves with its mid once the broker has it.
+
+        Blocks while the queue is full and raises PublishBackpressure if it is
+        still full after `timeout` seconds.
+        """
+        item = _Outgoing(topic, payload, qos, retain, time.monotonic() + timeout)
+        with self._cond:
+            self._ensure_thread()
+            while len(self._queue) >= self.max_queue:
+                remaining = item.deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters["rejected"] += 1
+                    raise PublishBackpressure(f"MQTT queue full ({self.max_queue} messages)")
+                self._cond.wait(remaining)
+            self._queue.append(item)
+            self._counters["enqueued"] += 1
+            self._cond.notify_all()
+        return item.future
+
+    def publish_and_wait(self, topic: str, payload: Any, qos: int = 1, retain: bool = False, timeout: float = 10.0) -> Dict[str, Any]:
+        """Publish and block until the broker acknowledged it (or `timeout` passes)."""
+        future = self.publish(topic, payload, qos=qos, retain=retain, timeout=timeout)
+        try:
+            # The sender fails the future at its deadline; the extra second covers handing it back
+            mid = future.result(timeout=timeout + 1.0)
+        except BaseException:
+            future.cancel()
+            raise
+        return {"rc": 0, "mid": mid}
+
+    def reload(self) -> None:
+        """Re-read the config on the next sender pass."""
+        with self._cond:
+            self._reload_requested = True
+            self._cond.notify_all()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout=5.0)
+        self._teardown_client()
+
+    def status(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            while self._acked_at and now - self._acked_at[0] > _RATE_WINDOW_S:
+                self._acked_at.popleft()
+            cfg = self._config
+            return {
+                "configured": cfg is not None,
+                "server": f"{cfg['server']}:{cfg['port']}" if cfg else None,
+                "connected": self._connected,
+                "queued": len(self._queue),
+                "max_queue": self.max_queue,
+                "inflight": len(self._inflight),
+                "max_inflight": self.max_inflight,
+                **self._counters,
+                "avg_ack_ms": round(self._ack_ms, 1),
+                "acked_per_s": round(len(self._acked_at) / _RATE_WINDOW_S, 3),
+                "last_error": self.last_error,
+            }
+
+    # --- client callbacks (paho network thread) -----------------------------
+
+    def _bind(self, client: Any, generation: int) -> None:
+        def on_connect(cl, userdata, flags, rc, *args):
+            with self._cond:
+                if generation != self._generation:
+                    return
+                if rc == 0:
+                    self._connected = True
+                    self._counters["connects"] += 1
+                else:
+                    self.last_error = f"connect refused (rc={rc})"
+                self._cond.notify_all()
+
+        def on_disconnect(cl, userdata, rc, *args):
+            with self._cond:
+                if generation != self._generation:
+                    return
+                if self._connected:
+                    self._counters["disconnects"] += 1
+                self._connected = False
+                if rc:
+                    self.last_error = f"connection lost (rc={rc})"
+                self._cond.notify_all()
+
+        def on_publish(cl, userdata, mid, *args):
+            with self._cond:
+                if generation != self._generation:
+                    return
+                item = self._inflight.pop(mid, None)
+                if item is None:
+                    # PUBACK raced ahead of _send registering the mid
+                    self._early_acks[mid] = time.monotonic()
+                    return
+                self._acked(item)
+                self._cond.notify_all()
+
+        def on_connect_fail(cl, userdata, *args):
+            with self._cond:
+                if generation == self._generation:
+                    self.last_error = "connect failed"
+
+        client.on_connect = on_connect
+        client.on_connect_fail = on_connect_fail
+        client.on_disconnect = on_disconnect
+        client.on_publish = on_publish
+
+    def _acked(self, item: _Outgoing) -> None:
+        now = time.monotonic()
+        ms = (now - item.sent_at) * 1000.0
+        self._counters["acked"] += 1
+        self._ack_ms = ms if self._counters["acked"] == 1 else (1 - _EWMA_ALPHA) * self._ack_ms + _EWMA_ALPHA * ms
+        self._acked_at.append(now)
+        if not item.future.done():
+            item.future.set_result(item.mid)
+
+    # --- sender thread ------------------------------------------------------
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="mqtt-publisher", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if self._stopping:
+                    return
+            try:
+                self._check_config()
+            except Exception as e:
+                self.last_error = f"config: {e}"
+            finally:
+                close_old_connections()
+            with self._cond:
+                self._expire_inflight()
+                item = self._next_sendable()
+                if item is None:
+                    self._cond.wait(0.5)
+                    continue
+                client, generation = self._client, self._generation
+            # Outside our lock: paho holds its own locks while running our callbacks
+            self._send(item, client, generation)
+
+    def _check_config(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            due = self._reload_requested or now - self._config_checked >= self.config_check_s
+            self._reload_requested = False
+        if not due:
+            return
+        cfg = self._load_config()
+        with self._cond:
+            self._config_checked = now
+            if cfg == self._config and (cfg is None or self._client is not None):
+                return
+            old_client = self._client
+            self._generation += 1
+            self._client = None
+            self._connected = False
+            self._config = cfg
+            if old_client is not None:
+                self._counters["reloads"] += 1
+                # Unacknowledged messages go out again on the new connection
+                for item in sorted(self._inflight.values(), key=lambda i: i.sent_at, reverse=True):
+                    self._queue.appendleft(item)
+                self._inflight.clear()
+            self._early_acks.clear()
+            generation = self._generation
+        if old_client is not None:
+            self._close(old_client)
+        if cfg is None:
+            return
+        try:
+            client = self._factory(cfg)
+            self._bind(client, generation)
+            if hasattr(client, "max_inflight_messages_set"):
+                client.max_inflight_messages_set(self.max_inflight)
+            client.connect_async(cfg["server"], cfg["port"], keepalive=self.keepalive)
+            client.loop_start()
+        except Exception as e:
+            with self._cond:
+                self.last_error = f"{e.__class__.__name__}: {e}"
+                # Try again on the next config check
+                self._config = None
+            return
+        with self._cond:
+            current = generation == self._generation
+            if current:
+                self._client = client
+        if not current:
+            self._close(client)
+
+    def _next_sendable(self) -> Optional[_Outgoing]:
+        """Pop the next message if it can go out now (lock held); fail expired ones."""
+        now = time.monotonic()
+        while self._queue:
+            head = self._queue[0]
+            if head.future.cancelled():
+                self._queue.popleft()
+                self._cond.notify_all()
+                continue
+            if now >= head.deadline:
+                self._queue.popleft()
+                self._fail(head, TimeoutError(self._unavailable_reason()))
+                continue
+            if self._client is None or not self._connected or len(self._inflight) >= self.max_inflight:
+                return None
+            self._queue.popleft()
+            self._cond.notify_all()
+            return head
+        return None
+
+    def _unavailable_reason(self) -> str:
+        if self._config is None:
+            return "MQTT server not configured"
+        if not self._connected:
+            return f"MQTT broker {self._config['server']}:{self._config['port']} not reachable" + (
+                f" ({self.last_error})" if self.last_error else ""
+            )
+        return "MQTT publish timed out in queue"
+
+    def _send(self, item: _Outgoing, client: Any, generation: int) -> None:
+        """Hand one message to the client and track it until acknowledged."""
+        item.sent_at = time.monotonic()
+        try:
+            info = client.publish(item.topic, payload=item.payload, qos=item.qos, retain=item.retain)
+        except Exception as e:
+            with self._cond:
+                self._fail(item, e)
+            return
+        rc = getattr(info, "rc", 0)
+        with self._cond:
+            if rc not in (0, None):
+                self._fail(item, RuntimeError(f"MQTT publish failed (rc={rc})"))
+                return
+            self._counters["sent"] += 1
+            item.mid = getattr(info, "mid", None)
+            if item.qos == 0 or item.mid is None:
+                self._acked(item)
+            elif generation != self._generation:
+                # The client was replaced meanwhile; send again on the new one
+                self._queue.appendleft(item)
+            elif self._early_acks.pop(item.mid, None) is not None:
+                self._acked(item)
+            else:
+                self._inflight[item.mid] = item
+            self._cond.notify_all()
+
+    def _expire_inflight(self) -> None:
+        now = time.monotonic()
+        for mid, at in list(self._early_acks.items()):
+            if now - at > self.ack_timeout_s:
+                del self._early_acks[mid]
+        for mid, item in list(self._inflight.items()):
+            if now - item.sent_at > self.ack_timeout_s:
+                del self._inflight[mid]
+                self._counters["ack_timeouts"] += 1
+                self._fail(item, TimeoutError(f"no PUBACK within {self.ack_timeout_s:.0f}s"))
+
+    def _fail(self, item: _Outgoing, exc: BaseException) -> None:
+        self._counters["failed"] += 1
+        if not item.future.done():
+            item.future.set_exception(exc)
+
+    def _teardown_client(self) -> None:
+        with self._cond:
+            client, self._client = self._client, None
+            self._generation += 1
+            self._connected = False
+        if client is not None:
+            self._close(client)
+
+    @staticmethod
+    def _close(client: Any) -> None:
+        try:
+            client.disconnect()
+            client.loop_stop()
+        except Exception:
+            pass
+
+
+_PUBLISHER: Optional[MQTTPublisher] = None
+_PUBLISHER_LOCK = threading.Lock()
+
+
+def get_mqtt_publisher() -> MQTTPublisher:
+    global _PUBLISHER
+    with _PUBLISHER_LOCK:
+        if _PUBLISHER is None:
+            _PUBLISHER = MQTTPublisher()
+        return _PUBLISHER
+
+
+def reload_mqtt_publisher() -> None:
+    """Make this process's publisher pick up a changed config (no-op if none runs)."""
+    publisher = _PUBLISHER
+    if publisher is not None:
+        publisher.reload()
+
+
+def set_mqtt_publisher(publisher: Optional[MQTTPublisher]) -> Optional[MQTTPublisher]:
+    """Swap the process-wide publisher (e.g. one with a stand-in client); returns the old one."""
+    global _PUBLISHER
+    with _PUBLISHER_LOCK:
+        old, _PUBLISHER = _PUBLISHER, publisher
+        return old
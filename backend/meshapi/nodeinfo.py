@@ -0,0 +1,132 @@
+"""Change-only storage of node info and the typed self-telemetry series.
+
+Refreshes used to insert a full ``NodeInfo`` row each time. Now the row per
+node name is updated in place; a ``NodeInfoHistory`` row is added only when
+the content hash (everything except ``self_telemetry``) changes, and the
+telemetry readings go to the compact ``NodeTelemetry`` table.
+:func:`purge_node_telemetry` deletes readings older than
+``NODE_TELEMETRY_RETENTION_DAYS`` (default 365, 0 keeps them).
+"""
+import hashlib
+import json
+import os
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from django.db import transaction
+from django.utils import timezone
+
+from .ingest import _parse_battery
+from .models import NodeInfo, NodeInfoHistory, NodeTelemetry
+
+
+# Volatile keys that must not create a new history version
+_VOLATILE_KEYS = ("self_telemetry",)
+
+# LPP reading type -> NodeTelemetry column
+_LPP_FIELDS = {
+    "battery": "battery_percent",
+    "temperature": "temperature_c",
+    "humidity": "humidity",
+    "pressure": "pressure_hpa",
+    "barometer": "pressure_hpa",
+}
+
+
+def stable_data(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in (data or {}).items() if k not in _VOLATILE_KEYS}
+
+
+def content_hash(data: Dict[str, Any]) -> str:
+    raw = json.dumps(stable_data(data), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _num(v: Any) -> Optional[float]:
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return None
+    return f if f == f else None
+
+
+def parse_self_telemetry(st: Any) -> Optional[Dict[str, Any]]:
+    """Map a `self_telemetry` payload to NodeTelemetry columns; None if it has no readings."""
+    if not isinstance(st, dict):
+        return None
+    row: Dict[str, Any] = {"extra": {}}
+    for entry in st.get("lpp") or []:
+        if not isinstance(entry, dict):
+            continue
+        kind = str(entry.get("type") or "").lower()
+        val = _num(entry.get("value"))
+        if not kind or val is None:
+            continue
+        if kind == "voltage":
+            # LPP reports volts; keep millivolts like the contact telemetry
+            row.setdefault("battery_mv", int(round(val * 1000)) if val < 100 else int(val))
+        elif kind in _LPP_FIELDS:
+            row.setdefault(_LPP_FIELDS[kind], val)
+        else:
+            key = kind if kind not in row["extra"] else f"{kind}_{entry.get('channel')}"
+            row["extra"][key] = val
+    mv, pct = _parse_battery(st)
+    if mv is not None:
+        row.setdefault("battery_mv", mv)
+    if pct is not None:
+        row.setdefault("battery_percent", pct)
+    for key in ("uptime_s", "uptime_secs", "uptime"):
+        up = _num(st.get(key))
+        if up is not None:
+            row["uptime_s"] = int(up)
+            break
+    if not row["extra"]:
+        row.pop("extra")
+    if not row:
+        return None
+    return row
+
+
+def store_node_info(name: str, data: Dict[str, Any], fetched_at=None) -> NodeInfo:
+    """Update the current row of `name`, recording history and telemetry as needed."""
+    fetched_at = fetched_at or timezone.now()
+    digest = content_hash(data)
+    with transaction.atomic():
+        # Make sure the row exists, then lock it so concurrent writers serialize
+        NodeInfo.objects.bulk_create([NodeInfo(name=name, data={}, fetched_at=fetched_at)], ignore_conflicts=True)
+        obj = NodeInfo.objects.select_for_update().get(name=name)
+        changed = obj.content_hash != digest
+        obj.data = data
+        obj.fetched_at = fetched_at
+        if changed:
+            obj.content_hash = digest
+            obj.changed_at = fetched_at
+            NodeInfoHistory.objects.create(name=name, data=stable_data(data), content_hash=digest, fetched_at=fetched_at)
+        obj.save()
+        sample = parse_self_telemetry((data or {}).get("self_telemetry"))
+        if sample:
+            NodeTelemetry.objects.create(name=name, fetched_at=fetched_at, **sample)
+    return obj
+
+
+def node_telemetry_retention_days() -> Optional[float]:
+    try:
+        days = float(os.getenv("NODE_TELEMETRY_RETENTION_DAYS", "365"))
+    except Exception:
+        days = 365.0
+    # 0 or negative keeps data forever
+    return days if days > 0 else None
+
+
+def purge_node_telemetry(retention_days: Optional[float] = None, batch: int = 10000) -> int:
+    """Delete NodeTelemetry readings older than the retention; returns the row count."""
+    days = node_telemetry_retention_days() if retention_days is None else (retention_days if retention_days > 0 else None)
+    if days is None:
+        return 0
+    qs = NodeTelemetry.objects.filter(fetched_at__lt=timezone.now() - timedelta(days=days))
+    deleted = 0
+    while True:
+        ids = list(qs.values_list("id", flat=True)[:batch])
+        if not ids:
+            return deleted
+        deleted += NodeTelemetry.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,250 @@
+"""Incremental decoding and line splitting of the interactive CLI's PTY output.
+
+The session reader used to append every read to a byte buffer and decode the
+whole buffer again, which is quadratic for long lines without a newline (prompt
+echoes). :class:`PtyStreamTokenizer` instead keeps its state between chunks:
+
+- an incremental UTF-8 decoder holds back split multi-byte characters,
+- an ANSI escape sequence cut off at the end of a chunk is kept until the rest
+  arrives,
+- the unterminated tail of the current line is kept as a list of parts and
+  joined once, when its newline arrives.
+
+Each :meth:`~PtyStreamTokenizer.feed` returns the cleaned text (everything
+decoded so far, including an unterminated prompt) and the lines completed by
+this chunk.
+
+:class:`JsonFrameScanner` finds complete JSON objects/arrays in the same text
+as it arrives. It tracks bracket depth and string state between feeds, so each
+character is scanned once, and hands a balanced span to
+``json.JSONDecoder.raw_decode`` only when it closes. Frames start only at the
+beginning of a line or after a prompt, so prompts and chat lines around a
+reply (and brackets or quotes inside them) are skipped.
+
+No Django imports, so the benchmark can run standalone.
+"""
+import codecs
+import json
+import re
+from collections import deque
+from typing import Any, Deque, List, Optional, Tuple
+
+
+ANSI_RE = re.compile(r"\x1B\[[0-?]*[ -/]*[@-~]")
+# An escape sequence that may still be completed by the next chunk
+_ANSI_PARTIAL_RE = re.compile(r"\x1B(?:\[[0-?]*[ -/]*)?\Z")
+
+# Lines longer than this are emitted without waiting for the newline
+MAX_LINE_CHARS = 64 * 1024
+
+
+class PtyStreamTokenizer:
+    """Stateful bytes -> (clean text, complete lines) converter."""
+
+    def __init__(self, max_line_chars: int = MAX_LINE_CHARS) -> None:
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        self._esc = ""
+        self._tail: List[str] = []
+        self._tail_len = 0
+        self._max_line = max_line_chars
+
+    def feed(self, data: bytes, final: bool = False) -> Tuple[str, List[str]]:
+        text = self._decoder.decode(data, final)
+        if self._esc:
+            text = self._esc + text
+            self._esc = ""
+        if not text:
+            return "", []
+        esc_at = text.rfind("\x1b")
+        if esc_at != -1 and not final and _ANSI_PARTIAL_RE.match(text, esc_at):
+            self._esc = text[esc_at:]
+            text = text[:esc_at]
+        if "\x1b" in text:
+            text = ANSI_RE.sub("", text)
+        return text, self._split(text, final)
+
+    def _split(self, text: str, final: bool) -> List[str]:
+        lines: List[str] = []
+        last_nl = text.rfind("\n")
+        if last_nl == -1:
+            if text:
+                self._tail.append(text)
+                self._tail_len += len(text)
+        else:
+            head = text[: last_nl + 1]
+            if self._tail:
+                self._tail.append(head)
+                head = "".join(self._tail)
+                self._tail = []
+                self._tail_len = 0
+            lines.extend(head.splitlines())
+            rest = text[last_nl + 1 :]
+            if rest:
+                self._tail = [rest]
+                self._tail_len = len(rest)
+        if self._tail and (final or self._tail_len >= self._max_line):
+            lines.extend("".join(self._tail).splitlines())
+            self._tail = []
+            self._tail_len = 0
+        return lines
+
+    @property
+    def pending(self) -> str:
+        """The unterminated tail of the current line."""
+        return "".join(self._tail)
+
+
+PROMPT_SEP = "🭨"
+_BLANKS = " \t"
+_BREAKS = "\r\n"
+# First characters of a line that continues an open (pretty-printed) frame
+_JSON_LINE_START = frozenset('{}[]",-0123456789')
+_LITERALS = ("true", "false", "null")
+_FRAME_TOKEN_RE = re.compile(r'[\[\]{}"\r\n]')
+_STRING_TOKEN_RE = re.compile(r'["\\\r\n]')
+_TEXT_TOKEN_RE = re.compile("[\r\n" + PROMPT_SEP + "]")
+_CLOSERS = {"}": "{", "]": "["}
+
+
+def _line_kind(head: str) -> Optional[str]:
+    """Classify a line inside an open frame by its start: "json", "text" or None (undecided yet)."""
+    if head[0] in _JSON_LINE_START:
+        return "json"
+    for lit in _LITERALS:
+        if head.startswith(lit):
+            if len(head) == len(lit):
+                return None
+            return "json" if head[len(lit)] in " \t\r\n,]}" else "text"
+        if lit.startswith(head):
+            return None
+    # Chat lines (``Name (D): ...``), prompts and log lines start with a word
+    return "text"
+
+
+class JsonFrameScanner:
+    """Resumable scanner that yields each complete JSON value in a text stream.
+
+    A frame only starts at the beginning of a line or right after a prompt
+    (``NAME🭨 ``), so brackets and quotes inside chat text are never taken for
+    a reply. An open frame is dropped at a line break inside a string and at
+    a line that starts like text (a chat line, a prompt or a log line).
+    """
+
+    def __init__(self) -> None:
+        self.frames: Deque[Any] = deque()
+        self._decoder = json.JSONDecoder()
+        self._bol = True
+        self._reset()
+
+    def _reset(self) -> None:
+        self._stack: List[str] = []
+        self._parts: List[str] = []
+        self._in_string = False
+        self._skip_next = False
+        # Start of a line inside an open frame that cannot be classified yet
+        self._head = ""
+
+    def feed(self, text: str) -> Optional[Any]:
+        """Scan `text`; returns the first frame completed by it (all are queued in `frames`)."""
+        found = len(self.frames)
+        rest: Optional[str] = text
+        while rest:
+            rest = self._scan(rest)
+        return self.frames[found] if len(self.frames) > found else None
+
+    def _scan(self, text: str) -> Optional[str]:
+        """Scan one piece; returns text that has to be rescanned after a false start."""
+        i = 0
+        n = len(text)
+        seg_start = 0
+        while i < n:
+            if self._bol:
+                if not self._head:
+                    while i < n and text[i] in _BLANKS:
+                        i += 1
+                    if i == n:
+                        break
+                    if text[i] in _BREAKS:
+                        i += 1
+                        continue
+                if not self._stack:
+                    self._bol = False
+                    if text[i] in "{[":
+                        self._stack.append(text[i])
+                        seg_start = i
+                        i += 1
+                    continue
+                probe = self._head + text[i:i + 6]
+                kind = _line_kind(probe)
+                if kind is None:
+                    # Ran out of text in the middle of a literal; decide on the next feed
+                    self._head = probe
+                    i = n
+                    break
+                self._head = ""
+                if kind == "text":
+                    # The frame was not a reply; this line is scanned as text
+                    self._reset()
+                    continue
+                self._bol = False
+                continue
+            if not self._stack:
+                m = _TEXT_TOKEN_RE.search(text, i)
+                if m is None:
+                    return None
+                self._bol = True
+                i = m.end()
+                continue
+            if self._skip_next:
+                self._skip_next = False
+                i += 1
+                continue
+            if self._in_string:
+                m = _STRING_TOKEN_RE.search(text, i)
+                if m is None:
+                    break
+                tok = m.group()
+                i = m.end()
+                if tok == "\\":
+                    self._skip_next = True
+                elif tok == '"':
+                    self._in_string = False
+                else:
+                    # JSON strings cannot span lines
+                    self._reset()
+                    self._bol = True
+                continue
+            m = _FRAME_TOKEN_RE.search(text, i)
+            if m is None:
+                break
+            tok = m.group()
+            i = m.end()
+            if tok in _BREAKS:
+                self._bol = True
+            elif tok == '"':
+                self._in_string = True
+            elif tok in _CLOSERS:
+                if _CLOSERS[tok] != self._stack.pop():
+                    return self._retry("".join(self._parts) + text[seg_start:i], text[i:])
+                if not self._stack:
+                    candidate = "".join(self._parts) + text[seg_start:i]
+                    self._parts = []
+                    try:
+                        value, end = self._decoder.raw_decode(candidate)
+                    except ValueError:
+                        end = -1
+                    if end != len(candidate):
+                        return self._retry(candidate, text[i:])
+                    self.frames.append(value)
+                    self._reset()
+            else:
+                self._stack.append(tok)
+        if self._stack:
+            self._parts.append(text[seg_start:])
+        return None
+
+    def _retry(self, span: str, rest: str) -> str:
+        """The open frame was not JSON; rescan as text from just after its opening bracket."""
+        self._reset()
+        self._bol = False
+        return span[1:] + rest
@@ -0,0 +1,91 @@
+"""Bounded, offset-addressed text buffer for the interactive session output.
+
+Commands remember the absolute offset of the buffer end before they write, then
+read everything after it. :class:`ChunkedRingBuffer` keeps those offsets
+monotonic (they count every character ever appended) while dropping whole
+chunks from the front once the retained size exceeds the cap, so memory stays
+flat over long uptimes and appends never copy the retained text. Reading from
+an offset that has already been dropped raises :class:`BufferOverrun`.
+"""
+import os
+from collections import deque
+from typing import Deque, Optional
+
+
+# Small appends are merged until a chunk reaches this size
+CHUNK_CHARS = 4096
+
+
+class BufferOverrun(RuntimeError):
+    """The requested offset was trimmed from the buffer."""
+
+    def __init__(self, offset: int, start: int) -> None:
+        super().__init__(f"session output at offset {offset} was discarded (oldest retained offset is {start})")
+        self.offset = offset
+        self.start = start
+
+
+def buffer_max_chars() -> int:
+    try:
+        return max(CHUNK_CHARS, int(os.getenv("MESHCORE_BUFFER_MAX_BYTES", str(4 * 1024 * 1024))))
+    except Exception:
+        return 4 * 1024 * 1024
+
+
+class ChunkedRingBuffer:
+    """Append-only text with absolute offsets and a retained-size cap.
+
+    The cap is counted in characters, which matches bytes for the mostly ASCII
+    CLI output. Not thread-safe; the session guards it with its buffer lock.
+    """
+
+    def __init__(self, max_chars: Optional[int] = None) -> None:
+        self.max_chars = max_chars if max_chars is not None else buffer_max_chars()
+        self._chunks: Deque[str] = deque()
+        self._start = 0  # absolute offset of the first retained character
+        self._end = 0  # absolute offset one past the last character
+
+    @property
+    def start(self) -> int:
+        return self._start
+
+    @property
+    def end(self) -> int:
+        return self._end
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    def append(self, text: str) -> int:
+        """Append `text`; returns the new end offset."""
+        if not text:
+            return self._end
+        if self._chunks and len(self._chunks[-1]) + len(text) <= CHUNK_CHARS:
+            self._chunks[-1] += text
+        else:
+            self._chunks.append(text)
+        self._end += len(text)
+        # Drop whole chunks from the front, always keeping the newest one
+        while len(self._chunks) > 1 and self._end - self._start > self.max_chars:
+            self._start += len(self._chunks.popleft())
+        return self._end
+
+    def read(self, offset: int, end: Optional[int] = None) -> str:
+        """Return the text between absolute offsets `offset` and `end` (default: buffer end)."""
+        end = self._end if end is None else min(end, self._end)
+        if offset < self._start:
+            raise BufferOverrun(offset, self._start)
+        if offset >= end:
+            return ""
+        # Walk back from the newest chunk; readers almost always want recent output
+        parts = []
+        pos = self._end
+        for chunk in reversed(self._chunks):
+            chunk_start = pos - len(chunk)
+            if chunk_start < end:
+                parts.append(chunk[max(0, offset - chunk_start) : end - chunk_start])
+            if chunk_start <= offset:
+                break
+            pos = chunk_start
+        parts.reverse()
+        return "".join(parts)
@@ -0,0 +1,236 @@
+"""Incremental telemetry rollups and raw-row retention.
+
+:func:`rollup_telemetry` reads ``ContactTelemetry`` rows above the stored
+high-water mark (``Checkpoint`` key ``telemetry_rollup``) in id order, folds
+them into 5 minute / 1 hour / 1 day ``ContactTelemetryRollup`` buckets and
+advances the mark in the same transaction. Only buckets that received new rows
+are read and written.
+
+:func:`purge_raw_telemetry` deletes raw rows older than
+``TELEMETRY_RAW_RETENTION_DAYS`` that are already below the high-water mark,
+and trims fine-grained buckets past their own retention.
+"""
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import Checkpoint, ContactTelemetry, ContactTelemetryRollup
+
+
+CHECKPOINT_KEY = "telemetry_rollup"
+
+METRICS = ContactTelemetryRollup.METRICS
+BUCKETS = ContactTelemetryRollup.BUCKET_SECONDS
+
+# Rows younger than this are left for the next run, so rows committed slightly
+# out of id order by concurrent writers are not skipped by the high-water mark
+_SETTLE_S = 60
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+_UPDATE_FIELDS = ["samples", "updated_at"] + [f"{m}_{agg}" for m in METRICS for agg in ("count", "sum", "min", "max")]
+
+
+def _env_days(name: str, default: Optional[float]) -> Optional[float]:
+    raw = os.getenv(name)
+    if raw is None or raw.strip() == "":
+        return default
+    try:
+        days = float(raw)
+    except Exception:
+        return default
+    # 0 or negative keeps data forever
+    return days if days > 0 else None
+
+
+def raw_retention_days() -> Optional[float]:
+    return _env_days("TELEMETRY_RAW_RETENTION_DAYS", 30)
+
+
+def rollup_retention_days() -> Dict[str, Optional[float]]:
+    return {
+        ContactTelemetryRollup.BUCKET_5M: _env_days("TELEMETRY_ROLLUP_5M_RETENTION_DAYS", 14),
+        ContactTelemetryRollup.BUCKET_1H: _env_days("TELEMETRY_ROLLUP_1H_RETENTION_DAYS", 400),
+        ContactTelemetryRollup.BUCKET_1D: None,
+    }
+
+
+def bucket_start(ts: datetime, bucket: str) -> datetime:
+    """Floor `ts` to the start of its bucket (UTC aligned)."""
+    size = BUCKETS[bucket]
+    secs = int((ts - _EPOCH).total_seconds())
+    return _EPOCH + timedelta(seconds=secs - secs % size)
+
+
+def _new_acc() -> Dict[str, Any]:
+    acc: Dict[str, Any] = {"samples": 0}
+    for m in METRICS:
+        acc[f"{m}_count"] = 0
+        acc[f"{m}_sum"] = 0.0
+        acc[f"{m}_min"] = None
+        acc[f"{m}_max"] = None
+    return acc
+
+
+def _fold(acc: Dict[str, Any], values: Tuple[Any, ...]) -> None:
+    acc["samples"] += 1
+    for m, v in zip(METRICS, values):
+        if v is None:
+            continue
+        v = float(v)
+        acc[f"{m}_count"] += 1
+        acc[f"{m}_sum"] += v
+        lo, hi = acc[f"{m}_min"], acc[f"{m}_max"]
+        acc[f"{m}_min"] = v if lo is None else min(lo, v)
+        acc[f"{m}_max"] = v if hi is None else max(hi, v)
+
+
+def _merge_into(row: ContactTelemetryRollup, acc: Dict[str, Any]) -> None:
+    row.samples += acc["samples"]
+    for m in METRICS:
+        setattr(row, f"{m}_count", getattr(row, f"{m}_count") + acc[f"{m}_count"])
+        setattr(row, f"{m}_sum", getattr(row, f"{m}_sum") + acc[f"{m}_sum"])
+        for agg, pick in (("min", min), ("max", max)):
+            cur, new = getattr(row, f"{m}_{agg}"), acc[f"{m}_{agg}"]
+            if new is not None:
+                setattr(row, f"{m}_{agg}", new if cur is None else pick(cur, new))
+
+
+def _rollup_chunk(rows: List[Tuple[Any, ...]]) -> int:
+    """Fold one chunk of (id, contact_id, fetched_at, *metrics) rows; returns buckets touched."""
+    accs: Dict[Tuple[int, str, datetime], Dict[str, Any]] = {}
+    for _id, contact_id, fetched_at, *values in rows:
+        for bucket in BUCKETS:
+            key = (contact_id, bucket, bucket_start(fetched_at, bucket))
+            acc = accs.get(key)
+            if acc is None:
+                acc = accs[key] = _new_acc()
+            _fold(acc, tuple(values))
+
+    now = timezone.now()
+    existing: Dict[Tuple[int, str, datetime], ContactTelemetryRollup] = {}
+    for bucket in BUCKETS:
+        keys = [k for k in accs if k[1] == bucket]
+        starts = [k[2] for k in keys]
+        qs = ContactTelemetryRollup.objects.filter(
+            bucket=bucket,
+            contact_id__in={k[0] for k in keys},
+            bucket_start__gte=min(starts),
+            bucket_start__lte=max(starts),
+        )
+        for r in qs:
+            key = (r.contact_id, r.bucket, r.bucket_start)
+            if key in accs:
+                existing[key] = r
+
+    to_create: List[ContactTelemetryRollup] = []
+    to_update: List[ContactTelemetryRollup] = []
+    for key, acc in accs.items():
+        row = existing.get(key)
+        if row is None:
+            row = ContactTelemetryRollup(contact_id=key[0], bucket=key[1], bucket_start=key[2], updated_at=now)
+            _merge_into(row, acc)
+            to_create.append(row)
+        else:
+            _merge_into(row, acc)
+            row.updated_at = now
+            to_update.append(row)
+    if to_create:
+        ContactTelemetryRollup.objects.bulk_create(to_create, batch_size=1000)
+    if to_update:
+        ContactTelemetryRollup.objects.bulk_update(to_update, _UPDATE_FIELDS, batch_size=500)
+    return len(accs)
+
+
+def rollup_telemetry(chunk: int = 5000, max_chunks: Optional[int] = None) -> Dict[str, int]:
+    """Fold new raw rows into the rollup buckets; returns run statistics."""
+    stats = {"rows": 0, "buckets": 0, "chunks": 0}
+    Checkpoint.objects.get_or_create(key=CHECKPOINT_KEY)
+    cutoff = timezone.now() - timedelta(seconds=_SETTLE_S)
+    # Stop before the first row that is still settling
+    upper = ContactTelemetry.objects.filter(fetched_at__gte=cutoff).aggregate(m=Min("id"))["m"]
+    while max_chunks is None or stats["chunks"] < max_chunks:
+        with transaction.atomic():
+            cp = Checkpoint.objects.select_for_update().get(key=CHECKPOINT_KEY)
+            qs = ContactTelemetry.objects.filter(id__gt=cp.position)
+            if upper is not None:
+                qs = qs.filter(id__lt=upper)
+            rows = list(qs.order_by("id").values_list("id", "contact_id", "fetched_at", *METRICS)[:chunk])
+            if not rows:
+                break
+            stats["buckets"] += _rollup_chunk(rows)
+            cp.position = rows[-1][0]
+            cp.updated_at = timezone.now()
+            cp.save(update_fields=["position", "updated_at"])
+        stats["rows"] += len(rows)
+        stats["chunks"] += 1
+        if len(rows) < chunk:
+            break
+    return stats
+
+
+def purge_raw_telemetry(retention_days: Optional[float] = None, batch: int = 10000) -> Dict[str, int]:
+    """Delete rolled-up raw rows and expired fine buckets; returns deleted counts."""
+    stats = {"raw": 0, "rollups": 0}
+    days = raw_retention_days() if retention_days is None else (retention_days if retention_days > 0 else None)
+    if days is not None:
+        hwm = Checkpoint.objects.filter(key=CHECKPOINT_KEY).values_list("position", flat=True).first() or 0
+        older = timezone.now() - timedelta(days=days)
+        # Never delete rows the rollup has not consumed yet
+        qs = ContactTelemetry.objects.filter(fetched_at__lt=older, id__lte=hwm)
+        while True:
+            ids = list(qs.values_list("id", flat=True)[:batch])
+            if not ids:
+                break
+            stats["raw"] += ContactTelemetry.objects.filter(id__in=ids).delete()[0]
+    for bucket, keep in rollup_retention_days().items():
+        if keep is None:
+            continue
+        stats["rollups"] += ContactTelemetryRollup.objects.filter(
+            bucket=bucket, bucket_start__lt=timezone.now() - timedelta(days=keep)
+        ).delete()[0]
+    return stats
+
+
+def choose_bucket(start: datetime, end: datetime, max_points: int = 600) -> str:
+    """Pick the finest bucket that stays under `max_points` and is still retained."""
+    span = max(1.0, (end - start).total_seconds())
+    now = timezone.now()
+    retention = rollup_retention_days()
+    for bucket, size in sorted(BUCKETS.items(), key=lambda kv: kv[1]):
+        keep = retention.get(bucket)
+        if keep is not None and start < now - timedelta(days=keep):
+            continue
+        if span / size <= max_points:
+            return bucket
+    return ContactTelemetryRollup.BUCKET_1D
+
+
+def telemetry_series(contact_id: int, start: datetime, end: datetime, bucket: str) -> List[Tuple[datetime, Dict[str, Any]]]:
+    """Return [(bucket_start, accumulator)] for start <= t < end, oldest first.
+
+    Stored rollups are merged with raw rows the rollup job has not reached yet,
+    so the newest buckets are complete without waiting for the next run.
+    """
+    series: Dict[datetime, Dict[str, Any]] = {}
+    cols = ["bucket_start", "samples"] + _UPDATE_FIELDS[2:]
+    rows = ContactTelemetryRollup.objects.filter(
+        contact_id=contact_id, bucket=bucket, bucket_start__gte=bucket_start(start, bucket), bucket_start__lt=end,
+    ).order_by("bucket_start").values(*cols)
+    for r in rows:
+        series[r.pop("bucket_start")] = r
+    hwm = Checkpoint.objects.filter(key=CHECKPOINT_KEY).values_list("position", flat=True).first() or 0
+    tail = ContactTelemetry.objects.filter(
+        contact_id=contact_id, id__gt=hwm, fetched_at__gte=start, fetched_at__lt=end,
+    ).values_list("fetched_at", *METRICS)
+    for fetched_at, *values in tail:
+        key = bucket_start(fetched_at, bucket)
+        acc = series.get(key)
+        if acc is None:
+            acc = series[key] = _new_acc()
+        _fold(acc, tuple(values))
+    return sorted(series.items(), key=lambda kv: kv[0])
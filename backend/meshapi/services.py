@@ -12,14 +12,22 @@ from typing import Any, Dict, Tuple, Optional, List
 
 from django.utils import timezone
 
+from .airtime import AirtimeDeferred, charge as charge_airtime
+from .actions import enqueue_actions, new_action
+from .automation import get_rule_engine
+from .broker import broker_address, get_broker_client
+from .chat import extract_and_store_chats, store_incoming_message
+from .coordination import release, try_acquire, wait_released
+from .ingest import ContactSnapshot, get_ingest_buffer, persist_contact_batch
+from .nodeinfo import store_node_info
+from .mqtt_publisher import get_mqtt_publisher, load_config as load_mqtt_config
 from .models import (
     NodeInfo,
     Contact,
-    ContactTelemetry,
     CollectorConfig,
     Message,
     AutomationRule,
-    MQTTConfig,
+    AutomationAction,
 )
 
 
@@ -57,11 +65,21 @@ DEFAULT_CONTACTS_SAMPLE: List[Dict[str, Any]] = [
     },
 ]
 
-# Lightweight throttling for background refresh tasks to avoid spawning too many workers
+# Node info refreshes are single-flight across all processes (see meshapi.coordination);
+# a refresh may start at most this often, and a crashed holder's lease expires after the TTL
 _EXTRAS_REFRESH_MIN_INTERVAL_S = 20.0
 _BASE_REFRESH_MIN_INTERVAL_S = 10.0
-_last_extras_refresh_started: float = 0.0
-_last_base_refresh_started: float = 0.0
+_NODE_REFRESH_LEASE_TTL_S = 120.0
+# How long a request waits for another worker's initial fetch; well below gunicorn's --timeout
+_NODE_REFRESH_WAIT_S = 25.0
+
+
+class NodeRefreshBusy(RuntimeError):
+    """Another worker is still fetching a node that has no cached info yet."""
+
+    def __init__(self, name: str, retry_after_s: float) -> None:
+        super().__init__(f"node info for {name} is being fetched, retry in {retry_after_s:.0f}s")
+        self.retry_after_s = retry_after_s
 
 
 def _parse_json_output(output: str) -> Any:
@@ -83,6 +101,11 @@ def _parse_json_output(output: str) -> Any:
         raise
 
 
+# Without a broker each command is a one-shot meshcore-cli process on the same
+# device; the collector lanes and action workers take turns instead of overlapping
+_direct_cli_lock = threading.Lock()
+
+
 def _meshcore_bin() -> str:
     return (os.getenv("MESHCORE_CLI") or "meshcore-cli").strip() or "meshcore-cli"
 
@@ -91,17 +114,33 @@ def _meshcore_target() -> str:
     return (os.getenv("MESHCORE_TARGET") or "").strip()
 
 
-def _exec_cli_json(command: str, timeout: int = 30) -> Tuple[str, Any]:
-    """Execute meshcore-cli once with --json and return (stdout, parsed_data).
+def _exec_cli_json(command: str, timeout: int = 30, charge: bool = True) -> Tuple[str, Any]:
+    """Execute a meshcore-cli command in JSON mode and return (stdout, parsed_data).
 
-    We pass the command as a single string argument to --json, allowing spaces/quotes within.
+    When `MESHCORE_BROKER` is set, the command is sent to the shared broker process
+    which owns the device connection; inline chat lines are then persisted by the
+    broker's session reader and stdout only carries the JSON payload.
+
+    Otherwise meshcore-cli runs once with --json; we pass the command as a single
+    string argument, allowing spaces/quotes within.
+
+    Commands that transmit are first charged against the shared airtime budget
+    (raises `AirtimeDeferred` when it is too low for the caller's priority).
+    Callers that try several variants of one send charge it once themselves
+    and pass `charge=False`.
     """
+    if charge:
+        charge_airtime(command)
+    if broker_address():
+        data = get_broker_client().run_json(command, timeout=timeout)
+        return json.dumps(data, ensure_ascii=False), data
     meshcore_bin = _meshcore_bin()
     target = _meshcore_target()
     if not target:
         raise RuntimeError("MESHCORE_TARGET not configured")
     args = [meshcore_bin, "-t", target, "-j"] + shlex.split(command)
-    proc = subprocess.run(args, capture_output=True, text=True, timeout=timeout)
+    with _direct_cli_lock:
+        proc = subprocess.run(args, capture_output=True, text=True, timeout=timeout)
     if proc.returncode != 0:
         raise RuntimeError(f"meshcore-cli failed ({proc.returncode}): {proc.stderr.strip() or proc.stdout.strip()}")
     stdout = proc.stdout or ""
@@ -109,6 +148,27 @@ def _exec_cli_json(command: str, timeout: int = 30) -> Tuple[str, Any]:
     return stdout, data
 
 
+def _exec_cli_text(command: str, timeout: int = 15, charge: bool = True) -> str:
+    """Execute a meshcore-cli command in plain text mode and return its output.
+
+    Goes through the broker when configured, else runs meshcore-cli once.
+    Charges airtime like `_exec_cli_json`.
+    """
+    if charge:
+        charge_airtime(command)
+    if broker_address():
+        return get_broker_client().run_text(command, timeout=timeout)
+    meshcore_bin = _meshcore_bin()
+    target = _meshcore_target()
+    if not target:
+        raise RuntimeError("MESHCORE_TARGET not configured")
+    with _direct_cli_lock:
+        proc = subprocess.run([meshcore_bin, "-t", target] + shlex.split(command), capture_output=True, text=True, timeout=timeout)
+    if proc.returncode != 0:
+        raise RuntimeError(f"meshcore-cli failed ({proc.returncode}): {proc.stderr.strip() or proc.stdout.strip()}")
+    return proc.stdout or ""
+
+
 def _run_self_telemetry() -> Optional[Dict[str, Any]]:
     """Return self telemetry from the local node via one-shot JSON.
 
@@ -159,96 +219,7 @@ def _extract_and_persist_chats(raw: str) -> None:
 
     Handles concatenated messages and prompt echoes gracefully.
     """
-    if not raw:
-        return
-    # Delimiter '(D):' and prompt separator '🭨'
-    delim_re = re.compile(r"\(D\):\s*")
-    prompt_names = re.findall(r"(?<!\w)([A-Za-z0-9][A-Za-z0-9_-]{0,63})🭨", raw)
-    prompt_positions = [m.start() for m in re.finditer("🭨", raw)]
-
-    delims = list(delim_re.finditer(raw))
-    if not delims:
-        return
-    try:
-        known_names = list(Contact.objects.exclude(name="").values_list("name", flat=True))
-    except Exception:
-        known_names = []
-    known_names = sorted(set(n for n in known_names if isinstance(n, str)), key=len, reverse=True)
-
-    parts = []
-    for i, d in enumerate(delims):
-        name_end = d.start()
-        while name_end > 0 and raw[name_end - 1].isspace():
-            name_end -= 1
-        text_start = d.end()
-        left_bound = 0
-        if i > 0:
-            left_bound = max(left_bound, delims[i - 1].end())
-        if prompt_positions:
-            left_bound = max(left_bound, max([p + 1 for p in prompt_positions if p < name_end], default=0))
-        window = raw[left_bound:name_end].rstrip()
-        name = None
-        for kn in known_names:
-            if window.endswith(kn):
-                name = kn
-                name_start = name_end - len(kn)
-                break
-        if not name:
-            tail = window[-64:]
-            m_tail = re.search(r"([A-Za-z0-9 _\-]{1,64})\s*$", tail)
-            if m_tail:
-                cand = m_tail.group(1).strip()
-                if cand:
-                    name = cand
-                    name_start = name_end - len(cand)
-            if not name:
-                cand = window[-16:].strip()
-                name = cand
-                name_start = name_end - len(cand)
-        parts.append({"name": name or "", "name_start": name_start, "text_start": text_start})
-
-    for i, part in enumerate(parts):
-        name = part["name"].strip()
-        if not name:
-            continue
-        text_start = part["text_start"]
-        next_name_start = parts[i + 1]["name_start"] if i + 1 < len(parts) else None
-        sep_pos = raw.find("🭨", text_start)
-        text_end = len(raw)
-        if next_name_start is not None:
-            text_end = min(text_end, next_name_start)
-        if sep_pos != -1:
-            text_end = min(text_end, sep_pos)
-        text = raw[text_start:text_end].strip()
-        if not text:
-            continue
-        if prompt_names:
-            for pn in prompt_names:
-                if pn and text.endswith(pn):
-                    text = text[: -len(pn)].rstrip()
-                    break
-        if not text:
-            continue
-        # Persist
-        contact = Contact.objects.filter(name=name).order_by("-last_seen").first()
-        try:
-            cutoff = timezone.now() - timedelta(seconds=3)
-            if Message.objects.filter(direction="in", name=name, text=text, ts__gte=cutoff).exists():
-                continue
-        except Exception:
-            pass
-        try:
-            Message.objects.create(
-                contact=contact,
-                name=name,
-                public_key=contact.public_key if contact else None,
-                direction="in",
-                text=text,
-                ts=timezone.now(),
-                raw=raw,
-            )
-        except Exception:
-            pass
+    extract_and_store_chats(raw)
 
 
 def _run_info_command(name: str) -> Dict[str, Any]:
@@ -304,14 +275,12 @@ def _run_contacts_command() -> List[Dict[str, Any]]:
             stdout, data = _exec_cli_json("contacts")
         except Exception as e:
             # Fallback to text run (without --json) to try parse plain output
-            meshcore_bin = _meshcore_bin()
-            target = _meshcore_target()
-            if not target:
+            if not broker_address() and not _meshcore_target():
                 raise
-            proc = subprocess.run([meshcore_bin, "-t", target, "contacts"], capture_output=True, text=True, timeout=15)
-            if proc.returncode != 0:
-                raise RuntimeError(f"Contacts command failed ({proc.returncode}): {proc.stderr.strip() or proc.stdout.strip()}")
-            raw = proc.stdout or ""
+            try:
+                raw = _exec_cli_text("contacts", timeout=15)
+            except Exception as te:
+                raise RuntimeError(f"Contacts command failed: {te}")
             _extract_and_persist_chats(raw)
             # Fall through to plain text parsing below
         else:
@@ -479,119 +448,49 @@ def _ensure_contact_info_json(raw: str) -> Dict[str, Any]:
 
 
 def _persist_contact_info(info: Dict[str, Any]) -> None:
-    """Persist contact + telemetry snapshot.
+    """Queue a contact + telemetry snapshot for write-behind persistence.
 
-    Accepts dicts from various CLI calls. Tries to resolve contact via
-    public_key, else via adv_name/name.
+    Accepts dicts from various CLI calls. The ingest buffer resolves the contact
+    via public_key, else via adv_name/name, and writes batches of snapshots with
+    a constant number of queries (see `meshapi.ingest`).
     """
-    public_key = info.get("public_key")
-    adv_name = info.get("adv_name") or info.get("name") or ""
-
-    contact: Optional[Contact] = None
-    if isinstance(public_key, str) and public_key:
-        contact, _ = Contact.objects.get_or_create(public_key=public_key, defaults={
-            "name": adv_name or "",
-            "first_seen": timezone.now(),
-            "last_seen": timezone.now(),
-        })
-    elif adv_name:
-        try:
-            contact = Contact.objects.filter(name=adv_name).order_by("-last_seen").first()
-        except Exception:
-            contact = None
-        if contact is None:
-            # Cannot persist without resolving a contact
-            return
+    get_ingest_buffer().add(info)
 
-    # Update latest name/last_seen
-    changed = False
-    if adv_name and adv_name != (contact.name or ""):
-        contact.name = adv_name
-        changed = True
-    contact.last_seen = timezone.now()
-    if changed:
-        contact.save()
-    else:
-        # still update last_seen without touching other fields
-        Contact.objects.filter(pk=contact.pk).update(last_seen=contact.last_seen)
-
-    # Battery parsing heuristics (from various CLI payloads)
-    def _parse_battery(payload: Dict[str, Any]) -> Tuple[Optional[int], Optional[float]]:
-        mv: Optional[int] = None
-        pct: Optional[float] = None
-        # candidates
-        candidates_mv = [
-            payload.get("battery_mv"), payload.get("bat_mv"), payload.get("vbat_mv"), payload.get("vbat"), payload.get("vbatt"),
-        ]
-        candidates_pct = [
-            payload.get("battery_percent"), payload.get("battery"), payload.get("bat_percent"), payload.get("soc"), payload.get("charge"),
-        ]
-        # Some responses use 'level' for battery; interpret by range
-        lvl = payload.get("level")
-        if lvl is not None:
-            try:
-                val = float(lvl)
-                if val > 1000:
-                    mv = int(val)
-                elif 0 <= val <= 100:
-                    pct = float(val)
-                elif 0.0 < val < 1.0:
-                    pct = float(val) * 100.0
-            except Exception:
-                pass
-        # Direct candidates
-        for v in candidates_mv:
-            try:
-                if v is None:
-                    continue
-                vi = int(v)
-                if vi > 1000:
-                    mv = vi
-                    break
-            except Exception:
-                continue
-        for v in candidates_pct:
-            try:
-                if v is None:
-                    continue
-                vf = float(v)
-                if 0.0 <= vf <= 1.0:
-                    pct = vf * 100.0
-                    break
-                if 0.0 <= vf <= 100.0:
-                    pct = vf
-                    break
-            except Exception:
-                continue
-        return mv, pct
-
-    bat_mv, bat_pct = _parse_battery(info)
-
-    # Store telemetry snapshot
-    ContactTelemetry.objects.create(
-        contact=contact,
-        adv_name=adv_name or "",
-        last_advert=info.get("last_advert"),
-        adv_lat=info.get("adv_lat"),
-        adv_lon=info.get("adv_lon"),
-        rssi=info.get("rssi"),
-        snr=info.get("snr"),
-        battery_mv=bat_mv,
-        battery_percent=bat_pct,
-        type=info.get("type"),
-        flags=info.get("flags"),
-        out_path_len=info.get("out_path_len"),
-        out_path=info.get("out_path") or "",
-        lastmod=info.get("lastmod"),
-        raw=info,
-    )
-
-    # Reconcile past messages that arrived before contact was known (no public_key)
-    try:
-        if adv_name:
-            Message.objects.filter(name=adv_name, public_key__isnull=True).update(public_key=public_key, contact=contact)
-    except Exception:
-        pass
+
+# Fields a `contacts` entry must all carry to count as a complete telemetry snapshot
+_SNAPSHOT_FIELDS = ("adv_lat", "adv_lon", "last_advert", "lastmod")
+
+
+def ingest_contacts_snapshot(items: List[Any]) -> List[str]:
+    """Persist a full `contacts` payload in one pass.
+
+    Contacts are upserted in bulk by public_key and one telemetry row per entry
+    is written with a single bulk insert (synchronously, unlike the buffered
+    per-contact path). Returns the CLI names of entries that lack a public key
+    or any of the position/advert fields, i.e. the only contacts that still
+    need a `contact_info` round-trip.
+    """
+    now = timezone.now()
+    by_key: Dict[str, Dict[str, Any]] = {}
+    missing: List[str] = []
+    for it in items:
+        if isinstance(it, str):
+            missing.append(it)
+            continue
+        if not isinstance(it, dict):
+            continue
+        public_key = it.get("public_key")
+        adv_name = it.get("adv_name") or it.get("name") or ""
+        complete = all(it.get(f) is not None for f in _SNAPSHOT_FIELDS)
+        if not (isinstance(public_key, str) and public_key) or not complete:
+            n = adv_name or public_key
+            if n:
+                missing.append(str(n))
+            continue
+        by_key[public_key] = it
+    if by_key:
+        persist_contact_batch([ContactSnapshot(info, fetched_at=now) for info in by_key.values()])
+    return missing
 
 
 def get_collector_interval_default() -> int:
@@ -701,6 +600,28 @@ def _run_meshcore_with_pty(meshcore_bin: str, target: str, lines: List[str], tim
             pass
 
 
+def _node_refresh_key(name: str) -> str:
+    return f"node-refresh:{name}"[:64]
+
+
+def _collect_node_info(name: str, base_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Run `infos` (unless base_data is given) and enrich with self telemetry and device info."""
+    info = base_data if base_data is not None else _run_info_command(name)
+    try:
+        st = _run_self_telemetry()
+        if isinstance(st, dict):
+            info["self_telemetry"] = st
+    except Exception:
+        pass
+    try:
+        dv = _run_version_info()
+        if isinstance(dv, dict):
+            info["device_info"] = dv
+    except Exception:
+        pass
+    return info
+
+
 def get_or_refresh_node_info(
     name: str,
     max_age_seconds: int = 3600,
@@ -708,51 +629,47 @@ def get_or_refresh_node_info(
     """
     Return cached info if fresh; otherwise refresh by running command.
 
-    Saves refreshed results to DB.
+    Saves refreshed results to DB. Only one refresh per node runs at a time
+    across all workers; concurrent callers get the cached row, or wait for
+    the running initial fetch and reuse its result. Raises
+    :class:`NodeRefreshBusy` if that fetch is still running (or another one
+    took over) after `_NODE_REFRESH_WAIT_S`.
     """
     now = timezone.now()
     cutoff = now - timedelta(seconds=max_age_seconds)
+    lease_key = _node_refresh_key(name)
 
-    latest: Optional[NodeInfo] = NodeInfo.objects.filter(name=name).order_by("-fetched_at").first()
+    latest: Optional[NodeInfo] = NodeInfo.objects.filter(name=name).first()
 
     # Helper: perform background refresh (base infos and/or extras) without blocking response
     def _spawn_background_refresh(refresh_base: bool, base_data: Optional[Dict[str, Any]] = None) -> None:
-        global _last_extras_refresh_started, _last_base_refresh_started
-        now_m = time.monotonic()
-        if refresh_base:
-            if now_m - _last_base_refresh_started < _BASE_REFRESH_MIN_INTERVAL_S:
-                return
-            _last_base_refresh_started = now_m
-        else:
-            if now_m - _last_extras_refresh_started < _EXTRAS_REFRESH_MIN_INTERVAL_S:
-                return
-            _last_extras_refresh_started = now_m
+        min_interval = _BASE_REFRESH_MIN_INTERVAL_S if refresh_base else _EXTRAS_REFRESH_MIN_INTERVAL_S
+        try:
+            token = try_acquire(lease_key, _NODE_REFRESH_LEASE_TTL_S, min_interval)
+        except Exception:
+            return
+        if token is None:
+            # Another worker is refreshing (or just did); its row will be served next time
+            return
+
         def _job():
             try:
-                info = base_data if base_data is not None else None
+                info = base_data
                 if refresh_base or info is None:
                     try:
                         info = _run_info_command(name)
                     except Exception:
                         info = base_data or {}
-                # Enrich with extras (self telemetry + device info)
-                try:
-                    st = _run_self_telemetry()
-                    if isinstance(st, dict):
-                        info["self_telemetry"] = st
-                except Exception:
-                    pass
-                try:
-                    dv = _run_version_info()
-                    if isinstance(dv, dict):
-                        info["device_info"] = dv
-                except Exception:
-                    pass
+                info = _collect_node_info(name, info)
                 data_name = (info or {}).get("name") or name
-                NodeInfo.objects.create(name=data_name, data=info or {}, fetched_at=timezone.now())
+                store_node_info(data_name, info or {}, timezone.now())
             except Exception:
                 pass
             finally:
+                try:
+                    release(lease_key, token)
+                except Exception:
+                    pass
                 try:
                     # Ensure thread DB connection is not leaked
                     from django.db import connection as _conn  # local import to avoid top-level cost
@@ -764,7 +681,7 @@ def get_or_refresh_node_info(
             t = threading.Thread(target=_job, daemon=True)
             t.start()
         except Exception:
-            pass
+            release(lease_key, token)
 
     if latest and latest.fetched_at >= cutoff:
         # Return cached data immediately; trigger non-blocking extras update
@@ -778,23 +695,24 @@ def get_or_refresh_node_info(
         _spawn_background_refresh(refresh_base=True)
         return data, latest.fetched_at
 
-    # No cached entry: perform a blocking initial fetch
-    data = _run_info_command(name)
-    # Enrich with extras inline for the very first fetch
-    try:
-        st = _run_self_telemetry()
-        if isinstance(st, dict):
-            data["self_telemetry"] = st
-    except Exception:
-        pass
+    # No cached entry: perform a blocking initial fetch, once for all workers
+    token = try_acquire(lease_key, _NODE_REFRESH_LEASE_TTL_S)
+    if token is None:
+        wait_released(lease_key, _NODE_REFRESH_WAIT_S)
+        latest = NodeInfo.objects.filter(name=name).first()
+        if latest:
+            return dict(latest.data or {}), latest.fetched_at
+        # The other fetch failed; try ourselves, unless it (or another one) still runs
+        token = try_acquire(lease_key, _NODE_REFRESH_LEASE_TTL_S)
+        if token is None:
+            raise NodeRefreshBusy(name, _NODE_REFRESH_WAIT_S)
     try:
-        dv = _run_version_info()
-        if isinstance(dv, dict):
-            data["device_info"] = dv
-    except Exception:
-        pass
-    data_name = data.get("name") or name
-    obj = NodeInfo.objects.create(name=data_name, data=data, fetched_at=now)
+        # Enrich with extras inline for the very first fetch
+        data = _collect_node_info(name)
+        data_name = data.get("name") or name
+        obj = store_node_info(data_name, data, now)
+    finally:
+        release(lease_key, token)
     return obj.data, obj.fetched_at
 
 
@@ -818,6 +736,7 @@ def send_chat_message(name: str, text: str, client_id: Optional[str] = None) ->
     # Prefer explicit shell template if provided
     cmd_tpl = (os.getenv("MESH_MSG_COMMAND") or "").strip()
     if cmd_tpl:
+        charge_airtime(f"msg {qname} " + shlex.quote(text_clean))
         cmd = cmd_tpl.format(name=name, text=text_clean)
         proc = subprocess.run(["/bin/sh", "-lc", cmd], capture_output=True, text=True, timeout=15)
         if proc.returncode != 0:
@@ -828,17 +747,21 @@ def send_chat_message(name: str, text: str, client_id: Optional[str] = None) ->
         # One-shot JSON via meshcore-cli; quote message as a single token.
         qtext = '"' + text_clean.replace('"', '\\"') + '"'
         mesh_cmd = f"msg {qname} {qtext}"
+        # One message, one charge: the text fallback resends the same packet
+        charge_airtime(mesh_cmd)
         try:
-            stdout, data = _exec_cli_json(mesh_cmd)
+            stdout, data = _exec_cli_json(mesh_cmd, charge=False)
             output = stdout
+        except AirtimeDeferred:
+            raise
         except Exception:
             # Fallback to plain text mode
-            meshcore_bin = _meshcore_bin()
-            target = _meshcore_target()
-            proc = subprocess.run([meshcore_bin, "-t", target, mesh_cmd], capture_output=True, text=True, timeout=15)
-            if proc.returncode != 0:
-                raise RuntimeError(f"msg failed ({proc.returncode}): {proc.stderr.strip() or proc.stdout.strip()}")
-            output = proc.stdout or ""
+            try:
+                output = _exec_cli_text(mesh_cmd, timeout=15, charge=False)
+            except AirtimeDeferred:
+                raise
+            except Exception as e:
+                raise RuntimeError(f"msg failed: {e}")
         _extract_and_persist_chats(output)
 
     # Lightweight status heuristic from CLI output
@@ -876,12 +799,6 @@ def send_chat_message(name: str, text: str, client_id: Optional[str] = None) ->
 
 
 # --- Automations ------------------------------------------------------------
-try:  # optional import for MQTT publish support
-    import paho.mqtt.client as mqtt  # type: ignore
-except Exception:  # pragma: no cover
-    mqtt = None
-
-
 def _render_template(tpl: str, ctx: Dict[str, Any]) -> str:
     """Very small, safe templating: replaces {key} or {1}..{n} with values in ctx.
 
@@ -903,104 +820,45 @@ def _render_template(tpl: str, ctx: Dict[str, Any]) -> str:
     return re.sub(r"\{([^{}]+)\}", repl, s)
 
 
-def _match_rule(rule: AutomationRule, *, name: str, public_key: Optional[str], direction: str, text: str) -> Optional[Dict[str, Any]]:
-    if not rule.enabled:
-        return None
-    if rule.only_incoming and direction != "in":
-        return None
-    if rule.from_name and (name or "").strip().lower() != rule.from_name.strip().lower():
-        return None
-    if rule.from_public_key and (public_key or "").strip().lower() != rule.from_public_key.strip().lower():
-        return None
-
-    t = text if rule.case_sensitive else text.lower()
-    p = rule.pattern if rule.case_sensitive else rule.pattern.lower()
-
-    groups: List[str] = []
-    matched = False
-    if rule.match_type == AutomationRule.MATCH_EQUALS:
-        matched = t == p
-    elif rule.match_type == AutomationRule.MATCH_PREFIX:
-        matched = t.startswith(p)
-        if matched:
-            groups = [t[len(p):].lstrip()]
-    elif rule.match_type == AutomationRule.MATCH_CONTAINS:
-        matched = p in t
-    elif rule.match_type == AutomationRule.MATCH_REGEX:
-        flags = 0 if rule.case_sensitive else re.IGNORECASE
-        try:
-            m = re.search(rule.pattern, text, flags)
-        except re.error:
-            m = None
-        if m:
-            matched = True
-            groups = list(m.groups(default=""))
-    else:
-        matched = False
-
-    if not matched:
-        return None
-
-    ctx: Dict[str, Any] = {
-        "name": name,
-        "public_key": public_key or "",
-        "text": text,
-        "direction": direction,
-        0: text,
-    }
-    for i, g in enumerate(groups, start=1):
-        ctx[i] = g
-    return ctx
-
-
-def _mqtt_publish(topic: str, payload: str) -> Dict[str, Any]:
-    if mqtt is None:
-        raise RuntimeError("MQTT support not installed (paho-mqtt)")
-    cfg = MQTTConfig.objects.order_by('-id').first()
-    if not cfg or not cfg.server:
+def _mqtt_publish(topic: str, payload: str, timeout: float = 10.0) -> Dict[str, Any]:
+    """Publish through the process-wide persistent connection (QoS 1, waits for the ack)."""
+    if load_mqtt_config() is None:
         raise RuntimeError("MQTT server not configured")
+    return get_mqtt_publisher().publish_and_wait(topic, payload, qos=1, timeout=timeout)
 
-    client = mqtt.Client(protocol=mqtt.MQTTv311)
-    if cfg.username:
-        client.username_pw_set(cfg.username, cfg.password or None)
-    if cfg.use_tls:
-        import ssl
-        client.tls_set(tls_version=ssl.PROTOCOL_TLS)
-        client.tls_insecure_set(False)
 
-    client.connect(cfg.server, cfg.port, keepalive=10)
-    client.loop_start()
-    try:
-        info = client.publish(topic, payload=payload, qos=0, retain=False)
-        try:
-            info.wait_for_publish(timeout=5.0)
-        except Exception:
-            pass
-        rc = getattr(info, 'rc', 0)
-        return {"rc": rc, "mid": getattr(info, 'mid', None)}
-    finally:
-        try:
-            client.loop_stop()
-            client.disconnect()
-        except Exception:
-            pass
+def run_automation_action(action_type: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Execute one rendered automation action; raises on failure."""
+    if action_type == AutomationRule.ACTION_AUTORESPONSE:
+        status_text = send_chat_message(name=params.get("name") or "", text=params.get("text") or "")
+        return {"status": status_text}
+    if action_type == AutomationRule.ACTION_MQTT:
+        pub = _mqtt_publish(params.get("topic") or "", params.get("payload") or "")
+        return {"rc": pub.get("rc"), "mid": pub.get("mid")}
+    raise ValueError(f"unsupported action: {action_type}")
 
 
-def evaluate_automations_for_message(*, name: str, public_key: Optional[str], direction: str, text: str, dry_run: bool = False) -> List[Dict[str, Any]]:
+def evaluate_automations_for_message(
+    *, name: str, public_key: Optional[str], direction: str, text: str, dry_run: bool = False, enqueue: bool = False,
+) -> List[Dict[str, Any]]:
     """Evaluate rules for a message and optionally execute actions.
 
-    Returns list of results with rule metadata and action results.
+    With `enqueue`, actions are written to the ``AutomationAction`` queue in one
+    insert and run later by the action workers (see meshapi.actions) instead of
+    inline. Returns list of results with rule metadata and action results.
     """
     results: List[Dict[str, Any]] = []
-    qs = AutomationRule.objects.filter(enabled=True).order_by("-priority", "id")
+    queued: List[AutomationAction] = []
+    triggered: List[AutomationRule] = []
     now = timezone.now()
-    for rule in qs:
-        ctx = _match_rule(rule, name=name, public_key=public_key, direction=direction, text=text)
-        if not ctx:
-            continue
-        # Cooldown
-        if rule.cooldown_seconds and rule.last_triggered_at:
-            delta = (now - rule.last_triggered_at).total_seconds()
+    for rule, ctx in get_rule_engine().match(name=name, public_key=public_key, direction=direction, text=text):
+        # Cooldown; the compiled rule may be older than another process's last trigger
+        if rule.cooldown_seconds:
+            last = AutomationRule.objects.filter(id=rule.id).values_list("last_triggered_at", flat=True).first()
+        else:
+            last = None
+        if last:
+            delta = (now - last).total_seconds()
             if delta < rule.cooldown_seconds:
                 results.append({
                     "rule_id": rule.id,
@@ -1013,35 +871,35 @@ def evaluate_automations_for_message(*, name: str, public_key: Optional[str], di
                     break
                 continue
 
-        action_result: Dict[str, Any] = {"executed": False}
+        params: Optional[Dict[str, Any]] = None
         if rule.action_type == AutomationRule.ACTION_AUTORESPONSE:
             resp = _render_template(rule.response_text, ctx)
-            action_result = {"type": "autoresponse", "text": resp}
-            if not dry_run and resp.strip():
-                try:
-                    send_chat_message(name=name, text=resp)
-                    action_result["executed"] = True
-                except Exception as e:
-                    action_result["error"] = str(e)
+            action_result: Dict[str, Any] = {"type": "autoresponse", "text": resp}
+            if resp.strip():
+                params = {"name": name, "text": resp}
         elif rule.action_type == AutomationRule.ACTION_MQTT:
             topic = _render_template(rule.mqtt_topic, ctx)
             payload = _render_template(rule.mqtt_payload, ctx)
             action_result = {"type": "mqtt", "topic": topic, "payload": payload}
-            if not dry_run and topic.strip():
+            if topic.strip():
+                params = {"topic": topic, "payload": payload}
+        else:
+            action_result = {"type": rule.action_type, "error": "unsupported action"}
+
+        if params is not None and not dry_run:
+            if enqueue:
+                queued.append(new_action(rule, params))
+                action_result["queued"] = True
+            else:
                 try:
-                    pub = _mqtt_publish(topic, payload)
-                    action_result.update({"executed": True, "rc": pub.get("rc"), "mid": pub.get("mid")})
+                    action_result.update(run_automation_action(rule.action_type, params))
+                    action_result["executed"] = True
                 except Exception as e:
                     action_result["error"] = str(e)
-        else:
-            action_result = {"type": rule.action_type, "error": "unsupported action"}
+        action_result.setdefault("executed", False)
 
-        try:
-            if not dry_run:
-                rule.last_triggered_at = timezone.now()
-                rule.save(update_fields=["last_triggered_at", "updated_at"])
-        except Exception:
-            pass
+        if not dry_run:
+            triggered.append(rule)
 
         results.append({
             "rule_id": rule.id,
@@ -1051,6 +909,17 @@ def evaluate_automations_for_message(*, name: str, public_key: Optional[str], di
         })
         if rule.stop_processing:
             break
+    if triggered:
+        try:
+            # One queryset update: a trigger must not count as a rule edit and recompile the engine
+            at = timezone.now()
+            AutomationRule.objects.filter(id__in=[r.id for r in triggered]).update(last_triggered_at=at, updated_at=at)
+            for rule in triggered:
+                rule.last_triggered_at = at
+        except Exception:
+            pass
+    if queued:
+        enqueue_actions(queued)
     return results
 
 
@@ -1095,27 +964,15 @@ def _persist_msg_event_obj(ev: Dict[str, Any]) -> bool:
         # Unknown type; attempt generic
         name = (ev.get("name") or "").strip() or "<unknown>"
 
-    # De-dup burst: avoid storing identical recent entries
-    try:
-        cutoff = timezone.now() - timedelta(seconds=3)
-        if Message.objects.filter(direction="in", name=name, text=text, ts__gte=cutoff).exists():
-            return False
-    except Exception:
-        pass
-
-    try:
-        Message.objects.create(
-            contact=contact,
-            name=name,
-            public_key=public_key,
-            direction="in",
-            text=text,
-            ts=timezone.now(),
-            raw=json.dumps(ev, ensure_ascii=False),
-        )
-        return True
-    except Exception:
-        return False
+    sender_ts = ev.get("sender_timestamp")
+    return store_incoming_message(
+        name=name,
+        text=text,
+        raw=json.dumps(ev, ensure_ascii=False),
+        contact_id=contact.id if contact else None,
+        public_key=public_key,
+        sender_ts=sender_ts if isinstance(sender_ts, int) else None,
+    ) is not None
 
 
 def sync_unread_messages() -> int:
@@ -1142,29 +999,36 @@ def sync_unread_messages() -> int:
 def _run_req_status_command(name: str) -> Optional[Dict[str, Any]]:
     """Request status for a contact, persist useful telemetry (e.g., rssi/snr).
 
-    Returns parsed dict on success; None on error.
+    Returns parsed dict on success; None on error. Raises `AirtimeDeferred`
+    when the budget is too low, so the caller can reschedule.
     """
+    # One charge for the request, whichever variant ends up sending it
+    charge_airtime(f'req_status "{name}"')
     # Prefer blocking/synchronous variant for robustness
     try:
-        stdout, data = _exec_cli_json(f'req_bstatus "{name}"')
+        stdout, data = _exec_cli_json(f'req_bstatus "{name}"', charge=False)
         _extract_and_persist_chats(stdout)
         if isinstance(data, dict):
             data.setdefault("name", name)
             if any(k in data for k in ("rssi", "snr", "adv_lat", "adv_lon", "type", "flags", "level", "battery", "battery_percent", "battery_mv")):
                 _persist_contact_info(data)
             return data
+    except AirtimeDeferred:
+        raise
     except Exception:
         pass
 
     # Fallback to event-based variant
     try:
-        stdout, data = _exec_cli_json(f'req_status "{name}"')
+        stdout, data = _exec_cli_json(f'req_status "{name}"', charge=False)
         _extract_and_persist_chats(stdout)
         if isinstance(data, dict):
             data.setdefault("name", name)
             if any(k in data for k in ("rssi", "snr", "adv_lat", "adv_lon", "type", "flags", "level", "battery", "battery_percent", "battery_mv")):
                 _persist_contact_info(data)
             return data
+    except AirtimeDeferred:
+        raise
     except Exception:
         return None
     return None
@@ -1173,7 +1037,8 @@ def _run_req_status_command(name: str) -> Optional[Dict[str, Any]]:
 def _run_req_telemetry_command(name: str) -> Optional[Dict[str, Any]]:
     """Request telemetry for a contact via req_telemetry and persist useful fields.
 
-    Returns parsed dict on success; None on error.
+    Returns parsed dict on success; None on error. Raises `AirtimeDeferred`
+    when the budget is too low.
     """
     try:
         stdout, data = _exec_cli_json(f'req_telemetry "{name}"')
@@ -1183,6 +1048,8 @@ def _run_req_telemetry_command(name: str) -> Optional[Dict[str, Any]]:
             if any(k in data for k in ("rssi", "snr", "adv_lat", "adv_lon", "type", "flags", "last_advert", "battery", "battery_percent", "battery_mv")):
                 _persist_contact_info(data)
             return data
+    except AirtimeDeferred:
+        raise
     except Exception:
         return None
     return None
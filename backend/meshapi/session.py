@@ -3,42 +3,51 @@ import pty
 import fcntl
 import termios
 import struct
-import select
-import shlex
+import selectors
 import subprocess
 import threading
 import time
-import re
-from datetime import timedelta
 from typing import Optional
 
-from django.utils import timezone
-
-from .models import Message, Contact
+from .chat import extract_and_store_chats
+from .dispatch import CommandDispatcher
+from .models import StreamEvent
+from .ptystream import JsonFrameScanner, PtyStreamTokenizer
+from .ringbuffer import ChunkedRingBuffer
+from .stream import publish_event
 import logging
 
 
-ANSI_RE = re.compile(r"\x1B\[[0-?]*[ -/]*[@-~]")
+# Reads drain the PTY in large chunks; the idle timeout only bounds how long a
+# stopped session takes to notice when the wake pipe is unavailable
+_READ_SIZE = 65536
+_READER_IDLE_S = 1.0
 
 
 class MeshCoreSession:
     """Singleton-like manager for a single interactive meshcore-cli session.
 
     - Ensures only one PTY-based session to the device is open.
-    - Serializes command writes via a lock (implicit queueing).
+    - Runs commands one at a time through a priority queue (see meshapi.dispatch).
     - Continuously reads output in a background thread and stores incoming chat lines.
-    - Provides a run_json_command helper that waits for JSON blob to appear after issuing a line.
+    - Provides a run_json_command helper that returns the first JSON frame printed after issuing a line.
     """
 
     def __init__(self) -> None:
         self._proc: Optional[subprocess.Popen] = None
         self._master_fd: Optional[int] = None
-        self._buffer = ""
+        self._buffer = ChunkedRingBuffer()
         self._buf_lock = threading.Lock()
         self._buf_cond = threading.Condition(self._buf_lock)
         self._cmd_lock = threading.Lock()  # serialize commands
+        self._dispatcher = CommandDispatcher()
         self._reader_thread: Optional[threading.Thread] = None
         self._running = False
+        self._published_alive: Optional[bool] = None
+        # Frame scanner of the run_json_command in flight (guarded by _buf_lock)
+        self._json_scanner: Optional[JsonFrameScanner] = None
+        # Write end of the reader's self-pipe, used to interrupt its select()
+        self._wake_fd: Optional[int] = None
 
     def start(self) -> None:
         if self._running:
@@ -79,6 +88,14 @@ class MeshCoreSession:
         self._running = True
         self._reader_thread = threading.Thread(target=self._reader_loop, name="meshcore-reader", daemon=True)
         self._reader_thread.start()
+        self._publish_state(True)
+
+    def _publish_state(self, alive: bool) -> None:
+        """Push alive/dead transitions to stream clients."""
+        if self._published_alive is alive:
+            return
+        self._published_alive = alive
+        publish_event(StreamEvent.KIND_CONNECTION, {"connected": alive})
 
     def ensure_started(self) -> None:
         if not self._running or not self._proc or self._proc.poll() is not None:
@@ -94,6 +111,7 @@ class MeshCoreSession:
 
     def stop(self) -> None:
         self._running = False
+        self._wake_reader()
         try:
             if self._proc:
                 self._proc.terminate()
@@ -106,214 +124,163 @@ class MeshCoreSession:
             pass
         self._proc = None
         self._master_fd = None
+        self._publish_state(False)
 
     def _reader_loop(self) -> None:
         logger = logging.getLogger("meshcore.session")
         fd = self._master_fd
         if fd is None:
             return
-        partial = b""
-        while self._running:
-            try:
-                r, _, _ = select.select([fd], [], [], 0.2)
-                if fd not in r:
-                    continue
-                chunk = os.read(fd, 4096)
-                if not chunk:
-                    time.sleep(0.05)
-                    continue
-                partial += chunk
-                # Normalize to text
-                text = partial.decode("utf-8", errors="ignore")
-                # Keep last complete lines in 'lines', retain remainder in 'partial'
-                if not text:
-                    continue
-                # Split preserving remainder
-                if text.endswith("\n"):
-                    lines_text = text
-                    partial = b""
-                else:
-                    last_nl = text.rfind("\n")
-                    if last_nl == -1:
-                        # no complete line yet, keep accumulating
-                        continue
-                    lines_text = text[: last_nl + 1]
-                    partial = text[last_nl + 1 :].encode("utf-8", errors="ignore")
-
-                # Strip ANSI and append to buffer
-                cleaned = ANSI_RE.sub("", lines_text)
-                with self._buf_lock:
-                    self._buffer += cleaned
-                    self._buf_cond.notify_all()
-
-                # Log and parse each line
-                for line in cleaned.splitlines():
-                    if line.strip():
-                        try:
-                            logger.info(line.rstrip())
-                        except Exception:
-                            pass
-                    self._maybe_store_chat_line(line)
-            except Exception:
-                time.sleep(0.1)
-
-    # Delimiter pattern for the start of a chat message: "Name (D):"
-    NAME_DELIM_RE = re.compile(r"([^\(\n🭨]+?)\s*\(D\):\s*")
-
-    def _maybe_store_chat_line(self, line: str) -> None:
-        # Be tolerant: a single console line may contain multiple chat messages
-        # and prompt fragments; scan for all chat occurrences.
-        if not line:
-            return
-        # Collect prompt names (e.g., 'JOST_DEV' in 'JOST_DEV🭨') to trim from tail
+        tokenizer = PtyStreamTokenizer()
+        sel = selectors.DefaultSelector()
+        wake_r, wake_w = os.pipe()
+        self._wake_fd = wake_w
         try:
-            prompt_names = re.findall(r"(?<!\w)([A-Za-z0-9][A-Za-z0-9_-]{0,63})🭨", line)
+            os.set_blocking(fd, False)
+            os.set_blocking(wake_r, False)
+            sel.register(fd, selectors.EVENT_READ)
+            sel.register(wake_r, selectors.EVENT_READ)
         except Exception:
-            prompt_names = []
-
-        # Find all "(D):" delimiters and determine names/texts robustly
-        delim_re = re.compile(r"\(D\):\s*")
-        delims = list(delim_re.finditer(line))
-        if not delims:
-            return
-
-        # Known contact names to disambiguate concatenations like 'HalloJOST (D):'
+            pass
         try:
-            known_names = list(Contact.objects.exclude(name="").values_list("name", flat=True))
-        except Exception:
-            known_names = []
-        known_names = sorted(set(n for n in known_names if isinstance(n, str)), key=len, reverse=True)
-
-        # Pre-compute prompt positions to help bound name search
-        prompt_positions = [m.start() for m in re.finditer("🭨", line)]
-
-        # First pass: compute name and name_start for each delimiter
-        parts = []  # list of dict(name, name_start, text_start, next_name_start)
-        for i, d in enumerate(delims):
-            name_end = d.start()
-            # Trim any whitespace right before the '(D):' token
-            while name_end > 0 and line[name_end - 1].isspace():
-                name_end -= 1
-            text_start = d.end()
-            # Search window for the name start: from after last delimiter or after last prompt to name_end
-            left_bound = 0
-            if i > 0:
-                left_bound = max(left_bound, delims[i - 1].end())
-            if prompt_positions:
-                # last prompt before name_end
-                left_bound = max(left_bound, max([p + 1 for p in prompt_positions if p < name_end], default=0))
-            window = line[left_bound:name_end].rstrip()
-            name = None
-            # Prefer known names that are a suffix of the window
-            for kn in known_names:
-                if window.endswith(kn):
-                    name = kn
-                    name_start = name_end - len(kn)
-                    break
-            if not name:
-                # Fallback: take the trailing token up to 64 chars as name (best-effort)
-                tail = window[-64:]
-                # strip anything before the last whitespace or punctuation if present
-                # but if none present, take the last 32 letters/digits/ _-
-                m_tail = re.search(r"([A-Za-z0-9 _\-]{1,64})\s*$", tail)
-                if m_tail:
-                    cand = m_tail.group(1).strip()
-                    if cand:
-                        name = cand
-                        name_start = name_end - len(cand)
-                if not name:
-                    # As a last resort, use up to 16 chars right before '(D):'
-                    cand = window[-16:].strip()
-                    name = cand
-                    name_start = name_end - len(cand)
-
-            parts.append({
-                "name": name or "",
-                "name_start": name_start,
-                "text_start": text_start,
-            })
-
-        # Second pass: determine text_end for each part and persist
-        for i, part in enumerate(parts):
-            name = part["name"].strip()
-            if not name:
-                continue
-            text_start = part["text_start"]
-            next_name_start = parts[i + 1]["name_start"] if i + 1 < len(parts) else None
-            sep_pos = line.find("🭨", text_start)
-            text_end = len(line)
-            if next_name_start is not None:
-                text_end = min(text_end, next_name_start)
-            if sep_pos != -1:
-                text_end = min(text_end, sep_pos)
-            text = line[text_start:text_end].strip()
-            if not text:
-                continue
-            if prompt_names:
-                for pn in prompt_names:
-                    if pn and text.endswith(pn):
-                        text = text[: -len(pn)].rstrip()
+            while self._running:
+                try:
+                    if not sel.select(timeout=_READER_IDLE_S):
+                        continue
+                    if not self._running:
                         break
-            if not text:
-                continue
+                    # Drain everything available, then tokenize it in one go
+                    chunks = []
+                    while True:
+                        try:
+                            chunk = os.read(fd, _READ_SIZE)
+                        except BlockingIOError:
+                            break
+                        if not chunk:
+                            break
+                        chunks.append(chunk)
+                        if len(chunk) < _READ_SIZE:
+                            break
+                    if not chunks:
+                        # EOF without an error: the CLI closed its side
+                        raise OSError("pty closed")
+                    cleaned, lines = tokenizer.feed(b"".join(chunks))
+                    if cleaned:
+                        with self._buf_lock:
+                            self._buffer.append(cleaned)
+                            if self._json_scanner is not None:
+                                try:
+                                    self._json_scanner.feed(cleaned)
+                                except Exception:
+                                    pass
+                            self._buf_cond.notify_all()
+
+                    # Log and parse each completed line
+                    for line in lines:
+                        if line.strip():
+                            try:
+                                logger.info(line.rstrip())
+                            except Exception:
+                                pass
+                            self._maybe_store_chat_line(line)
+                except Exception:
+                    proc = self._proc
+                    if self._running and proc is not None and proc.poll() is not None:
+                        # The CLI exited (device gone); report it instead of spinning
+                        self._running = False
+                        self._publish_state(False)
+                        return
+                    time.sleep(0.1)
+        finally:
+            self._wake_fd = None
+            sel.close()
+            for wfd in (wake_r, wake_w):
+                try:
+                    os.close(wfd)
+                except Exception:
+                    pass
 
-            contact = Contact.objects.filter(name=name).order_by("-last_seen").first()
+    def _wake_reader(self) -> None:
+        wfd = self._wake_fd
+        if wfd is not None:
             try:
-                cutoff = timezone.now() - timedelta(seconds=3)
-                if Message.objects.filter(direction="in", name=name, text=text, ts__gte=cutoff).exists():
-                    continue
-            except Exception:
-                pass
-            try:
-                Message.objects.create(
-                    contact=contact,
-                    name=name,
-                    public_key=contact.public_key if contact else None,
-                    direction="in",
-                    text=text,
-                    ts=timezone.now(),
-                    raw=line,
-                )
+                os.write(wfd, b"x")
             except Exception:
                 pass
 
-    def run_json_command(self, line: str, timeout_s: float = 5.0):
+    def _maybe_store_chat_line(self, line: str) -> None:
+        # A single console line may contain multiple chat messages and prompt
+        # fragments; the shared parser handles both
+        extract_and_store_chats(line)
+
+    def run_json_command(self, line: str, timeout_s: float = 5.0, priority: Optional[int] = None):
+        """Send `line` and return the first JSON object/array printed after it.
+
+        Commands are queued by priority (default: the caller's
+        :func:`~meshapi.dispatch.command_priority`); `timeout_s` covers the
+        time spent queued as well as the wait for the reply.
+        """
+        return self._dispatcher.run(lambda remaining: self._json_now(line, remaining), timeout_s, priority)
+
+    async def run_json_command_async(self, line: str, timeout_s: float = 5.0, priority: Optional[int] = None):
+        return await self._dispatcher.run_async(lambda remaining: self._json_now(line, remaining), timeout_s, priority)
+
+    def run_text_command(
+        self, line: str, dwell_s: float = 0.5, max_wait_s: float = 3.0, wait_for_prompt: bool = True,
+        priority: Optional[int] = None,
+    ) -> str:
+        """Send a command and return the new text produced after the write.
+
+        - max_wait_s: overall cap, including the time spent queued
+        - dwell_s: return once there's been at least dwell_s with no new bytes
+        """
+        return self._dispatcher.run(
+            lambda remaining: self._text_now(line, dwell_s, remaining, wait_for_prompt), max_wait_s, priority,
+        )
+
+    async def run_text_command_async(
+        self, line: str, dwell_s: float = 0.5, max_wait_s: float = 3.0, wait_for_prompt: bool = True,
+        priority: Optional[int] = None,
+    ) -> str:
+        return await self._dispatcher.run_async(
+            lambda remaining: self._text_now(line, dwell_s, remaining, wait_for_prompt), max_wait_s, priority,
+        )
+
+    def queue_stats(self) -> dict:
+        return self._dispatcher.stats()
+
+    def _json_now(self, line: str, timeout_s: float):
+        """Run one JSON command; the reader feeds this command's frame scanner and
+        notifies as soon as a frame completes."""
         self.ensure_started()
         if self._master_fd is None:
             raise RuntimeError("mesh session not started")
         with self._cmd_lock:
-            start = time.time()
+            scanner = JsonFrameScanner()
             with self._buf_lock:
-                start_len = len(self._buffer)
-            # Write the command line
-            os.write(self._master_fd, (line + "\n").encode("utf-8", errors="ignore"))
-
-            # Wait for a JSON object/array to appear after start_len
-            while time.time() - start < timeout_s:
+                self._json_scanner = scanner
+            try:
+                deadline = time.monotonic() + timeout_s
+                # Write the command line
+                os.write(self._master_fd, (line + "\n").encode("utf-8", errors="ignore"))
                 with self._buf_lock:
-                    segment = self._buffer[start_len:]
-                try:
-                    data = self._extract_json(segment)
-                    if data is not None:
-                        return data
-                except Exception:
-                    pass
+                    while not scanner.frames:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise TimeoutError("Timeout waiting for JSON response")
+                        self._buf_cond.wait(timeout=remaining)
+                    return scanner.frames[0]
+            finally:
                 with self._buf_lock:
-                    self._buf_cond.wait(timeout=0.1)
-            raise TimeoutError("Timeout waiting for JSON response")
+                    self._json_scanner = None
 
-    def run_text_command(self, line: str, dwell_s: float = 0.5, max_wait_s: float = 3.0, wait_for_prompt: bool = True) -> str:
-        """Send a command and return the new text produced after the write.
-
-        - max_wait_s: overall cap
-        - dwell_s: return once there's been at least dwell_s with no new bytes
-        """
+    def _text_now(self, line: str, dwell_s: float, max_wait_s: float, wait_for_prompt: bool) -> str:
         self.ensure_started()
         if self._master_fd is None:
             raise RuntimeError("mesh session not started")
         with self._cmd_lock:
             with self._buf_lock:
-                start_len = len(self._buffer)
+                start_len = self._buffer.end
             os.write(self._master_fd, (line + "\n").encode("utf-8", errors="ignore"))
 
             start = time.time()
@@ -325,12 +292,12 @@ class MeshCoreSession:
                 if now - start >= max_wait_s:
                     break
                 with self._buf_lock:
-                    cur_len = len(self._buffer)
+                    cur_len = self._buffer.end
+                    seg = self._buffer.read(start_len) if wait_for_prompt and cur_len != last_size else ""
                 if cur_len != last_size:
                     last_size = cur_len
                     last_change = now
                     if wait_for_prompt:
-                        seg = self._buffer[start_len:]
                         if self._has_prompt(seg):
                             saw_prompt = True
                 else:
@@ -340,7 +307,7 @@ class MeshCoreSession:
                     self._buf_cond.wait(timeout=0.1)
 
             with self._buf_lock:
-                segment = self._buffer[start_len:]
+                segment = self._buffer.read(start_len)
             return segment
 
     @staticmethod
@@ -354,28 +321,6 @@ class MeshCoreSession:
                 return True
         return False
 
-    @staticmethod
-    def _extract_json(text: str):
-        import json
-        s = text.strip()
-        # Try object
-        i = s.find("{")
-        j = s.rfind("}")
-        if i != -1 and j != -1 and j > i:
-            try:
-                return json.loads(s[i : j + 1])
-            except Exception:
-                pass
-        # Try array
-        i = s.find("[")
-        j = s.rfind("]")
-        if i != -1 and j != -1 and j > i:
-            try:
-                return json.loads(s[i : j + 1])
-            except Exception:
-                pass
-        return None
-
 
 _SESSION: Optional[MeshCoreSession] = None
 _SESSION_LOCK = threading.Lock()
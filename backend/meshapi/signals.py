@@ -1,8 +1,50 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from .models import Message
+from .automation import invalidate_rule_engine
+from .chat import invalidate_name_index
+from .models import AutomationRule, Contact, Message, MQTTConfig, NodeInfo, StreamEvent
+from .mqtt_publisher import reload_mqtt_publisher
 from .services import evaluate_automations_for_message
+from .stream import message_item, publish_event
+from .versioning import KEY_AUTOMATIONS, KEY_CONTACT_NAMES, KEY_MESSAGES, KEY_NODE, bump_version
+
+
+@receiver(post_save, sender=Message)
+def bump_messages_version(sender, instance: Message, created: bool, **kwargs):  # pragma: no cover - runtime hook
+    bump_version(KEY_MESSAGES)
+    publish_event(StreamEvent.KIND_MESSAGE, {"created": bool(created), **message_item(instance)})
+
+
+@receiver(post_save, sender=NodeInfo)
+def bump_node_version(sender, instance: NodeInfo, **kwargs):  # pragma: no cover - runtime hook
+    bump_version(KEY_NODE)
+    publish_event(StreamEvent.KIND_NODE, {"name": instance.name, "fetched_at": instance.fetched_at})
+
+
+@receiver(post_save, sender=Contact)
+@receiver(post_delete, sender=Contact)
+def bump_contact_names_version(sender, instance: Contact, **kwargs):  # pragma: no cover - runtime hook
+    # Single-row edits (admin); the bulk ingest path bumps the version itself
+    bump_version(KEY_CONTACT_NAMES)
+    invalidate_name_index()
+
+
+@receiver(post_save, sender=AutomationRule)
+@receiver(post_delete, sender=AutomationRule)
+def bump_automations_version(sender, instance: AutomationRule, **kwargs):  # pragma: no cover - runtime hook
+    # Recording a trigger is not an edit of the rule set
+    fields = kwargs.get("update_fields")
+    if fields and set(fields) <= {"last_triggered_at", "updated_at"}:
+        return
+    bump_version(KEY_AUTOMATIONS)
+    invalidate_rule_engine()
+
+
+@receiver(post_save, sender=MQTTConfig)
+def reload_mqtt_on_config_change(sender, instance: MQTTConfig, **kwargs):  # pragma: no cover - runtime hook
+    # Other processes notice the change on their next MQTT_CONFIG_CHECK_S poll
+    reload_mqtt_publisher()
 
 
 @receiver(post_save, sender=Message)
@@ -15,8 +57,9 @@ def run_automations_on_incoming(sender, instance: Message, created: bool, **kwar
         name = instance.name or ""
         public_key = instance.public_key or None
         text = instance.text or ""
-        # Fire and forget; errors are intentionally swallowed to not break message ingestion
-        evaluate_automations_for_message(name=name, public_key=public_key, direction="in", text=text, dry_run=False)
+        # Only match and queue here; the action workers (meshapi.actions) run the actions.
+        # Errors are intentionally swallowed to not break message ingestion
+        evaluate_automations_for_message(name=name, public_key=public_key, direction="in", text=text, enqueue=True)
     except Exception:
         # Avoid raising from signal
         pass
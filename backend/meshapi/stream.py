@@ -0,0 +1,288 @@
+"""Server-Sent Events change feed.
+
+Writers (message/node signals, the contact ingest flush and the device session)
+append :class:`~meshapi.models.StreamEvent` rows via :func:`publish_event`.
+Because the collector, the broker and the web workers are separate processes,
+the table is the hand-off point between them.
+
+Each web worker runs one :class:`EventHub` thread that polls for rows newer
+than the last one it saw (only while at least one client is connected), keeps
+the most recent events serialized in memory and wakes every open stream. Rows
+younger than ``STREAM_SETTLE_MS`` are left for the next poll: ids are assigned
+at insert but become visible at commit, so a row with a lower id can still
+appear after a higher one, and moving past it would skip it for good. A
+reconnecting client sends ``Last-Event-ID`` and receives only what it missed:
+from memory when possible, otherwise from the table. If the gap is no longer
+available a ``reset`` event tells the client to reload its data.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import StreamEvent
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except Exception:
+        return default
+
+
+# How long events are kept for resuming clients
+RETENTION_S = _env_float("STREAM_EVENT_RETENTION_S", 3600.0)
+# Hub poll interval while clients are connected
+POLL_S = max(0.1, _env_float("STREAM_POLL_MS", 500.0) / 1000.0)
+# Age an event needs before the hub moves past it (out-of-order commits)
+SETTLE_S = max(0.0, _env_float("STREAM_SETTLE_MS", 500.0) / 1000.0)
+# Comment line sent when nothing happened, keeps proxies from closing the connection
+HEARTBEAT_S = max(1.0, _env_float("STREAM_HEARTBEAT_S", 15.0))
+# Streams end after this long; EventSource reconnects with Last-Event-ID
+MAX_STREAM_S = max(10.0, _env_float("STREAM_MAX_SECONDS", 300.0))
+
+# Events kept in memory per process / replayed from the table on resume
+_MEMORY_EVENTS = 1000
+_RESUME_LIMIT = 1000
+_PURGE_EVERY_S = 300.0
+
+_last_purge = 0.0
+_purge_lock = threading.Lock()
+
+
+def message_item(m) -> Dict[str, Any]:
+    """Serialize a Message the way the messages list endpoint does."""
+    return {
+        "name": m.name,
+        "public_key": m.public_key,
+        "direction": m.direction,
+        "text": m.text,
+        "ts": m.ts,
+        "status": m.status,
+        "client_id": m.client_id,
+        "id": m.id,
+    }
+
+
+def _maybe_purge() -> None:
+    global _last_purge
+    now = time.monotonic()
+    with _purge_lock:
+        if now - _last_purge < _PURGE_EVERY_S:
+            return
+        _last_purge = now
+    try:
+        StreamEvent.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=RETENTION_S)).delete()
+    except Exception:
+        pass
+
+
+def publish_event(kind: str, payload: Dict[str, Any]) -> None:
+    """Append an event to the feed; never raises into the writer."""
+    try:
+        data = json.loads(json.dumps(payload, cls=DjangoJSONEncoder))
+        StreamEvent.objects.create(kind=kind, payload=data)
+    except Exception:
+        return
+    _maybe_purge()
+
+
+def _settle_cutoff():
+    return timezone.now() - timedelta(seconds=SETTLE_S)
+
+
+def _settled(rows: List[Tuple[int, str, Any, Any]]) -> List[Tuple[int, str, Any]]:
+    """The leading `rows` (in id order) that are older than the settle window."""
+    cutoff = _settle_cutoff()
+    out = []
+    for id, kind, payload, created_at in rows:
+        if created_at >= cutoff:
+            break
+        out.append((id, kind, payload))
+    return out
+
+
+class _Event:
+    __slots__ = ("id", "kind", "frame")
+
+    def __init__(self, id: int, kind: str, payload: Any) -> None:
+        self.id = id
+        self.kind = kind
+        # Encoded once per process and shared by every connected client
+        data = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+        self.frame = f"id: {id}\nevent: {kind}\ndata: {data}\n\n"
+
+
+def format_event(kind: str, payload: Any) -> str:
+    """Frame a state event that carries no id (not resumable)."""
+    return f"event: {kind}\ndata: {json.dumps(payload, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+
+class EventHub:
+    """Per-process fan-out of new `StreamEvent` rows to open streams."""
+
+    def __init__(self, poll_s: float = POLL_S, keep: int = _MEMORY_EVENTS) -> None:
+        self.poll_s = poll_s
+        self._events: Deque[_Event] = deque(maxlen=keep)
+        self._cond = threading.Condition()
+        self._subscribers = 0
+        self._head = 0  # highest id seen
+        self._floor = 0  # every event with floor < id <= head is in memory
+        self._stale = True
+        self._thread: Optional[threading.Thread] = None
+
+    def _reset_head(self) -> None:
+        """Start from the current end of the table; caller holds the condition."""
+        # Events still settling are delivered once they have, so start right before them
+        young = StreamEvent.objects.filter(created_at__gte=_settle_cutoff()).aggregate(m=Min("id"))["m"]
+        head = young - 1 if young is not None else (StreamEvent.objects.aggregate(m=Max("id"))["m"] or 0)
+        self._events.clear()
+        self._head = self._floor = head
+        self._stale = False
+
+    def subscribe(self) -> int:
+        """Register a client and return the current head id."""
+        with self._cond:
+            if self._stale:
+                self._reset_head()
+            self._subscribers += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="stream-hub", daemon=True)
+                self._thread.start()
+            return self._head
+
+    @property
+    def head(self) -> int:
+        with self._cond:
+            return self._head
+
+    def unsubscribe(self) -> None:
+        with self._cond:
+            self._subscribers = max(0, self._subscribers - 1)
+
+    def _append(self, rows: List[Tuple[int, str, Any]]) -> None:
+        with self._cond:
+            for id, kind, payload in rows:
+                if id <= self._head:
+                    continue
+                if len(self._events) == self._events.maxlen:
+                    self._floor = self._events[0].id
+                self._events.append(_Event(id, kind, payload))
+                self._head = id
+            self._cond.notify_all()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._subscribers:
+                    # Nobody listens: stop polling and resync on the next subscribe
+                    self._stale = True
+                    self._thread = None
+                    return
+                head = self._head
+            try:
+                rows = list(
+                    StreamEvent.objects.filter(id__gt=head)
+                    .order_by("id")
+                    .values_list("id", "kind", "payload", "created_at")[:500]
+                )
+            except Exception:
+                # Drop a broken connection; the next poll reconnects
+                rows = []
+                connection.close()
+            settled = _settled(rows)
+            if settled:
+                self._append(settled)
+                if len(rows) == 500 and len(settled) == len(rows):
+                    continue
+            time.sleep(self.poll_s)
+
+    def after(self, last_id: int, timeout: float) -> Tuple[List[_Event], bool]:
+        """Wait up to `timeout` for events newer than `last_id`.
+
+        Returns (events, covered); `covered` is False when `last_id` is older
+        than what is kept in memory and the caller must replay from the table.
+        """
+        with self._cond:
+            if last_id < self._floor:
+                return [], False
+            if self._head <= last_id:
+                self._cond.wait(timeout)
+            return [e for e in self._events if e.id > last_id], True
+
+
+def replay(last_id: int, head: int) -> Tuple[List[_Event], bool]:
+    """Read missed events up to the hub's `head` from the table; returns (events, complete)."""
+    oldest = StreamEvent.objects.aggregate(m=Min("id"))["m"]
+    # Past the head rows may still be settling; the hub delivers those
+    rows = list(
+        StreamEvent.objects.filter(id__gt=last_id, id__lte=head)
+        .order_by("id")
+        .values_list("id", "kind", "payload")[: _RESUME_LIMIT + 1]
+    )
+    # Events between last_id and the oldest retained row were purged
+    complete = len(rows) <= _RESUME_LIMIT and (oldest is None or oldest <= last_id + 1)
+    return [_Event(*r) for r in rows[:_RESUME_LIMIT]], complete
+
+
+_HUB: Optional[EventHub] = None
+_HUB_LOCK = threading.Lock()
+
+
+def get_event_hub() -> EventHub:
+    global _HUB
+    with _HUB_LOCK:
+        if _HUB is None:
+            _HUB = EventHub()
+        return _HUB
+
+
+def event_stream(last_id: Optional[int], max_s: float = MAX_STREAM_S) -> Iterator[str]:
+    """Yield SSE frames, starting after `last_id` (or at the current head)."""
+    hub = get_event_hub()
+    head = hub.subscribe()
+    try:
+        yield "retry: 3000\n: connected\n\n"
+        cursor = head if last_id is None else last_id
+        if last_id is not None and last_id > head:
+            # Id from another database (e.g. after a reset); start over
+            yield format_event("reset", {"head": head})
+            cursor = head
+        elif last_id is not None and last_id < head:
+            events, covered = hub.after(last_id, 0)
+            if not covered:
+                events, complete = replay(last_id, head)
+                if not complete:
+                    # The client missed more than we can replay; make it reload
+                    events = []
+                    yield format_event("reset", {"head": head})
+                    cursor = head
+            for ev in events:
+                yield ev.frame
+                cursor = ev.id
+        # The stream only waits from here on; do not hold a database connection
+        connection.close()
+        deadline = time.monotonic() + max_s
+        while time.monotonic() < deadline:
+            events, covered = hub.after(cursor, HEARTBEAT_S)
+            if not covered:
+                # Fell behind the in-memory window (very slow client)
+                cursor = hub.head
+                yield format_event("reset", {"head": cursor})
+                continue
+            if not events:
+                yield ": ping\n\n"
+                continue
+            for ev in events:
+                yield ev.frame
+                cursor = ev.id
+    finally:
+        hub.unsubscribe()
@@ -1,20 +1,26 @@
 from django.urls import path
-from .views import HealthView, MyNodeView, ContactsView, ContactInfoView
-from .views_contacts import ContactsLatestView
+from .views import HealthView, AirtimeView, MyNodeView, MyNodeTelemetryView, ContactsView, ContactInfoView
+from .views_contacts import ContactsLatestView, ContactTelemetryHistoryView
 from .views_messages import MessagesListView, MessageSendView
-from .views_settings import CollectorSettingsView, MQTTSettingsView, MQTTTestView
+from .views_settings import CollectorSettingsView, MQTTExportStatusView, MQTTSettingsView, MQTTStatusView, MQTTTestView
 from .views_connection import ConnectionStatusView, ConnectionReconnectView
 from .views_automations import AutomationsListView, AutomationDetailView, AutomationsTestView
+from .views_stream import StreamView
 
 urlpatterns = [
     path("health/", HealthView.as_view(), name="health"),
     path("my-node/", MyNodeView.as_view(), name="my-node"),
+    path("my-node/telemetry/", MyNodeTelemetryView.as_view(), name="my-node-telemetry"),
+    path("airtime/", AirtimeView.as_view(), name="airtime"),
     path("contacts/", ContactsView.as_view(), name="contacts"),
     path("contact-info/", ContactInfoView.as_view(), name="contact-info"),
     path("contacts/latest/", ContactsLatestView.as_view(), name="contacts-latest"),
+    path("contacts/<str:public_key>/telemetry/", ContactTelemetryHistoryView.as_view(), name="contact-telemetry"),
     path("settings/collector/", CollectorSettingsView.as_view(), name="collector-settings"),
     path("settings/mqtt/", MQTTSettingsView.as_view(), name="mqtt-settings"),
     path("settings/mqtt/test/", MQTTTestView.as_view(), name="mqtt-test"),
+    path("settings/mqtt/status/", MQTTStatusView.as_view(), name="mqtt-status"),
+    path("settings/mqtt/export/", MQTTExportStatusView.as_view(), name="mqtt-export-status"),
     path("messages/", MessagesListView.as_view(), name="messages-list"),
     path("messages/send/", MessageSendView.as_view(), name="messages-send"),
     path("automations/", AutomationsListView.as_view(), name="automations-list"),
@@ -23,4 +29,6 @@ urlpatterns = [
     # Connection/session status
     path("connection/status/", ConnectionStatusView.as_view(), name="connection-status"),
     path("connection/reconnect/", ConnectionReconnectView.as_view(), name="connection-reconnect"),
+    # Push updates (Server-Sent Events)
+    path("stream/", StreamView.as_view(), name="stream"),
 ]
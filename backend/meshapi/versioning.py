@@ -0,0 +1,139 @@
+"""Shared data-version counters and conditional (ETag / 304) JSON responses.
+
+Ingest paths call :func:`bump_version` for the data set they changed. Hot GET
+endpoints wrap their payload builder in :func:`versioned_response`, which
+derives an ETag from the current versions, answers ``If-None-Match`` /
+``If-Modified-Since`` with 304 and otherwise reuses the serialized bytes of the
+last build for as long as the versions stay unchanged.
+
+Payloads whose ``fetched_at`` is the response time are cached without it and
+get a fresh one spliced in per response (``stamp=True``). Endpoints whose
+answer also depends on the clock, such as a window ending "now", pass the
+resolved window as ``vary`` so it becomes part of the cache key and ETag.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from django.db.models import F
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils import timezone
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework.renderers import JSONRenderer
+
+from .models import DataVersion
+
+
+KEY_CONTACTS = "contacts"
+KEY_MESSAGES = "messages"
+KEY_NODE = "node"
+# Only moves when a contact is added or renamed (used by the chat name index)
+KEY_CONTACT_NAMES = "contact_names"
+# Automation rule edits (used by the compiled rule engine)
+KEY_AUTOMATIONS = "automations"
+
+# Serialized payloads kept per process, keyed by request path + query
+_PAYLOAD_CACHE_MAX = 128
+_payload_cache: "OrderedDict[str, Tuple[str, bytes]]" = OrderedDict()
+_payload_lock = threading.Lock()
+
+
+def bump_version(*keys: str) -> None:
+    """Increment the version counter of each key (creating it on first use)."""
+    now = timezone.now()
+    for key in keys:
+        try:
+            if not DataVersion.objects.filter(key=key).update(version=F("version") + 1, updated_at=now):
+                DataVersion.objects.bulk_create([DataVersion(key=key, version=1, updated_at=now)], ignore_conflicts=True)
+        except Exception:
+            pass
+
+
+def get_versions(keys: Iterable[str]) -> Dict[str, Tuple[int, Any]]:
+    """Return {key: (version, updated_at)}; unknown keys report version 0."""
+    keys = list(keys)
+    found = {k: (v, ts) for k, v, ts in DataVersion.objects.filter(key__in=keys).values_list("key", "version", "updated_at")}
+    return {k: found.get(k, (0, None)) for k in keys}
+
+
+def clear_payload_cache() -> None:
+    """Drop this process's serialized payloads, so the next request builds again."""
+    with _payload_lock:
+        _payload_cache.clear()
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # Proxies may weaken ETags (e.g. when compressing), so compare opaque tags only
+    bare = etag.strip('"')
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag.strip('"') == bare:
+            return True
+    return False
+
+
+def _with_fetched_at(body: bytes) -> bytes:
+    """Prepend a current `fetched_at` to a serialized JSON object."""
+    head = JSONRenderer().render({"fetched_at": timezone.now()})
+    if body == b"{}":
+        return head
+    return head[:-1] + b"," + body[1:]
+
+
+def versioned_response(
+    request, keys: List[str], build: Callable[[], Any], *, stamp: bool = False, vary: str = "",
+) -> HttpResponse:
+    """Serve `build()` as JSON with ETag/Last-Modified derived from data versions.
+
+    With `stamp`, the payload's `fetched_at` is set per response instead of
+    replayed from the cache; `vary` adds request state not in the URL.
+    """
+    versions = get_versions(keys)
+    cache_key = request.get_full_path() + (f"#{vary}" if vary else "")
+    stamp = "|".join(f"{k}:{versions[k][0]}" for k in keys)
+    etag = '"' + hashlib.sha1(f"{cache_key}|{stamp}".encode("utf-8")).hexdigest()[:32] + '"'
+    updated = [ts for _, ts in versions.values() if ts is not None]
+    last_modified = http_date(max(updated).timestamp()) if updated else None
+
+    def _headers(resp: HttpResponse) -> HttpResponse:
+        resp["ETag"] = etag
+        if last_modified:
+            resp["Last-Modified"] = last_modified
+        # Let browsers keep the body but always revalidate
+        resp["Cache-Control"] = "no-cache"
+        return resp
+
+    inm = request.META.get("HTTP_IF_NONE_MATCH")
+    if inm is not None:
+        if _etag_matches(inm, etag):
+            return _headers(HttpResponseNotModified())
+    elif last_modified and updated:
+        ims = parse_http_date_safe(request.META.get("HTTP_IF_MODIFIED_SINCE") or "")
+        if ims is not None and int(max(updated).timestamp()) <= ims:
+            return _headers(HttpResponseNotModified())
+
+    with _payload_lock:
+        hit = _payload_cache.get(cache_key)
+        if hit is not None and hit[0] == etag:
+            _payload_cache.move_to_end(cache_key)
+            body = hit[1]
+        else:
+            body = None
+    if body is None:
+        payload = build()
+        if stamp and isinstance(payload, dict):
+            payload = {k: v for k, v in payload.items() if k != "fetched_at"}
+        body = JSONRenderer().render(payload)
+        with _payload_lock:
+            _payload_cache[cache_key] = (etag, body)
+            _payload_cache.move_to_end(cache_key)
+            while len(_payload_cache) > _PAYLOAD_CACHE_MAX:
+                _payload_cache.popitem(last=False)
+    if stamp:
+        body = _with_fetched_at(body)
+    return _headers(HttpResponse(body, content_type="application/json"))
@@ -1,13 +1,22 @@
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from datetime import timedelta
+
+from django.db.models import Avg, Count, Max
+from django.db.models.functions import TruncDay, TruncHour
 from django.utils import timezone
+from .airtime import budget_status
+from .models import NodeTelemetry
 from .services import (
+    NodeRefreshBusy,
     get_or_refresh_node_info,
     _run_info_command,
     _run_contacts_command,
     _run_contact_info_command,
 )
+from .versioning import KEY_NODE, versioned_response
+from .views_contacts import _default_end, _parse_time, _window_key
 
 
 class HealthView(APIView):
@@ -34,19 +43,86 @@ class MyNodeView(APIView):
             max_age = 3600
 
         try:
+            # Always consulted so stale entries keep triggering background refreshes
             data, fetched_at = get_or_refresh_node_info(name=name, max_age_seconds=max_age)
+        except NodeRefreshBusy as e:
+            # Another worker owns the device for this fetch; running it here too would double it
+            retry = max(1, int(e.retry_after_s + 0.999))
+            return Response({"error": str(e), "retry_after": retry}, status=503, headers={"Retry-After": str(retry)})
         except Exception:
             # Fallback: run the command directly without DB caching
             data = _run_info_command(name=name)
             fetched_at = timezone.now()
+            return Response({
+                "name": name,
+                "fetched_at": fetched_at,
+                "data": data,
+            })
 
-        return Response({
+        return versioned_response(request, [KEY_NODE], lambda: {
             "name": name,
             "fetched_at": fetched_at,
             "data": data,
         })
 
 
+class AirtimeView(APIView):
+    """Transmit airtime budget (duty-cycle governor) and radio settings in use."""
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request):
+        return Response(budget_status())
+
+
+class MyNodeTelemetryView(APIView):
+    """Self-telemetry series of the local node as columnar arrays.
+
+    `bucket` is `raw`, `hour`, `day` or `auto` (raw up to two days, hourly up
+    to 60 days, daily beyond); buckets average each reading.
+    """
+    authentication_classes = []
+    permission_classes = []
+
+    _TRUNC = {"hour": TruncHour, "day": TruncDay}
+
+    def get(self, request):
+        name = request.query_params.get("name", "JOST_DEV")
+        end = _parse_time(request.query_params.get("to")) or _default_end()
+        start = _parse_time(request.query_params.get("from")) or (end - timedelta(days=1))
+        if start >= end:
+            return Response({"detail": "'from' muss vor 'to' liegen."}, status=400)
+        bucket = (request.query_params.get("bucket") or "auto").strip()
+        if bucket == "auto":
+            span = end - start
+            bucket = "raw" if span <= timedelta(days=2) else ("hour" if span <= timedelta(days=60) else "day")
+        elif bucket != "raw" and bucket not in self._TRUNC:
+            return Response({"detail": "bucket muss raw, hour, day oder auto sein."}, status=400)
+        return versioned_response(
+            request, [KEY_NODE], lambda: self._build(name, start, end, bucket), vary=_window_key(start, end),
+        )
+
+    def _build(self, name, start, end, bucket):
+        fields = NodeTelemetry.SERIES_FIELDS
+        qs = NodeTelemetry.objects.filter(name=name, fetched_at__gte=start, fetched_at__lt=end)
+        if bucket == "raw":
+            rows = list(qs.order_by("fetched_at").values_list("fetched_at", *fields)[:5000])
+        else:
+            aggs = {f: (Max(f) if f == "uptime_s" else Avg(f)) for f in fields}
+            rows = list(
+                qs.order_by()
+                .annotate(bucket_start=self._TRUNC[bucket]("fetched_at"))
+                .values("bucket_start")
+                .annotate(n=Count("id"), **aggs)
+                .order_by("bucket_start")
+                .values_list("bucket_start", *fields)
+            )
+        out = {"name": name, "bucket": bucket, "from": start, "to": end, "ts": [int(r[0].timestamp()) for r in rows]}
+        for i, f in enumerate(fields, start=1):
+            out[f] = [round(r[i], 2) if isinstance(r[i], float) else r[i] for r in rows]
+        return out
+
+
 class ContactsView(APIView):
     authentication_classes = []
     permission_classes = []
@@ -2,6 +2,7 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import status
 
+from .broker import broker_address, get_broker_client
 from .session import get_session
 
 
@@ -10,10 +11,23 @@ class ConnectionStatusView(APIView):
     permission_classes = []
 
     def get(self, request):
-        s = get_session()
-        connected = s.is_alive()
+        queue = None
+        if broker_address():
+            try:
+                st = get_broker_client().status()
+                connected = st.get("alive")
+                queue = st.get("queue")
+            except Exception:
+                connected = False
+        else:
+            session = get_session()
+            connected = session.is_alive()
+            if connected:
+                queue = session.queue_stats()
         return Response({
             "connected": bool(connected),
+            # Device command queue: depth and wait times per priority
+            "queue": queue,
         })
 
 
@@ -22,10 +36,13 @@ class ConnectionReconnectView(APIView):
     permission_classes = []
 
     def post(self, request):
-        s = get_session()
         try:
-            s.ensure_started()
-            ok = s.is_alive()
+            if broker_address():
+                ok = get_broker_client().reconnect()
+            else:
+                s = get_session()
+                s.ensure_started()
+                ok = s.is_alive()
             return Response({"ok": bool(ok), "connected": bool(ok)})
         except Exception as e:
             return Response({
@@ -33,4 +50,3 @@ class ConnectionReconnectView(APIView):
                 "connected": False,
                 "detail": str(e),
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
@@ -1,71 +1,157 @@
-from typing import List, Dict, Any
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import List, Dict, Any, Optional
 
-from django.db.models import OuterRef, Subquery
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
-from .models import Contact, ContactTelemetry
+from .models import Contact, ContactTelemetry, ContactTelemetryRollup
+from .rollup import choose_bucket, telemetry_series
+from .versioning import KEY_CONTACTS, versioned_response
+
+
+# A window without 'to' ends at the next step, so requests within a step share a cache entry
+_WINDOW_STEP_S = 60
 
 
 class ContactsLatestView(APIView):
     authentication_classes = []
     permission_classes = []
 
+    # Latest telemetry comes from the denormalized ContactLatest row (one LEFT JOIN)
+    _LATEST_FIELDS = (
+        'adv_name', 'last_advert', 'adv_lat', 'adv_lon', 'rssi', 'snr', 'battery_mv',
+        'battery_percent', 'type', 'flags', 'out_path_len', 'out_path', 'lastmod', 'fetched_at',
+    )
+
     def get(self, request):
-        # Subquery to fetch latest telemetry per contact
-        latest_qs = (
-            ContactTelemetry.objects
-            .filter(contact=OuterRef('pk'))
-            .order_by('-fetched_at')
-        )
+        return versioned_response(request, [KEY_CONTACTS], self._build, stamp=True)
 
-        contacts = (
+    def _build(self):
+        rows = (
             Contact.objects
-            .all()
-            .annotate(
-                _adv_name=Subquery(latest_qs.values('adv_name')[:1]),
-                _last_advert=Subquery(latest_qs.values('last_advert')[:1]),
-                _adv_lat=Subquery(latest_qs.values('adv_lat')[:1]),
-                _adv_lon=Subquery(latest_qs.values('adv_lon')[:1]),
-                _rssi=Subquery(latest_qs.values('rssi')[:1]),
-                _snr=Subquery(latest_qs.values('snr')[:1]),
-                _battery_mv=Subquery(latest_qs.values('battery_mv')[:1]),
-                _battery_percent=Subquery(latest_qs.values('battery_percent')[:1]),
-                _type=Subquery(latest_qs.values('type')[:1]),
-                _flags=Subquery(latest_qs.values('flags')[:1]),
-                _out_path_len=Subquery(latest_qs.values('out_path_len')[:1]),
-                _out_path=Subquery(latest_qs.values('out_path')[:1]),
-                _lastmod=Subquery(latest_qs.values('lastmod')[:1]),
-                _fetched_at=Subquery(latest_qs.values('fetched_at')[:1]),
-            )
             .order_by('-last_seen')
+            .values('name', 'public_key', 'last_seen', 'first_seen', *[f'latest__{f}' for f in self._LATEST_FIELDS])
         )
 
         items: List[Dict[str, Any]] = []
-        for c in contacts:
+        for r in rows:
             items.append({
-                'name': c.name or c._adv_name or '',
-                'public_key': c.public_key,
-                'last_seen': c.last_seen,
-                'first_seen': c.first_seen,
-                'adv_name': c._adv_name,
-                'last_advert': c._last_advert,
-                'adv_lat': c._adv_lat,
-                'adv_lon': c._adv_lon,
-                'rssi': c._rssi,
-                'snr': c._snr,
-                'battery_mv': c._battery_mv,
-                'battery_percent': c._battery_percent,
-                'type': c._type,
-                'flags': c._flags,
-                'out_path_len': c._out_path_len,
-                'out_path': c._out_path,
-                'lastmod': c._lastmod,
-                'telemetry_fetched_at': c._fetched_at,
+                'name': r['name'] or r['latest__adv_name'] or '',
+                'public_key': r['public_key'],
+                'last_seen': r['last_seen'],
+                'first_seen': r['first_seen'],
+                'adv_name': r['latest__adv_name'],
+                'last_advert': r['latest__last_advert'],
+                'adv_lat': r['latest__adv_lat'],
+                'adv_lon': r['latest__adv_lon'],
+                'rssi': r['latest__rssi'],
+                'snr': r['latest__snr'],
+                'battery_mv': r['latest__battery_mv'],
+                'battery_percent': r['latest__battery_percent'],
+                'type': r['latest__type'],
+                'flags': r['latest__flags'],
+                'out_path_len': r['latest__out_path_len'],
+                'out_path': r['latest__out_path'],
+                'lastmod': r['latest__lastmod'],
+                'telemetry_fetched_at': r['latest__fetched_at'],
             })
 
-        return Response({
+        return {
             'fetched_at': timezone.now(),
             'items': items,
-        })
+        }
+
+
+def _parse_time(raw: Optional[str]) -> Optional[datetime]:
+    """Accept ISO 8601 or epoch seconds; naive values are taken as UTC."""
+    if raw in (None, ''):
+        return None
+    try:
+        return datetime.fromtimestamp(float(raw), tz=dt_timezone.utc)
+    except (TypeError, ValueError):
+        pass
+    dt = parse_datetime(str(raw))
+    if dt is not None and timezone.is_naive(dt):
+        dt = timezone.make_aware(dt, dt_timezone.utc)
+    return dt
+
+
+def _default_end() -> datetime:
+    """Implicit `to`: now, rounded up to the next window step so responses can be cached."""
+    ts = timezone.now().timestamp()
+    return datetime.fromtimestamp(math.ceil(ts / _WINDOW_STEP_S) * _WINDOW_STEP_S, tz=dt_timezone.utc)
+
+
+def _window_key(start: datetime, end: datetime) -> str:
+    return f"{int(start.timestamp())}-{int(end.timestamp())}"
+
+
+class ContactTelemetryHistoryView(APIView):
+    """Downsampled telemetry of one contact as columnar arrays.
+
+    `bucket` is `5m`, `1h`, `1d`, `raw` or `auto` (default: the finest bucket
+    giving at most ~600 points). Bucketed series come from the rollup tables
+    plus raw rows not rolled up yet; `ts` holds bucket starts in epoch seconds.
+    """
+    authentication_classes = []
+    permission_classes = []
+
+    # Raw mode is meant for short windows; cap the payload
+    RAW_LIMIT = 5000
+
+    def get(self, request, public_key: str):
+        contact_id = Contact.objects.filter(public_key=public_key).values_list('id', flat=True).first()
+        if contact_id is None:
+            return Response({'detail': 'Contact not found.'}, status=404)
+        end = _parse_time(request.query_params.get('to')) or _default_end()
+        start = _parse_time(request.query_params.get('from')) or (end - timedelta(days=1))
+        if start is None or end is None or start >= end:
+            return Response({'detail': "'from' must be before 'to' (ISO 8601 or epoch seconds)."}, status=400)
+        bucket = (request.query_params.get('bucket') or 'auto').strip()
+        if bucket == 'auto':
+            bucket = choose_bucket(start, end)
+        elif bucket != 'raw' and bucket not in ContactTelemetryRollup.BUCKET_SECONDS:
+            return Response({'detail': "bucket must be one of 5m, 1h, 1d, raw, auto."}, status=400)
+        return versioned_response(
+            request, [KEY_CONTACTS], lambda: self._build(public_key, contact_id, start, end, bucket),
+            vary=_window_key(start, end),
+        )
+
+    def _build(self, public_key, contact_id, start, end, bucket):
+        out: Dict[str, Any] = {
+            'public_key': public_key,
+            'bucket': bucket,
+            'from': start,
+            'to': end,
+        }
+        if bucket == 'raw':
+            rows = list(
+                ContactTelemetry.objects
+                .filter(contact_id=contact_id, fetched_at__gte=start, fetched_at__lt=end)
+                .order_by('fetched_at')
+                .values_list('fetched_at', 'rssi', 'snr', 'battery_percent', 'battery_mv')[: self.RAW_LIMIT]
+            )
+            out['ts'] = [int(r[0].timestamp()) for r in rows]
+            out['rssi'] = [r[1] for r in rows]
+            out['snr'] = [r[2] for r in rows]
+            out['battery'] = [r[3] for r in rows]
+            out['battery_mv'] = [r[4] for r in rows]
+            out['truncated'] = len(rows) >= self.RAW_LIMIT
+            return out
+
+        series = telemetry_series(contact_id, start, end, bucket)
+
+        def avg(acc, m):
+            n = acc[f'{m}_count']
+            return round(acc[f'{m}_sum'] / n, 2) if n else None
+
+        out['ts'] = [int(ts.timestamp()) for ts, _ in series]
+        out['count'] = [acc['samples'] for _, acc in series]
+        for m, col in (('rssi', 'rssi'), ('snr', 'snr'), ('battery_percent', 'battery'), ('battery_mv', 'battery_mv')):
+            out[col] = [avg(acc, m) for _, acc in series]
+            out[f'{col}_min'] = [acc[f'{m}_min'] for _, acc in series]
+            out[f'{col}_max'] = [acc[f'{m}_max'] for _, acc in series]
+        return out
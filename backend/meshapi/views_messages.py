@@ -1,14 +1,32 @@
+import heapq
+from datetime import datetime, timedelta, timezone as dt_timezone
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.utils import timezone
-from django.db.models import Q
+from django.db.models import Min, Q
 
+from .airtime import AirtimeDeferred
+from .dispatch import PRIORITY_INTERACTIVE, command_priority
 from .models import Message
 from .models import Contact
 from .services import send_chat_message
+from .stream import SETTLE_S, message_item
+from .versioning import KEY_MESSAGES, versioned_response
 
 
 class MessagesListView(APIView):
+    """Messages of one conversation (or all), newest first, keyset-paginated.
+
+    - no cursor: the newest `limit` rows
+    - `before=<cursor>`: the page older than a previous `next_before`
+    - `after_id=<id>`: rows inserted after that id, oldest first (delta polling);
+      it stops before rows written less than ``STREAM_SETTLE_MS`` ago, which a
+      later poll returns, so rows committed out of id order are not skipped
+
+    With both `public_key` and `name` the two matches are read as separate
+    index-ordered branches and merged, instead of one OR filter.
+    """
     authentication_classes = []
     permission_classes = []
 
@@ -19,28 +37,100 @@ class MessagesListView(APIView):
             limit = int(request.query_params.get('limit', '50'))
         except Exception:
             limit = 50
-        qs = Message.objects.all()
+        limit = max(1, min(limit, 500))
+        after_id = request.query_params.get('after_id')
+        before = request.query_params.get('before')
+        if after_id not in (None, ''):
+            try:
+                after_id = int(after_id)
+            except Exception:
+                return Response({'error': 'after_id must be an integer'}, status=400)
+            cutoff = timezone.now() - timedelta(seconds=SETTLE_S)
+            upper = Message.objects.filter(id__gt=after_id, created_at__gte=cutoff).aggregate(m=Min('id'))['m']
+            if upper is not None:
+                # Rows are held back: this answer changes without a version bump, so do not cache it
+                return Response(self._build_after(pk, name, after_id, limit, upper))
+            return versioned_response(request, [KEY_MESSAGES], lambda: self._build_after(pk, name, after_id, limit), stamp=True)
+        cursor = None
+        if before:
+            cursor = _parse_cursor(before)
+            if cursor is None:
+                return Response({'error': 'invalid before cursor'}, status=400)
+        return versioned_response(request, [KEY_MESSAGES], lambda: self._build_page(pk, name, cursor, limit), stamp=True)
+
+    @staticmethod
+    def _branches(pk, name):
         if pk and name:
-            qs = qs.filter(Q(public_key=pk) | Q(name=name))
-        elif pk:
-            qs = qs.filter(public_key=pk)
-        elif name:
-            qs = qs.filter(name=name)
-        qs = qs.order_by('-ts')[: max(1, min(limit, 500))]
-        items = [
-            {
-                'name': m.name,
-                'public_key': m.public_key,
-                'direction': m.direction,
-                'text': m.text,
-                'ts': m.ts,
-                'status': m.status,
-                'client_id': m.client_id,
-                'id': m.id,
-            }
-            for m in qs
-        ]
-        return Response({'fetched_at': timezone.now(), 'items': items})
+            return [Message.objects.filter(public_key=pk), Message.objects.filter(name=name)]
+        if pk:
+            return [Message.objects.filter(public_key=pk)]
+        if name:
+            return [Message.objects.filter(name=name)]
+        return [Message.objects.all()]
+
+    def _build_page(self, pk, name, cursor, limit):
+        rows = []
+        for qs in self._branches(pk, name):
+            if cursor is not None:
+                ts, mid = cursor
+                qs = qs.filter(Q(ts__lt=ts) | Q(ts=ts, id__lt=mid))
+            rows.append(list(qs.order_by('-ts', '-id')[: limit + 1]))
+        page = _merge(rows, key=lambda m: (m.ts, m.id), reverse=True)
+        has_more = len(page) > limit
+        page = page[:limit]
+        return {
+            'fetched_at': timezone.now(),
+            'items': [message_item(m) for m in page],
+            'has_more': has_more,
+            'next_before': _format_cursor(page[-1]) if has_more else None,
+            'last_id': max((m.id for m in page), default=None),
+        }
+
+    def _build_after(self, pk, name, after_id, limit, upper=None):
+        branches = self._branches(pk, name)
+        if upper is not None:
+            branches = [qs.filter(id__lt=upper) for qs in branches]
+        rows = [list(qs.filter(id__gt=after_id).order_by('id')[: limit + 1]) for qs in branches]
+        page = _merge(rows, key=lambda m: m.id)
+        has_more = len(page) > limit
+        page = page[:limit]
+        return {
+            'fetched_at': timezone.now(),
+            'items': [message_item(m) for m in page],
+            'has_more': has_more,
+            'last_id': page[-1].id if page else after_id,
+        }
+
+
+def _merge(branches, key, reverse=False):
+    """Merge already-sorted branches, dropping rows matched by more than one."""
+    if len(branches) == 1:
+        return branches[0]
+    seen = set()
+    out = []
+    for m in heapq.merge(*branches, key=key, reverse=reverse):
+        if m.id in seen:
+            continue
+        seen.add(m.id)
+        out.append(m)
+    return out
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _format_cursor(m):
+    """Opaque `<epoch microseconds>:<id>` position of a message."""
+    delta = m.ts - _EPOCH
+    return f"{(delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds}:{m.id}"
+
+
+def _parse_cursor(raw):
+    try:
+        us, mid = str(raw).split(':', 1)
+        return _EPOCH + timedelta(microseconds=int(us)), int(mid)
+    except Exception:
+        return None
 
 
 class MessageSendView(APIView):
@@ -69,9 +159,14 @@ class MessageSendView(APIView):
             return Response({'error': 'text required'}, status=400)
 
         try:
-            status = send_chat_message(name=name, text=str(text), client_id=client_id)
+            # A user is waiting on this send; run it ahead of refreshes and polling
+            with command_priority(PRIORITY_INTERACTIVE):
+                status = send_chat_message(name=name, text=str(text), client_id=client_id)
         except ValueError as e:
             return Response({'error': str(e)}, status=400)
+        except AirtimeDeferred as e:
+            retry = max(1, int(e.retry_after_s + 0.999))
+            return Response({'error': str(e), 'retry_after': retry}, status=429, headers={'Retry-After': str(retry)})
         except Exception as e:
             return Response({'error': f'failed to send: {e}'}, status=500)
 
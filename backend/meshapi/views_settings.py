@@ -3,6 +3,8 @@ from rest_framework.views import APIView
 from rest_framework import status
 
 from .models import CollectorConfig, MQTTConfig
+from .mqtt_export import export_status
+from .mqtt_publisher import get_mqtt_publisher
 
 import socket
 import threading
@@ -229,3 +231,21 @@ class MQTTTestView(APIView):
             except Exception:
                 pass
             socket.setdefaulttimeout(prev_timeout)
+
+
+class MQTTStatusView(APIView):
+    """Connection, queue and throughput of this process's persistent MQTT publisher."""
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request):
+        return Response(get_mqtt_publisher().status())
+
+
+class MQTTExportStatusView(APIView):
+    """High-water marks, backlog and lag of the MQTT export streams."""
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request):
+        return Response(export_status())
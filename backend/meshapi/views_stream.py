@@ -0,0 +1,25 @@
+from django.http import StreamingHttpResponse
+from django.views import View
+
+from .stream import event_stream
+
+
+class StreamView(View):
+    """Server-Sent Events feed of messages, telemetry, node and connection changes.
+
+    A plain Django view: DRF content negotiation would reject
+    ``Accept: text/event-stream``. Resume with the ``Last-Event-ID`` header
+    (sent automatically by EventSource) or ``?last_event_id=``.
+    """
+
+    def get(self, request):
+        raw = request.META.get("HTTP_LAST_EVENT_ID") or request.GET.get("last_event_id")
+        try:
+            last_id = int(raw) if raw not in (None, "") else None
+        except (TypeError, ValueError):
+            last_id = None
+        resp = StreamingHttpResponse(event_stream(last_id), content_type="text/event-stream")
+        resp["Cache-Control"] = "no-cache"
+        # Tell nginx not to buffer the stream
+        resp["X-Accel-Buffering"] = "no"
+        return resp
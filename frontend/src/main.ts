@@ -5,6 +5,7 @@ import App from './App.vue'
 import './styles.css'
 import { useNodeStore } from './stores/node'
 import { useConnectionStore } from './stores/connection'
+import { startStream } from './stream'
 
 const app = createApp(App)
 const pinia = createPinia()
@@ -19,4 +20,7 @@ nodeStore.startAutoRefresh()
 const connStore = useConnectionStore(pinia)
 connStore.startAuto()
 
+// Push updates; the polling above stays as a fallback
+startStream()
+
 app.mount('#app')
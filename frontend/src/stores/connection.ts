@@ -1,6 +1,7 @@
 import { defineStore } from 'pinia'
 import { ref } from 'vue'
 import axios from 'axios'
+import { onStreamEvent, streamOpen } from '../stream'
 
 export const useConnectionStore = defineStore('connection', () => {
   const connected = ref<boolean | null>(null)
@@ -9,6 +10,13 @@ export const useConnectionStore = defineStore('connection', () => {
   const lastError = ref<string | null>(null)
   const statusTimer = ref<number | null>(null)
   const retryTimer = ref<number | null>(null)
+  let statusTicks = 0
+
+  // Session start/death is pushed by the stream
+  onStreamEvent('connection', (data) => {
+    connected.value = !!data?.connected
+    if (connected.value) lastError.value = null
+  })
 
   async function checkStatus() {
     checking.value = true
@@ -63,8 +71,11 @@ export const useConnectionStore = defineStore('connection', () => {
     // Initial status check
     checkStatus()
 
-    // Periodic status polling
+    // Periodic status polling; while the stream is open only every 4th tick
+    // (a crashed broker cannot announce itself)
     statusTimer.value = window.setInterval(() => {
+      statusTicks++
+      if (streamOpen.value && statusTicks % 4 !== 0) return
       checkStatus()
     }, Number.isFinite(pollMs) && pollMs > 0 ? pollMs : 15_000)
 
@@ -1,6 +1,7 @@
 import { defineStore } from 'pinia'
 import { ref } from 'vue'
 import axios from 'axios'
+import { onStreamEvent } from '../stream'
 
 export type NodeApiResponse = {
   name: string
@@ -14,6 +15,10 @@ export const useNodeStore = defineStore('node', () => {
   const intervalId = ref<number | null>(null)
   const error = ref<string | null>(null)
 
+  // Refetch as soon as the backend stored a new node snapshot
+  onStreamEvent('node', () => { fetchNode(false).catch(() => {}) })
+  onStreamEvent('reset', () => { fetchNode(false).catch(() => {}) })
+
   async function fetchNode(force = false) {
     loading.value = true
     error.value = null
@@ -0,0 +1,75 @@
+import { ref } from 'vue'
+
+// Server-Sent Events client for /api/v1/stream/.
+// One shared EventSource; views and stores subscribe per event kind.
+
+type Handler = (data: any) => void
+
+const KINDS = ['message', 'telemetry', 'node', 'connection', 'reset']
+
+export const streamOpen = ref(false)
+
+const handlers: Record<string, Set<Handler>> = {}
+let es: EventSource | null = null
+let lastEventId: string | null = null
+let retryTimer: number | null = null
+
+function dispatch(kind: string, ev: MessageEvent) {
+  if (ev.lastEventId) lastEventId = ev.lastEventId
+  let data: any = null
+  try { data = JSON.parse(ev.data) } catch { return }
+  for (const h of handlers[kind] || []) {
+    try { h(data) } catch (e) {
+      // eslint-disable-next-line no-console
+      console.warn(`stream handler for '${kind}' failed`, e)
+    }
+  }
+}
+
+function open() {
+  if (retryTimer) {
+    window.clearTimeout(retryTimer)
+    retryTimer = null
+  }
+  const url = lastEventId ? `/api/v1/stream/?last_event_id=${encodeURIComponent(lastEventId)}` : '/api/v1/stream/'
+  es = new EventSource(url)
+  es.onopen = () => { streamOpen.value = true }
+  es.onerror = () => {
+    // EventSource retries on its own (sending Last-Event-ID); only a hard
+    // failure (non-SSE response) closes it, then we retry later ourselves.
+    if (es && es.readyState === EventSource.CLOSED) {
+      streamOpen.value = false
+      es = null
+      retryTimer = window.setTimeout(open, 15_000)
+    } else {
+      streamOpen.value = false
+    }
+  }
+  for (const kind of KINDS) {
+    es.addEventListener(kind, (ev) => dispatch(kind, ev as MessageEvent))
+  }
+}
+
+export function startStream() {
+  if (es || retryTimer || typeof EventSource === 'undefined') return
+  open()
+}
+
+export function stopStream() {
+  if (retryTimer) {
+    window.clearTimeout(retryTimer)
+    retryTimer = null
+  }
+  if (es) {
+    es.close()
+    es = null
+  }
+  streamOpen.value = false
+}
+
+// Subscribe to one event kind; returns an unsubscribe function
+export function onStreamEvent(kind: string, handler: Handler): () => void {
+  if (!handlers[kind]) handlers[kind] = new Set()
+  handlers[kind].add(handler)
+  return () => { handlers[kind]?.delete(handler) }
+}